@@ -8,24 +8,30 @@ import pandas as pd
 import plotly.express as px
 import streamlit as st
 
-from mtm_guarantee.config import DEFAULT_CURRENCIES, DEFAULT_SCENARIO
+from mtm_guarantee import pipeline
+from mtm_guarantee.backtest import BACKTEST_WINDOW, capital_backtest
+from mtm_guarantee.breakeven import BREAKEVEN_INPUTS, BREAKEVEN_METRICS, BreakevenSolver
+from mtm_guarantee.cache import ResultCache
+from mtm_guarantee.config import DEFAULT_CURRENCIES, DEFAULT_SCENARIO, MARKET_CACHE_DIR, RESULT_STORE_DIR
 from mtm_guarantee.io.excel_loader import ExcelMappingError, load_market_data
+from mtm_guarantee.io.result_store import ResultStore
+from mtm_guarantee.credit.obligors import CREDIT_MODELS
+from mtm_guarantee.instruments.exposure import EXPOSURE_INSTRUMENTS
 from mtm_guarantee.io.validation import validate_weights
-from mtm_guarantee.market.fx import apply_quote_convention, monthly_returns
-from mtm_guarantee.market.rates import get_rate_differential
-from mtm_guarantee.market.simulation import simulate_fx_paths
-from mtm_guarantee.instruments.mtm_proxy import mtm_phase0, mtm_phase1, blend_ccs_ndf
-from mtm_guarantee.credit.default_model import default_time_from_pd
-from mtm_guarantee.guarantee.contract import GuaranteeContract
-from mtm_guarantee.guarantee.payout import payout_distribution
-from mtm_guarantee.capital.loss_dist import exceedance_curve, var_es
-from mtm_guarantee.capital.rating_capital import required_capital
+from mtm_guarantee.jobs import JobRunner
+from mtm_guarantee.market.fx import MarketData
+from mtm_guarantee.market.simulation import BOOTSTRAP_MODES, BOOTSTRAP_VARIANCE_REDUCTION, PRECISIONS, SIMULATION_MODES
+from mtm_guarantee.profiling import Profiler, span, use_profiler
+from mtm_guarantee.sampling import VARIANCE_REDUCTION
 from mtm_guarantee.capital.returns import waterfall
-from mtm_guarantee.capital.liquidity import liquidity_buffer
-from mtm_guarantee.reporting.charts import leverage_roe_curve, loss_exceedance, waterfall_chart
+from mtm_guarantee.capital.stack import optimise_stack, pareto_frontier
+from mtm_guarantee.sensitivity import GRID_INPUTS, GRID_METRICS, METRIC_INPUTS, sensitivity_grid
+from mtm_guarantee.reporting.charts import capital_backtest_chart, exposure_profile_chart, leverage_roe_curve, loss_exceedance, pareto_frontier_chart, waterfall_chart
 from mtm_guarantee.reporting.tables import scenario_summary_table
 from mtm_guarantee.reporting.tearsheet import write_tearsheet
 
+SYNC_WAIT_SECONDS = 3.0  # small runs finish inline; larger ones report progress from the background job
+
 
 def parse_args():
     p = argparse.ArgumentParser()
@@ -35,56 +41,95 @@ def parse_args():
 
 @st.cache_data
 def get_data(path: str, currencies: list[str]):
-    return load_market_data(path, currencies)
+    return load_market_data(path, currencies, cache_dir=MARKET_CACHE_DIR)
+
+
+@st.cache_resource
+def get_market(path: str, currencies: list[str]):
+    # pivoted once per workbook/selection; inversion toggles reuse it through MarketData.with_inversions
+    fx, rates, missing = get_data(path, currencies)
+    return MarketData.from_long(fx), rates, missing
+
+
+@st.cache_resource
+def get_result_cache():
+    return ResultCache()
+
+
+@st.cache_resource
+def get_result_store():
+    # on disk, shared by every session and dashboard replica pointed at the same directory
+    return ResultStore(RESULT_STORE_DIR)
+
+
+@st.cache_resource
+def get_job_runner():
+    return JobRunner(get_result_cache(), store=get_result_store())
 
 
-@st.cache_data
 def run_model(fx, rates, weights, inputs):
-    fxr = monthly_returns(fx)
-    s0 = fx.pivot(index="date", columns="currency", values="fx_norm").sort_index().iloc[-1]
-    paths = simulate_fx_paths(
-        fxr[s0.index], s0, inputs["tenor_years"], int(inputs["paths"]), mode=inputs["simulation_mode"], corr_stress=inputs["corr_stress"]
-    )
-    n_paths, months, n_ccy = paths.shape
-    dt = default_time_from_pd(inputs["pd_annual"], inputs["tenor_years"], n_paths)
-    default_flags = (~np.isnan(dt)).astype(float)
-    idx = np.minimum(np.nan_to_num(dt, nan=inputs["tenor_years"]) * 12, months - 1).astype(int)
-
-    weighted_mtm = np.zeros(n_paths)
-    contrib = {c: np.zeros(n_paths) for c in s0.index}
-    for j, c in enumerate(s0.index):
-        st_at = paths[np.arange(n_paths), idx, j]
-        base0 = mtm_phase0(inputs["portfolio_notional"] * weights[c], s0.iloc[j], st_at)
-        if inputs["mtm_phase"] == "phase1":
-            carry = get_rate_differential(rates, c)
-            ccs = mtm_phase1(inputs["portfolio_notional"] * weights[c], s0.iloc[j], st_at, np.full_like(st_at, carry), dt.clip(min=0, max=inputs["tenor_years"]))
-            ndf = mtm_phase1(inputs["portfolio_notional"] * weights[c], s0.iloc[j], st_at, np.full_like(st_at, carry * 0.5), dt.clip(min=0, max=inputs["tenor_years"]))
-            mtm = blend_ccs_ndf(ccs, ndf, inputs["ccs_weight"])
-        else:
-            mtm = base0
-        contrib[c] = mtm
-        weighted_mtm += mtm
-
-    contract = GuaranteeContract(
-        coverage_pct=inputs["coverage_pct"], attachment=inputs["attachment"], detachment=inputs["detachment"], limit_pct=inputs["limit_pct"], mode=inputs["default_mode"]
-    )
-    losses = payout_distribution(weighted_mtm, default_flags, inputs["portfolio_notional"], contract)
-    el, var, es = var_es(losses, inputs["capital_confidence"])
-    cap = required_capital(var, es, inputs["capital_method"], inputs["overlay_pct"])
-    max_lev = inputs["portfolio_notional"] / cap if cap > 0 else np.inf
-    xs, ys = exceedance_curve(losses)
-    tail_cut = np.quantile(losses, inputs["capital_confidence"])
-    tail = losses >= tail_cut
-    tail_contrib = {k: float(v[tail].mean() if tail.any() else 0.0) for k, v in contrib.items()}
-
-    monthly_claims = np.repeat(losses / max(inputs["tenor_years"] * 12, 1), inputs["tenor_years"] * 12)
-    liq = liquidity_buffer(monthly_claims, inputs["liq_floor_pct"], inputs["portfolio_notional"])
-
-    return {"losses": losses, "el": el, "var": var, "es": es, "cap": cap, "max_lev": max_lev, "xs": xs, "ys": ys, "tail_contrib": tail_contrib, "liq": liq}
+    return pipeline.run_model(fx, rates, weights, inputs, cache=get_result_cache(), store=get_result_store(), greeks=True)
+
+
+@st.fragment(run_every=1.0)
+def simulation_progress(job):
+    # polls the background job; a full rerun picks the stage up from the result cache once it finishes
+    if job.state not in ("queued", "running"):
+        st.rerun()
+    p = job.partial
+    st.progress(job.fraction, text=f"Simulating {p.paths if p else 0:,} / {job.total_paths:,} paths")
+    if p is not None:
+        a, b = st.columns(2)
+        a.metric("EL (partial)", f"${p.el:,.0f}", help=f"95% CI ${p.el_ci[0]:,.0f} – ${p.el_ci[1]:,.0f}")
+        b.metric("ES (partial)", f"${p.es:,.0f}", help=f"95% CI ${p.es_ci[0]:,.0f} – ${p.es_ci[1]:,.0f}")
+        st.caption(f"95% CI: EL ${p.el_ci[0]:,.0f} – ${p.el_ci[1]:,.0f}, ES ${p.es_ci[0]:,.0f} – ${p.es_ci[1]:,.0f}")
+    if st.button("Cancel run"):
+        job.cancel()
+        st.rerun()
+
+
+@st.cache_data
+def get_exposure_profile(market_key, _fx, rates, weights, inputs, instrument):
+    return pipeline.exposure_from_inputs(_fx, rates, weights, inputs, instrument).to_frame()
+
+
+@st.cache_data
+def get_marginal_allocation(stage_key, capital_inputs, _losses):
+    # per (stage, contract and capital inputs); the losses follow from those two
+    stage = pipeline.lookup_stage(stage_key, get_result_cache(), get_result_store())
+    return pipeline.marginal_allocation(stage, capital_inputs, _losses)
+
+
+@st.cache_data
+def get_stack_optimum(stage_key, capital_inputs, fees, senior_fee_bps, senior_cap_factor, min_icr, senior_above_es, max_mezz_pd, _losses, _weights):
+    # the losses and path weights follow from the stage and the contract / capital inputs
+    return optimise_stack(_losses, capital_inputs["portfolio_notional"], *fees, senior_fee_bps, senior_cap_factor, capital_inputs["capital_confidence"], min_icr, senior_above_es, max_mezz_pd, weights=_weights)
+
+
+@st.cache_data
+def get_sensitivity_grid(market_key, _fx, rates, weights, inputs, pd_grid, vol_grid):
+    return sensitivity_grid(_fx, rates, weights, inputs, pd_grid, vol_grid)
+
+
+@st.cache_data
+def get_capital_backtest(market_key, _fx, rates, weights, inputs, window):
+    return capital_backtest(_fx, rates, weights, inputs, window)
+
+
+@st.cache_data
+def get_breakeven(stage_key, metric_inputs, _fx, _rates, _weights, _inputs, name, metric, target, bracket):
+    # the stage key covers market data, weights and market inputs; metric_inputs the contract and capital measure
+    return BreakevenSolver(_fx, _rates, _weights, _inputs, get_result_cache()).solve(name, metric, target, bracket)
 
 
 def main():
-    args = parse_args()
+    # one profiler per session: Streamlit runs sessions as threads of one process
+    profiler = st.session_state.setdefault("profiler", Profiler())
+    with use_profiler(profiler):
+        dashboard(parse_args(), profiler)
+
+
+def dashboard(args: argparse.Namespace, profiler: Profiler):
     st.set_page_config(page_title="MTM Guarantee Dashboard", layout="wide")
     st.title("EM FX MTM Guarantee Dashboard")
 
@@ -92,16 +137,30 @@ def main():
         st.header("Global Settings")
         selected = st.multiselect("Currencies", DEFAULT_CURRENCIES, default=DEFAULT_CURRENCIES)
         fast = st.toggle("Fast mode (2k paths)", value=False)
-        sim_mode = st.selectbox("Simulation", ["historical", "parametric"])
-        corr_stress = st.slider("Correlation stress", 0.5, 1.5, 1.0)
+        sim_mode = st.selectbox("Simulation", list(SIMULATION_MODES))
+        block_length = DEFAULT_SCENARIO["block_length"]
+        if sim_mode in BOOTSTRAP_MODES:
+            block_length = st.slider("Block length (months)", 1.0, 24.0, block_length, 1.0, help="Fixed block length, or mean block length for the stationary bootstrap")
+        variance_reduction = st.selectbox("Variance reduction", list(BOOTSTRAP_VARIANCE_REDUCTION if sim_mode in BOOTSTRAP_MODES else VARIANCE_REDUCTION))
+        precision = st.selectbox("Precision", list(PRECISIONS), help="float32 halves path and loss memory; VaR/ES stay within Monte Carlo error")
+        corr_stress = st.slider("Correlation stress", 0.5, 1.5, 1.0, help="Scales pairwise correlations in parametric mode")
+        seed = st.number_input("Master seed", min_value=0, value=DEFAULT_SCENARIO["seed"], step=1, help="Every random stream is derived from this seed")
+        profile = st.toggle("Profile run", value=False, help="Record wall/CPU time, peak allocations and array sizes per stage")
         run = st.button("Run simulation", type="primary")
 
+    if profile:
+        profiler.enable(memory=True)
+        profiler.reset()
+    else:
+        profiler.disable()
+
     if not selected:
         st.warning("Select at least one currency.")
         return
 
     try:
-        fx, rates, missing = get_data(args.excel, selected)
+        with span("get_market"):
+            market, rates, missing = get_market(args.excel, selected)
     except (FileNotFoundError, ExcelMappingError) as e:
         st.error(str(e))
         return
@@ -110,7 +169,7 @@ def main():
         st.warning(f"Missing currencies in workbook: {missing}")
 
     inv = {c: st.sidebar.checkbox(f"Invert quote {c}", value=False) for c in selected}
-    fx = apply_quote_convention(fx, inv)
+    fx = market.with_inversions(inv)
 
     st.subheader("Portfolio Builder")
     wdf = pd.DataFrame({"currency": selected, "weight": [1 / len(selected)] * len(selected)}).set_index("currency")
@@ -128,7 +187,13 @@ def main():
         "tenor_years": tenor,
         "paths": DEFAULT_SCENARIO["fast_paths"] if fast else DEFAULT_SCENARIO["paths"],
         "simulation_mode": sim_mode,
+        "block_length": block_length,
+        "precision": precision,
         "corr_stress": corr_stress,
+        "variance_reduction": variance_reduction,
+        "is_pd_tilt": DEFAULT_SCENARIO["is_pd_tilt"],
+        "is_fx_tilt": DEFAULT_SCENARIO["is_fx_tilt"],
+        "seed": int(seed),
         "pd_annual": st.slider("PD annual", 0.0, 0.2, DEFAULT_SCENARIO["pd_annual"]),
         "lgd": st.slider("LGD", 0.0, 1.0, DEFAULT_SCENARIO["lgd"]),
         "coverage_pct": st.slider("Coverage", 0.0, 1.0, DEFAULT_SCENARIO["coverage_pct"]),
@@ -138,6 +203,14 @@ def main():
         "default_mode": st.selectbox("Payout mode", ["default_triggered", "full_mtm"]),
         "mtm_phase": st.selectbox("MTM engine", ["phase0", "phase1"]),
         "ccs_weight": ccs_weight,
+        "credit_model": st.selectbox("Credit model", list(CREDIT_MODELS), help="single: one portfolio default time; obligor: Gaussian-copula defaults per counterparty"),
+        "n_obligors": st.number_input("Obligors", 1, 2000, DEFAULT_SCENARIO["n_obligors"]),
+        "obligor_book": st.text_input(
+            "Obligor book (CSV / Excel path)", DEFAULT_SCENARIO["obligor_book"], help="Columns obligor, currency, notional, pd, lgd; overrides Obligors, PD and LGD in the obligor model"
+        ).strip(),
+        "copula_rho": st.slider("Copula global correlation", 0.0, 0.9, DEFAULT_SCENARIO["copula_rho"]),
+        "copula_rho_ccy": st.slider("Copula currency correlation", 0.0, 0.5, DEFAULT_SCENARIO["copula_rho_ccy"]),
+        "wrong_way": st.slider("Wrong-way dependence", -1.0, 1.0, DEFAULT_SCENARIO["wrong_way"], help="Monthly hazard multiplier exp(w x adverse FX move to date, in sd)"),
         "capital_method": st.selectbox("Capital method", ["ES", "VaR"]),
         "capital_confidence": st.selectbox("Confidence", [0.99, 0.995], index=1),
         "overlay_pct": st.slider("Overlay %", 0.0, 1.0, DEFAULT_SCENARIO["overlay_pct"]),
@@ -148,8 +221,23 @@ def main():
         "liq_floor_pct": st.slider("Liquidity floor %", 0.0, 0.2, 0.02),
     }
 
+    # market inputs run as a background job; contract inputs stay editable and reprice the cached stage
+    runner = get_job_runner()
+    key = pipeline.market_credit_key(fx, rates, weights, inputs)
     if run:
-        res = run_model(fx, rates, weights, inputs)
+        runner.submit(fx, rates, weights, inputs).wait(SYNC_WAIT_SECONDS)
+    job = runner.get(key)
+    if pipeline.lookup_stage(key, get_result_cache(), get_result_store()) is None:
+        if job is not None and job.state in ("queued", "running"):
+            simulation_progress(job)
+        elif job is not None and job.state == "failed":
+            st.error(str(job.error))
+        elif job is not None and job.state == "cancelled":
+            st.info("Simulation cancelled.")
+        return
+
+    res = run_model(fx, rates, weights, inputs)
+    with span("report:risk"):
         st.subheader("Risk & Capital")
         a, b, c, d = st.columns(4)
         a.metric("EL", f"${res['el']:,.0f}")
@@ -157,9 +245,33 @@ def main():
         c.metric("ES", f"${res['es']:,.0f}")
         d.metric("Required Capital", f"${res['cap']:,.0f}")
         st.metric("Max leverage", f"{res['max_lev']:.2f}x")
+        se = res["se"]
+        st.caption(f"Standard errors ({variance_reduction}): EL ±${se['el']:,.0f}, VaR ±${se['var']:,.0f}, ES ±${se['es']:,.0f}")
         st.plotly_chart(loss_exceedance(res["xs"], res["ys"]), use_container_width=True)
-        st.plotly_chart(px.bar(x=list(res["tail_contrib"].keys()), y=list(res["tail_contrib"].values()), labels={"x": "Currency", "y": "Tail contribution"}), use_container_width=True)
+        st.plotly_chart(px.bar(x=list(res["tail_contrib"].keys()), y=list(res["tail_contrib"].values()), labels={"x": "Currency", "y": "Euler ES contribution"}), use_container_width=True)
+        allocation, obligors = res["allocation"], res["obligor_allocation"]
+        if st.checkbox("Marginal capital", help="Capital with and without each currency / obligor: one repricing per component"):
+            currency, obligor = get_marginal_allocation(key, {k: inputs[k] for k in pipeline.CAPITAL_INPUTS}, res["losses"])
+            allocation = allocation.assign(marginal_capital=currency)
+            obligors = None if obligors is None else obligors.assign(marginal_capital=obligor)
+        st.dataframe(allocation, use_container_width=True)
+        if obligors is not None:
+            st.caption("Largest obligor capital contributions")
+            st.dataframe(obligors.nlargest(20, "euler_capital"), use_container_width=True)
+        with st.expander("Capital sensitivities"):
+            st.caption("Change per unit of each input: pathwise for weights and contract terms, likelihood ratio for PD.")
+            st.dataframe(res["greeks"], use_container_width=True)
+
+    with span("report:exposure"):
+        st.subheader("Exposure Profile")
+        e1, e2 = st.columns(2)
+        instrument = e1.selectbox("Exposure instrument", list(EXPOSURE_INSTRUMENTS))
+        # market inputs only: contract edits reuse the cached profile
+        exposure = get_exposure_profile(fx.fingerprint, fx, rates, weights, {k: inputs[k] for k in pipeline.MARKET_INPUTS}, instrument)
+        exposure_ccy = e2.selectbox("Exposure currency", ["total"] + fx.currencies)
+        st.plotly_chart(exposure_profile_chart(exposure, exposure_ccy), use_container_width=True)
 
+    with span("report:investor_returns"):
         st.subheader("Investor Returns")
         mezz_pct = st.slider("Mezz %", 0.0, 0.5, 0.15)
         mezz_coupon = st.slider("Mezz coupon", 0.0, 0.2, 0.08)
@@ -171,23 +283,87 @@ def main():
         st.plotly_chart(waterfall_chart(wf), use_container_width=True)
         st.plotly_chart(leverage_roe_curve(np.linspace(5, 20, 40), (inputs["client_fee_bps"] - inputs["opex_bps"] - inputs["reserve_bps"]) / 1e4, res["el"] / notional, inputs["target_leverage"]), use_container_width=True)
         st.write({"Equity ROE": wf["equity_roe"], "Mezz ICR": wf["mezz_icr"], "Senior implied ROE": wf["implied_senior_roe"]})
+        with st.expander("Capital-stack optimiser"):
+            o1, o2, o3 = st.columns(3)
+            min_icr = o1.number_input("Min mezz ICR", value=1.5)
+            max_mezz_pd = o2.slider("Max P(mezz loss)", 0.0, 1.0, 1.0)
+            senior_above_es = o3.checkbox("Senior attaches above ES", value=True)
+            if st.checkbox("Run optimiser"):
+                fees = (inputs["client_fee_bps"], inputs["opex_bps"], inputs["reserve_bps"])
+                capital_inputs = {k: inputs[k] for k in pipeline.CAPITAL_INPUTS}
+                best, table = get_stack_optimum(
+                    key, capital_inputs, fees, senior_fee_bps, senior_cap_factor, min_icr, senior_above_es, max_mezz_pd, res["losses"], res["path_weights"]
+                )
+                if best is None:
+                    st.warning(f"No feasible structure among {len(table):,} candidates.")
+                else:
+                    st.write(best.drop("feasible").to_dict())
+                    st.plotly_chart(pareto_frontier_chart(table, pareto_frontier(table)), use_container_width=True)
 
+    with span("report:sensitivities"):
         st.subheader("Scenarios & Sensitivities")
         pd_grid = np.linspace(0.01, 0.1, 8)
         vol_grid = np.linspace(0.8, 1.4, 8)
-        heat = np.array([[inputs["target_leverage"] * ((inputs["client_fee_bps"] - inputs["opex_bps"] - inputs["reserve_bps"]) / 1e4 - p * v * 0.2) for v in vol_grid] for p in pd_grid])
-        st.plotly_chart(px.imshow(heat, x=np.round(vol_grid, 2), y=np.round(pd_grid, 3), labels={"x": "Vol multiplier", "y": "PD", "color": "Equity ROE proxy"}), use_container_width=True)
+        heat_metric = st.selectbox("Grid metric", list(GRID_METRICS), index=GRID_METRICS.index("equity_roe"))
+        if inputs["credit_model"] != "single":
+            st.caption("The PD x vol grid re-simulates the single-obligor model.")
+        if st.checkbox("Run PD x vol grid"):
+            grid_inputs = {k: inputs[k] for k in GRID_INPUTS}
+            heat = get_sensitivity_grid(fx.fingerprint, fx, rates, weights, grid_inputs, pd_grid, vol_grid)[heat_metric]
+            st.plotly_chart(px.imshow(heat, x=np.round(vol_grid, 2), y=np.round(pd_grid, 3), labels={"x": "Vol multiplier", "y": "PD", "color": heat_metric}), use_container_width=True)
+
+        with st.expander("Reverse stress test"):
+            r1, r2, r3 = st.columns(3)
+            be_input = r1.selectbox("Stressed input", [n for n in BREAKEVEN_INPUTS if n != "corr_stress" or sim_mode == "parametric"])
+            be_metric = r2.selectbox("Metric", list(BREAKEVEN_METRICS), index=BREAKEVEN_METRICS.index("cap"))
+            be_target = r3.number_input("Target", value=float(equity_capital), help="Defaults to equity at the target leverage")
+            r4, r5 = st.columns(2)
+            base = float(inputs.get(be_input, 1.0))
+            lo = r4.number_input("Bracket low", value=base * 0.1 if base else 0.0, format="%.4f")
+            hi = r5.number_input("Bracket high", value=base * 4 if base else 1.0, format="%.4f")
+            if st.checkbox("Solve breakeven"):
+                metric_inputs = {k: inputs[k] for k in pipeline.CAPITAL_INPUTS + METRIC_INPUTS}
+                try:
+                    hit = get_breakeven(key, metric_inputs, fx, rates, weights, inputs, be_input, be_metric, be_target, (lo, hi))
+                except ValueError as e:
+                    st.info(str(e))
+                else:
+                    st.metric(f"Breakeven {be_input}", f"{hit.value:.4g}", help=f"{be_metric} = {hit.metric_value:,.0f} after {len(hit.evaluations)} evaluations")
+                    st.dataframe(hit.evaluations, use_container_width=True)
+
+        with st.expander("Capital backtest"):
+            n_months = len(fx.returns)
+            if n_months <= 12:
+                st.info("More than 12 months of returns are needed for a backtest.")
+            else:
+                window = st.slider("Window (months)", 12, n_months, min(BACKTEST_WINDOW, n_months))
+                st.caption("Parametric capital at each past month-end from the trailing window, re-colouring one set of draws.")
+                if st.checkbox("Run backtest"):
+                    history = get_capital_backtest(fx.fingerprint, fx, rates, weights, inputs, window)
+                    st.plotly_chart(capital_backtest_chart(history), use_container_width=True)
+                    st.dataframe(history, use_container_width=True)
 
+    with span("report:liquidity"):
         st.subheader("Liquidity")
         st.write(res["liq"])
-        st.plotly_chart(px.histogram(x=np.repeat(res["losses"] / (tenor * 12), tenor * 12), nbins=40, labels={"x": "Monthly cash call"}), use_container_width=True)
+        st.plotly_chart(px.bar(x=np.arange(1, len(res["cash_calls"]) + 1), y=res["cash_calls"], labels={"x": "Month", "y": "Expected cash call"}), use_container_width=True)
 
+    with span("report:summary"):
         summary = scenario_summary_table(inputs)
         st.dataframe(summary, use_container_width=True)
         st.download_button("Download scenario CSV", summary.to_csv(index=False).encode("utf-8"), file_name="scenario_outputs.csv")
 
-        out_path = write_tearsheet("outputs/tear_sheet.md", "MTM Guarantee Tear Sheet", {"EL": res["el"], "ES": res["es"], "Capital": res["cap"], "MaxLeverage": res["max_lev"]}, summary.to_markdown(index=False))
+    # written on an explicit action only, never from the reruns that widget edits and job polling trigger
+    if st.button("Save tear sheet") or run:
+        sections = {"Performance": profiler.to_markdown()} if profile else None
+        out_path = write_tearsheet("outputs/tear_sheet.md", "MTM Guarantee Tear Sheet", {"EL": res["el"], "ES": res["es"], "Capital": res["cap"], "MaxLeverage": res["max_lev"]}, summary.to_markdown(index=False), sections)
         st.success(f"Tear sheet saved to {out_path}")
+    if profile:
+        with st.expander("Performance"):
+            st.dataframe(profiler.to_frame(), use_container_width=True)
+            p1, p2 = st.columns(2)
+            p1.download_button("Download spans (JSON)", profiler.to_json(), file_name="profile.json")
+            p2.download_button("Download Chrome trace", profiler.to_chrome_trace(), file_name="profile_trace.json", help="Open in chrome://tracing or ui.perfetto.dev")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from functools import cached_property
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from mtm_guarantee import pipeline
+from mtm_guarantee.capital.liquidity import liquidity_buffer
+from mtm_guarantee.capital.loss_dist import exceedance_curve, var_es
+from mtm_guarantee.config import DEFAULT_SCENARIO
+from mtm_guarantee.credit.default_model import default_month, default_time_from_uniforms, default_uniforms, evaluation_time
+from mtm_guarantee.guarantee.payout import payout_distribution
+from mtm_guarantee.instruments.mtm_proxy import portfolio_mtm
+from mtm_guarantee.io.excel_loader import load_market_data
+from mtm_guarantee.market.fx import MarketData
+from mtm_guarantee.market.rates import rate_differentials
+from mtm_guarantee.market.simulation import simulate_fx_at_months, simulate_fx_paths
+from mtm_guarantee.rng import RngStreams
+
+SIZES = {
+    "tiny": {"paths": 2_000, "n_ccy": 1, "tenor_years": 1},
+    "small": {"paths": 10_000, "n_ccy": 8, "tenor_years": 5},
+    "medium": {"paths": 100_000, "n_ccy": 20, "tenor_years": 5},
+    "large": {"paths": 1_000_000, "n_ccy": 50, "tenor_years": 10},
+}
+HISTORY_MONTHS = 240
+DENSE_PATH_BYTES = 512 * 1024**2  # simulate_fx_paths holds every (path, month, ccy); larger sizes are skipped
+BASELINE = Path(__file__).with_name("baseline.json")
+
+
+@dataclass
+class Fixture:
+    # synthetic market of one size; upstream stage outputs are built once, untimed, for the stages that consume them
+    size: str
+    paths: int
+    n_ccy: int
+    tenor_years: int
+    seed: int = 0
+    workdir: Path = field(default_factory=lambda: Path(tempfile.mkdtemp(prefix="mtm_bench_")))
+
+    @cached_property
+    def currencies(self) -> list[str]:
+        return [f"C{i:02d}" for i in range(self.n_ccy)]
+
+    @cached_property
+    def frames(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        rng = np.random.default_rng(self.seed)
+        dates = pd.date_range("2005-01-31", periods=HISTORY_MONTHS, freq=pd.offsets.MonthEnd())
+        levels = np.exp(np.cumsum(rng.normal(0.003, 0.03, (HISTORY_MONTHS, self.n_ccy)), axis=0)) * np.logspace(0, 4, self.n_ccy)
+        fx = pd.DataFrame({"currency": np.repeat(self.currencies, HISTORY_MONTHS), "date": np.tile(dates, self.n_ccy), "fx": levels.T.ravel()})
+        rates = pd.DataFrame({"Date": dates, "USD": 2.0, **{c: 4.0 + 0.1 * j for j, c in enumerate(self.currencies)}})
+        return fx, rates
+
+    @cached_property
+    def workbook(self) -> str:
+        fx, rates = self.frames
+        path = self.workdir / "market.xlsx"
+        with pd.ExcelWriter(path) as w:
+            fx.rename(columns={"currency": "Currency", "date": "Date"}).to_excel(w, sheet_name="Historical_fx", index=False)
+            rates.to_excel(w, sheet_name="Rates", index=False)
+        return str(path)
+
+    @cached_property
+    def market(self) -> MarketData:
+        return MarketData.from_long(self.frames[0])
+
+    @cached_property
+    def weights(self) -> dict[str, float]:
+        return {c: 1 / self.n_ccy for c in self.currencies}
+
+    @cached_property
+    def inputs(self) -> dict:
+        return dict(DEFAULT_SCENARIO, paths=self.paths, tenor_years=self.tenor_years, corr_stress=1.0, liq_floor_pct=0.02)
+
+    @cached_property
+    def default_times(self) -> np.ndarray:
+        u = default_uniforms(self.paths, streams=RngStreams(self.inputs["seed"]))
+        return default_time_from_uniforms(u, self.inputs["pd_annual"], self.tenor_years)
+
+    @cached_property
+    def month_idx(self) -> np.ndarray:
+        return default_month(self.default_times, self.tenor_years)
+
+    @cached_property
+    def fx_at(self) -> np.ndarray:
+        return simulate_fx_at_months(self.market.returns, self.market.s0, self.tenor_years, self.month_idx, streams=RngStreams(self.inputs["seed"]))[0]
+
+    @cached_property
+    def mtm(self) -> np.ndarray:
+        return stage_mtm(self)
+
+    @cached_property
+    def losses(self) -> np.ndarray:
+        return stage_payout(self)
+
+
+def stage_load(f: Fixture):
+    return load_market_data(f.workbook, f.currencies)
+
+
+def stage_returns(f: Fixture):
+    return MarketData.from_long(f.frames[0]).returns
+
+
+def stage_simulate_fx_paths(f: Fixture):
+    if f.paths * f.tenor_years * 12 * f.n_ccy * 8 > DENSE_PATH_BYTES:
+        return None
+    return simulate_fx_paths(f.market.returns, f.market.s0, f.tenor_years, f.paths)
+
+
+def stage_simulate_fx_at_months(f: Fixture):
+    return simulate_fx_at_months(f.market.returns, f.market.s0, f.tenor_years, f.month_idx, streams=RngStreams(f.inputs["seed"]))
+
+
+def stage_defaults(f: Fixture):
+    u = default_uniforms(f.paths, streams=RngStreams(f.inputs["seed"]))
+    return default_month(default_time_from_uniforms(u, f.inputs["pd_annual"], f.tenor_years), f.tenor_years)
+
+
+def stage_mtm(f: Fixture):
+    inp = f.inputs
+    w = np.array([f.weights[c] for c in f.currencies])
+    carry = rate_differentials(f.frames[1], f.currencies)
+    t_eval = evaluation_time(f.default_times, f.tenor_years)
+    return portfolio_mtm(f.fx_at, f.market.s0.values, inp["portfolio_notional"], w, carry, t_eval, inp["mtm_phase"], inp["ccs_weight"])[1]
+
+
+def stage_payout(f: Fixture):
+    flags = (~np.isnan(f.default_times)).astype(float)
+    return payout_distribution(f.mtm, flags, f.inputs["portfolio_notional"], pipeline.contract_from_inputs(f.inputs))
+
+
+def stage_var_es(f: Fixture):
+    return var_es(f.losses, f.inputs["capital_confidence"])
+
+
+def stage_exceedance_curve(f: Fixture):
+    return exceedance_curve(f.losses)
+
+
+def stage_liquidity(f: Fixture):
+    return liquidity_buffer(f.losses, f.month_idx, f.tenor_years * 12, f.inputs["liq_floor_pct"], f.inputs["portfolio_notional"])
+
+
+def stage_run_model(f: Fixture):
+    return pipeline.run_model(f.market, f.frames[1], f.weights, f.inputs)
+
+
+STAGES: dict[str, Callable[[Fixture], object]] = {
+    "load": stage_load,
+    "returns": stage_returns,
+    "simulate_fx_paths": stage_simulate_fx_paths,
+    "simulate_fx_at_months": stage_simulate_fx_at_months,
+    "defaults": stage_defaults,
+    "mtm": stage_mtm,
+    "payout": stage_payout,
+    "var_es": stage_var_es,
+    "exceedance_curve": stage_exceedance_curve,
+    "liquidity": stage_liquidity,
+    "run_model": stage_run_model,
+}
+
+
+def measure(fn: Callable[[Fixture], object], fixture: Fixture, repeat: int = 3) -> dict[str, float] | None:
+    # one untimed warm-up (builds the fixture inputs), best-of-``repeat`` wall time untraced, then one
+    # tracemalloc pass for the peak of numpy + Python allocations
+    if fn(fixture) is None:
+        return None
+    times = []
+    for _ in range(max(repeat, 1)):
+        t0 = time.perf_counter()
+        fn(fixture)
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    try:
+        fn(fixture)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(times), "peak_mb": peak / 1024**2}
+
+
+def run_suite(sizes: list[str], stages: list[str] | None = None, repeat: int = 3, log: Callable[[str], None] | None = None) -> dict:
+    results = {}
+    for size in sizes:
+        fixture = Fixture(size, **SIZES[size])
+        for stage in stages or list(STAGES):
+            res = measure(STAGES[stage], fixture, repeat)
+            if res is not None:
+                results[f"{size}/{stage}"] = res
+            if log:
+                log(f"{size:>7} {stage:<22} " + ("skipped" if res is None else f"{res['seconds'] * 1e3:10.1f} ms {res['peak_mb']:10.1f} MB"))
+        shutil.rmtree(fixture.workdir, ignore_errors=True)
+    return {"machine": machine_info(), "results": results}
+
+
+def machine_info() -> dict[str, str]:
+    return {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__, "platform": platform.platform(), "processor": platform.processor()}
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.25, min_seconds: float = 0.005, min_mb: float = 1.0) -> list[str]:
+    # regressions: slower or bigger than the baseline by more than ``threshold`` and by more than the noise floors
+    out = []
+    for key, cur in current["results"].items():
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+        for metric, floor in (("seconds", min_seconds), ("peak_mb", min_mb)):
+            if cur[metric] > base[metric] * (1 + threshold) and cur[metric] - base[metric] > floor:
+                out.append(f"{key} {metric}: {cur[metric]:.4g} vs baseline {base[metric]:.4g} (+{cur[metric] / base[metric] - 1:.0%})")
+    return out
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Time and memory-profile each pipeline stage on synthetic market data.")
+    p.add_argument("--sizes", default="tiny,small", help=f"comma-separated subset of {','.join(SIZES)}")
+    p.add_argument("--stages", default=",".join(STAGES))
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--baseline", default=str(BASELINE))
+    p.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    p.add_argument("--threshold", type=float, default=0.25, help="relative slow-down / memory growth flagged as a regression")
+    args = p.parse_args(argv)
+    current = run_suite(args.sizes.split(","), args.stages.split(","), args.repeat, log=print)
+    baseline_path = Path(args.baseline)
+    if args.save:
+        if baseline_path.exists():
+            # keep entries for sizes not re-run this time
+            current["results"] = {**json.loads(baseline_path.read_text())["results"], **current["results"]}
+        baseline_path.write_text(json.dumps(current, indent=2, sort_keys=True))
+        print(f"Saved baseline to {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print(f"No baseline at {baseline_path}; run with --save to create one.")
+        return 0
+    regressions = compare(current, json.loads(baseline_path.read_text()), args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from mtm_guarantee.credit.default_model import default_month, evaluation_time
+from mtm_guarantee.guarantee.payout import payout_distribution
+from mtm_guarantee.instruments.mtm_proxy import portfolio_mtm
+from mtm_guarantee.market.correlations import correlation_factor
+from mtm_guarantee.market.fx import MarketData, as_market_data
+from mtm_guarantee.market.rates import rate_differential_history
+from mtm_guarantee.market.simulation import path_dtype
+from mtm_guarantee.pipeline import contract_from_inputs, sample_default_times
+from mtm_guarantee.profiling import profiled
+from mtm_guarantee.rng import BlockGenerators, RngStreams
+from mtm_guarantee.sensitivity import scenario_metrics
+
+BACKTEST_WINDOW = 60  # months of returns behind each as-of date
+BACKTEST_COLUMNS = ("el", "var", "es", "cap", "max_lev", "equity_roe")
+
+
+class RollingMoments:
+    # mean / sample covariance of a sliding window of rows, updated in O(n_ccy^2) per row added or dropped.
+    # Sums are kept around a fixed reference point so the one-pass covariance does not cancel catastrophically.
+    def __init__(self, shift: np.ndarray):
+        self.shift = np.asarray(shift, dtype=float)
+        self.n = 0
+        self.s1 = np.zeros(len(self.shift))
+        self.s2 = np.zeros((len(self.shift), len(self.shift)))
+
+    def add(self, row: np.ndarray) -> None:
+        d = row - self.shift
+        self.n += 1
+        self.s1 += d
+        self.s2 += np.outer(d, d)
+
+    def remove(self, row: np.ndarray) -> None:
+        d = row - self.shift
+        self.n -= 1
+        self.s1 -= d
+        self.s2 -= np.outer(d, d)
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self.shift + self.s1 / self.n
+
+    @property
+    def cov(self) -> np.ndarray:
+        return (self.s2 - np.outer(self.s1, self.s1) / self.n) / (self.n - 1)
+
+
+def rolling_moments(returns: pd.DataFrame, window: int) -> Iterator[tuple[pd.Timestamp, np.ndarray, np.ndarray]]:
+    # (as-of date, mean, covariance) of the ``window`` returns ending at each date with a full window
+    if not 2 <= window <= len(returns):
+        raise ValueError(f"Backtest window must be between 2 and the {len(returns)} months of returns, got {window}.")
+    arr = returns.to_numpy(dtype=float)
+    moments = RollingMoments(arr[:window].mean(axis=0))
+    for i, row in enumerate(arr):
+        moments.add(row)
+        if i >= window:
+            moments.remove(arr[i - window])
+        if i >= window - 1:
+            yield returns.index[i], moments.mean, moments.cov
+
+
+def window_factor(cov: np.ndarray, corr_stress: float = 1.0) -> np.ndarray:
+    # vol-scaled correlation factor, as the parametric sampler builds from the full history
+    sd = np.sqrt(np.clip(np.diag(cov), 0.0, None))
+    scale = np.outer(sd, sd)
+    corr = np.divide(cov, scale, out=np.zeros_like(cov), where=scale > 0)
+    return sd[:, None] * correlation_factor(corr, corr_stress)
+
+
+def base_normals(n: int, n_ccy: int, month_idx: np.ndarray, streams: RngStreams, dtype: type = np.float64) -> np.ndarray:
+    # cumulative standard-normal shock through each path's default month: a sum of m + 1 iid monthly draws is
+    # exactly sqrt(m + 1) times one draw, so no month-by-month paths are needed
+    out = np.empty((n, n_ccy), dtype=dtype)
+    for rng, lo, hi in BlockGenerators(streams, "backtest").segments(0, n):
+        out[lo:hi] = rng.standard_normal((hi - lo, n_ccy), dtype=dtype)
+    out *= np.sqrt(month_idx + 1.0).astype(dtype)[:, None]
+    return out
+
+
+@profiled("capital_backtest")
+def capital_backtest(
+    fx: pd.DataFrame | MarketData,
+    rates: pd.DataFrame,
+    weights: dict[str, float],
+    inputs: dict,
+    window: int = BACKTEST_WINDOW,
+    step: int = 1,
+    workers: int = 1,
+) -> pd.DataFrame:
+    # capital as it would have been computed at each month-end of the history: parametric FX from the trailing
+    # ``window`` months' mean / covariance, with spot and carry as of that date. Every date re-colours the same base
+    # normals and default times, so month-on-month moves reflect the market rather than Monte Carlo noise.
+    # Plain sampling only; ``workers`` threads evaluate dates in parallel without changing the results.
+    market = as_market_data(fx)
+    returns, levels = market.returns, market.levels
+    ccys = list(returns.columns)
+    w = np.array([weights[c] for c in ccys])
+    plain = dict(inputs, variance_reduction="none")
+    n, tenor, dtype = int(inputs["paths"]), inputs["tenor_years"], path_dtype(inputs["precision"])
+    streams = RngStreams(inputs["seed"])
+    dt = sample_default_times(plain, 0, n, len(ccys), streams)
+    idx = default_month(dt, tenor)
+    flags = (~np.isnan(dt)).astype(dtype)
+    t_eval = evaluation_time(dt, tenor)
+    z = base_normals(n, len(ccys), idx, streams, dtype)
+    months = (idx + 1.0).astype(dtype)[:, None]
+    contract = contract_from_inputs(inputs)
+
+    windows = list(rolling_moments(returns, window))[::-1][:: max(int(step), 1)][::-1]  # always ends at the latest date
+    dates = pd.DatetimeIndex([d for d, _, _ in windows])
+    spots = levels.loc[dates, ccys].to_numpy()
+    carries = rate_differential_history(rates, ccys, dates)
+
+    def evaluate(i: int) -> dict[str, float]:
+        _, mean, cov = windows[i]
+        fx_at = z @ window_factor(cov, inputs["corr_stress"]).T.astype(dtype)
+        fx_at += months * mean.astype(dtype)
+        np.exp(fx_at, out=fx_at)
+        fx_at *= spots[i].astype(dtype)
+        _, mtm = portfolio_mtm(fx_at, spots[i], inputs["portfolio_notional"], w, carries[i], t_eval, inputs["mtm_phase"], inputs["ccs_weight"], out=fx_at)
+        return scenario_metrics(payout_distribution(mtm, flags, inputs["portfolio_notional"], contract), inputs)
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(evaluate, range(len(windows))))
+    else:
+        rows = [evaluate(i) for i in range(len(windows))]
+    out = pd.DataFrame(rows, columns=list(BACKTEST_COLUMNS))
+    out.insert(0, "date", dates)
+    return out
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from mtm_guarantee import pipeline
+from mtm_guarantee.config import DEFAULT_CURRENCIES, DEFAULT_SCENARIO, MARKET_CACHE_DIR, RESULT_STORE_DIR
+from mtm_guarantee.io.excel_loader import load_market_data
+from mtm_guarantee.io.result_store import ResultStore
+from mtm_guarantee.io.validation import validate_weights
+from mtm_guarantee.market.fx import MarketData
+from mtm_guarantee.reporting.tables import scenario_summary_table
+from mtm_guarantee.reporting.tearsheet import write_tearsheet
+
+BATCH_DEFAULTS = {**DEFAULT_SCENARIO, "corr_stress": 1.0, "liq_floor_pct": 0.02}
+
+_market: dict = {}
+
+
+def read_scenarios(path: str) -> list[dict]:
+    suffix = Path(path).suffix.lower()
+    if suffix == ".csv":
+        rows = pd.read_csv(path).to_dict(orient="records")
+    elif suffix == ".json":
+        rows = json.loads(Path(path).read_text(encoding="utf-8"))
+    elif suffix in {".yaml", ".yml"}:
+        try:
+            import yaml
+        except ImportError as e:
+            raise ImportError("YAML scenario files need PyYAML: pip install pyyaml") from e
+        rows = yaml.safe_load(Path(path).read_text(encoding="utf-8"))
+    else:
+        raise ValueError(f"Unsupported scenario file '{path}': use .csv, .json or .yaml")
+    if isinstance(rows, dict):
+        rows = rows.get("scenarios", [rows])
+    return [{k: v for k, v in row.items() if not (isinstance(v, float) and pd.isna(v))} for row in rows]
+
+
+def scenario_inputs(overrides: dict) -> dict:
+    unknown = set(overrides) - set(BATCH_DEFAULTS) - {"scenario"}
+    if unknown:
+        raise ValueError(f"Unknown scenario fields: {sorted(unknown)}")
+    inputs = dict(BATCH_DEFAULTS)
+    for k, v in overrides.items():
+        if k == "scenario":
+            continue
+        if isinstance(BATCH_DEFAULTS[k], int) and float(v).is_integer():
+            v = int(v)
+        inputs[k] = v
+    return inputs
+
+
+def _init_worker(excel: str, currencies: list[str], cache_dir: str, inverted: dict[str, bool], store_dir: str | None = None) -> None:
+    # workers memory-map the columnar cache written by the parent instead of receiving pickled frames; stages are
+    # looked up in (and written to) the shared result store when one is configured
+    fx, rates, _ = load_market_data(excel, currencies, cache_dir=cache_dir)
+    present = sorted(fx["currency"].unique().tolist())
+    store = ResultStore(store_dir) if store_dir else None
+    _market.update(fx=MarketData.from_long(fx, inverted), rates=rates, weights=validate_weights({c: 1.0 for c in present}), store=store)
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_") or "scenario"
+
+
+def run_scenario(name: str, overrides: dict, out_dir: str | None = None) -> dict:
+    inputs = scenario_inputs(overrides)
+    res = pipeline.run_model(_market["fx"], _market["rates"], _market["weights"], inputs, store=_market["store"], greeks=True, marginal=True)
+    row = {"scenario": name, **{k: res[k] for k in ("el", "var", "es", "cap", "max_lev")}}
+    row.update({f"tail_{c}": v for c, v in res["tail_contrib"].items()})
+    row.update({f"marginal_cap_{c}": v for c, v in zip(res["allocation"]["currency"], res["allocation"]["marginal_capital"])})
+    row.update({f"liq_{k}": v for k, v in res["liq"].items()})
+    row.update({f"d_es_{k}": v for k, v in res["greeks"]["d_es"].items()})
+    if out_dir:
+        summary = scenario_summary_table(inputs)
+        metrics = {"EL": res["el"], "VaR": res["var"], "ES": res["es"], "Capital": res["cap"], "MaxLeverage": res["max_lev"]}
+        row["tearsheet"] = write_tearsheet(str(Path(out_dir) / "tearsheets" / f"{_slug(name)}.md"), f"MTM Guarantee Tear Sheet - {name}", metrics, summary.to_markdown(index=False))
+    return row
+
+
+def run_batch(
+    scenarios: list[dict],
+    excel: str,
+    out_dir: str | None = None,
+    currencies: list[str] | None = None,
+    inverted: dict[str, bool] | None = None,
+    workers: int | None = None,
+    cache_dir: str = MARKET_CACHE_DIR,
+    store_dir: str | None = None,
+) -> pd.DataFrame:
+    currencies = currencies or DEFAULT_CURRENCIES
+    inverted = inverted or {}
+    load_market_data(excel, currencies, cache_dir=cache_dir)
+    names = [str(s.get("scenario", f"scenario_{i + 1}")) for i, s in enumerate(scenarios)]
+    init_args = (excel, currencies, cache_dir, inverted, store_dir)
+    if workers == 1:
+        _init_worker(*init_args)
+        rows = [run_scenario(n, s, out_dir) for n, s in zip(names, scenarios)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as ex:
+            rows = list(ex.map(run_scenario, names, scenarios, [out_dir] * len(scenarios)))
+    results = pd.DataFrame(rows)
+    if out_dir:
+        Path(out_dir).mkdir(parents=True, exist_ok=True)
+        results.to_csv(Path(out_dir) / "results.csv", index=False)
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Run a book of scenario variants headlessly.")
+    p.add_argument("scenarios", help="CSV/JSON/YAML rows of DEFAULT_SCENARIO overrides")
+    p.add_argument("--excel", default="./FX Data and Interest rates.xlsx")
+    p.add_argument("--out", default="outputs/batch")
+    p.add_argument("--currencies", default=",".join(DEFAULT_CURRENCIES))
+    p.add_argument("--invert", default="", help="comma-separated currencies quoted the other way round")
+    p.add_argument("--workers", type=int, default=os.cpu_count())
+    p.add_argument("--cache-dir", default=MARKET_CACHE_DIR)
+    p.add_argument("--store-dir", default=RESULT_STORE_DIR, help="on-disk result store shared with the dashboard")
+    p.add_argument("--no-store", action="store_true", help="always simulate; neither read nor write the result store")
+    args = p.parse_args(argv)
+    inverted = {c: True for c in args.invert.split(",") if c}
+    store_dir = None if args.no_store else args.store_dir
+    results = run_batch(read_scenarios(args.scenarios), args.excel, args.out, args.currencies.split(","), inverted, args.workers, args.cache_dir, store_dir)
+    print(f"Wrote {len(results)} scenarios to {Path(args.out) / 'results.csv'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import brentq
+
+from mtm_guarantee.cache import ResultCache
+from mtm_guarantee.config import BREAKEVEN_PATH_BYTES
+from mtm_guarantee.credit.default_model import default_month
+from mtm_guarantee.guarantee.payout import payout_distribution
+from mtm_guarantee.market.fx import MarketData, as_market_data
+from mtm_guarantee.pipeline import contract_from_inputs, market_credit_stage
+from mtm_guarantee.sensitivity import CommonRandomNumbers, scenario_metrics
+
+BREAKEVEN_METRICS = ("el", "var", "es", "cap", "max_lev", "equity_roe")
+# scalar inputs the dashboard offers; any other numeric key of ``inputs`` works through the staged cache
+BREAKEVEN_INPUTS = ("pd_annual", "vol_mult", "corr_stress", "overlay_pct", "client_fee_bps", "coverage_pct")
+
+
+@dataclass
+class Breakeven:
+    name: str
+    metric: str
+    target: float
+    value: float
+    metric_value: float
+    evaluations: pd.DataFrame  # every (input value, metric) pair tried, in order
+    converged: bool
+
+
+class BreakevenSolver:
+    # metric(input) on common random numbers. PD and vol multiplier (single-obligor model) reuse the default uniforms
+    # and FX paths held by CommonRandomNumbers; every other input goes through the staged cache, so contract inputs
+    # only reprice and market inputs re-simulate with the same seed.
+    def __init__(
+        self,
+        fx: pd.DataFrame | MarketData,
+        rates: pd.DataFrame,
+        weights: dict[str, float],
+        inputs: dict,
+        cache: ResultCache | None = None,
+        max_path_bytes: int = BREAKEVEN_PATH_BYTES,
+    ):
+        self.fx = as_market_data(fx)
+        self.rates = rates
+        self.weights = weights
+        self.inputs = inputs
+        self.cache = cache if cache is not None else ResultCache()
+        self.max_path_bytes = max_path_bytes
+        self._crn = None
+
+    @property
+    def crn(self) -> CommonRandomNumbers:
+        if self._crn is None:
+            self._crn = CommonRandomNumbers(self.fx, self.rates, self.weights, self.inputs)
+            self._crn.cache_paths(self.max_path_bytes)
+        return self._crn
+
+    def evaluate(self, name: str, x: float) -> dict[str, float]:
+        if name in ("pd_annual", "vol_mult") and self.inputs["credit_model"] == "single":
+            crn = self.crn
+            pd_annual = x if name == "pd_annual" else self.inputs["pd_annual"]
+            dt = crn.default_times(pd_annual)
+            idx = default_month(dt, self.inputs["tenor_years"])
+            losses = crn.losses(dt, crn.log_fx_at(idx)[0], idx, x if name == "vol_mult" else 1.0)[0]
+            return crn.metrics(losses, crn.path_weights(dt, pd_annual))
+        if name == "vol_mult":
+            raise ValueError("The vol multiplier breakeven is only available for the single-obligor credit model.")
+        if name == "corr_stress" and self.inputs["simulation_mode"] != "parametric":
+            raise ValueError("Correlation stress only moves results in parametric simulation mode.")
+        if name not in self.inputs:
+            raise KeyError(f"Unknown input '{name}'.")
+        inputs = {**self.inputs, name: x}
+        stage = market_credit_stage(self.fx, self.rates, self.weights, inputs, self.cache)
+        losses = payout_distribution(stage.weighted_mtm, stage.default_flags, inputs["portfolio_notional"], contract_from_inputs(inputs))
+        return scenario_metrics(losses, inputs, stage.path_weights)
+
+    def solve(self, name: str, metric: str, target: float, bracket: tuple[float, float], xtol: float = 1e-4, maxiter: int = 50) -> Breakeven:
+        # Brent's method on metric(x) - target inside ``bracket``; the ends must straddle the target
+        if metric not in BREAKEVEN_METRICS:
+            raise ValueError(f"Unknown metric '{metric}'. Expected one of {BREAKEVEN_METRICS}.")
+        seen: dict[float, float] = {}
+
+        def gap(x: float) -> float:
+            if x not in seen:
+                seen[x] = float(self.evaluate(name, x)[metric])
+            return seen[x] - target
+
+        lo, hi = bracket
+        g_lo, g_hi = gap(lo), gap(hi)
+        if g_lo == 0 or g_hi == 0:
+            x = lo if g_lo == 0 else hi
+            return self._result(name, metric, target, x, seen, True)
+        if np.sign(g_lo) == np.sign(g_hi):
+            raise ValueError(f"{metric} does not cross {target:,.4g} between {name}={lo:g} ({seen[lo]:,.4g}) and {name}={hi:g} ({seen[hi]:,.4g}).")
+        x, info = brentq(gap, lo, hi, xtol=xtol, maxiter=maxiter, full_output=True, disp=False)
+        return self._result(name, metric, target, x, seen, info.converged)
+
+    def _result(self, name: str, metric: str, target: float, x: float, seen: dict[float, float], converged: bool) -> Breakeven:
+        evaluations = pd.DataFrame({name: list(seen), metric: list(seen.values())})
+        value = seen[x] if x in seen else float(self.evaluate(name, x)[metric])
+        return Breakeven(name, metric, target, float(x), value, evaluations, converged)
+
+
+def breakeven(
+    fx: pd.DataFrame | MarketData,
+    rates: pd.DataFrame,
+    weights: dict[str, float],
+    inputs: dict,
+    name: str,
+    metric: str,
+    target: float,
+    bracket: tuple[float, float],
+    cache: ResultCache | None = None,
+    xtol: float = 1e-4,
+) -> Breakeven:
+    return BreakevenSolver(fx, rates, weights, inputs, cache).solve(name, metric, target, bracket, xtol)
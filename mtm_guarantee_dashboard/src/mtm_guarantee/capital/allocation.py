@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import numpy as np
+from scipy.special import ndtr
+
+from mtm_guarantee.capital.loss_dist import var_es
+
+
+def kernel_bandwidth(losses: np.ndarray, scale: float = 1.0) -> float:
+    # Silverman-style rule of thumb; zero bandwidth falls back to the hard tail indicator
+    losses = np.asarray(losses, dtype=float)
+    return float(scale * 1.06 * losses.std() * len(losses) ** -0.2)
+
+
+def tail_kernels(losses: np.ndarray, var: float, bandwidth: float) -> tuple[np.ndarray, np.ndarray]:
+    # smoothed tail indicator P(L >= VaR) and density weight around the VaR, per path
+    if bandwidth <= 0:
+        return (losses >= var).astype(float), (losses == var).astype(float)
+    z = (np.asarray(losses, dtype=float) - var) / bandwidth
+    return ndtr(z), np.exp(-0.5 * z**2)
+
+
+def pro_rata_shares(raw: np.ndarray) -> np.ndarray:
+    # (n_paths, n_components) raw exposures -> each component's share of its path's loss
+    raw = np.maximum(np.asarray(raw, dtype=float), 0.0)
+    total = raw.sum(axis=1, keepdims=True)
+    return np.divide(raw, total, out=np.zeros_like(raw), where=total > 0)
+
+
+def euler_contributions(
+    losses: np.ndarray,
+    shares: np.ndarray,
+    confidence: float,
+    weights: np.ndarray | None = None,
+    bandwidth: float | None = None,
+    var: float | None = None,
+    es: float | None = None,
+) -> dict[str, np.ndarray]:
+    # Euler VaR / ES contributions of components holding ``shares`` (n_paths, n_components) of each path's loss,
+    # kernel-smoothed around the VaR and rescaled so they add up to the portfolio VaR / ES
+    losses = np.asarray(losses, dtype=float)
+    w = np.ones(len(losses)) if weights is None else np.asarray(weights, dtype=float)
+    if var is None or es is None:
+        _, var, es = var_es(losses, confidence, weights)
+    tail, density = tail_kernels(losses, var, kernel_bandwidth(losses) if bandwidth is None else bandwidth)
+    comp_losses = (w * losses)[:, None] * shares
+    return {"var": _rescale(density @ comp_losses, var), "es": _rescale(tail @ comp_losses, es)}
+
+
+def euler_contributions_sparse(
+    losses: np.ndarray,
+    path: np.ndarray,
+    component: np.ndarray,
+    raw: np.ndarray,
+    n_components: int,
+    confidence: float,
+    weights: np.ndarray | None = None,
+    bandwidth: float | None = None,
+    var: float | None = None,
+    es: float | None = None,
+) -> dict[str, np.ndarray]:
+    # same allocation from sparse (path, component, raw loss) triples, e.g. defaulted obligor pairs
+    losses = np.asarray(losses, dtype=float)
+    w = np.ones(len(losses)) if weights is None else np.asarray(weights, dtype=float)
+    if var is None or es is None:
+        _, var, es = var_es(losses, confidence, weights)
+    tail, density = tail_kernels(losses, var, kernel_bandwidth(losses) if bandwidth is None else bandwidth)
+    raw = np.maximum(np.asarray(raw, dtype=float), 0.0)
+    path_raw = np.bincount(path, weights=raw, minlength=len(losses))
+    share = np.divide(raw, path_raw[path], out=np.zeros_like(raw), where=path_raw[path] > 0)
+    pair_loss = (w * losses)[path] * share
+    out = {}
+    for k, kern, total in (("var", density, var), ("es", tail, es)):
+        out[k] = _rescale(np.bincount(component, weights=kern[path] * pair_loss, minlength=n_components), total)
+    return out
+
+
+def _rescale(contrib: np.ndarray, total: float) -> np.ndarray:
+    s = contrib.sum()
+    return contrib * (total / s) if s > 0 else np.zeros_like(contrib)
+
+
+def row_var_es(losses: np.ndarray, confidence: float, weights: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # var_es applied to every row of an (n_rows, n_paths) loss matrix in one sort
+    losses = np.asarray(losses, dtype=float)
+    if weights is None:
+        el = losses.mean(axis=1)
+        var = np.quantile(losses, confidence, axis=1)
+        tail = losses >= var[:, None]
+        es = np.where(tail.any(axis=1), (losses * tail).sum(axis=1) / np.maximum(tail.sum(axis=1), 1), var)
+        return el, var, es
+    w = np.asarray(weights, dtype=float) / np.sum(weights)
+    order = np.argsort(losses, axis=1)
+    ordered = np.take_along_axis(losses, order, axis=1)
+    cw = np.cumsum(w[order], axis=1)
+    pos = np.minimum((cw < confidence * cw[:, -1:]).sum(axis=1), losses.shape[1] - 1)
+    var = ordered[np.arange(len(losses)), pos]
+    above = losses > var[:, None]
+    es = ((losses * above) @ w + var * ((~above) @ w - confidence)) / (1 - confidence)
+    return losses @ w, var, es
+
+
+def marginal_capital(
+    base_losses: np.ndarray,
+    losses_without: np.ndarray,
+    confidence: float,
+    weights: np.ndarray | None = None,
+    method: str = "ES",
+    overlay_pct: float = 0.0,
+) -> np.ndarray:
+    # capital(with) - capital(without) for every row of ``losses_without`` (n_components, n_paths)
+    _, var, es = var_es(base_losses, confidence, weights)
+    _, var_wo, es_wo = row_var_es(losses_without, confidence, weights)
+    base, without = (es, es_wo) if method.upper() == "ES" else (var, var_wo)
+    return (base - without) * (1 + overlay_pct)
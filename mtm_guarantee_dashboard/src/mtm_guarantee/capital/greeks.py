@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import numpy as np
+
+from mtm_guarantee.capital.allocation import kernel_bandwidth, tail_kernels
+from mtm_guarantee.capital.loss_dist import var_es
+
+
+def _setup(losses: np.ndarray, confidence: float, weights: np.ndarray | None, var: float | None, es: float | None, bandwidth: float | None):
+    losses = np.asarray(losses, dtype=float)
+    w = np.full(len(losses), 1.0 / len(losses)) if weights is None else np.asarray(weights, dtype=float) / np.sum(weights)
+    if var is None or es is None:
+        _, var, es = var_es(losses, confidence, weights)
+    bw = kernel_bandwidth(losses) if bandwidth is None else bandwidth
+    return losses, w, var, bw
+
+
+def pathwise_var_es(
+    losses: np.ndarray,
+    dloss: np.ndarray,
+    confidence: float,
+    weights: np.ndarray | None = None,
+    var: float | None = None,
+    es: float | None = None,
+    bandwidth: float | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    # dVaR = E[dL | L = VaR], dES = E[dL | L >= VaR] for (n_paths, n_params) pathwise loss derivatives ``dloss``;
+    # the conditioning uses the same kernel-smoothed tail as the Euler allocation
+    losses, w, var, bw = _setup(losses, confidence, weights, var, es, bandwidth)
+    tail, density = tail_kernels(losses, var, bw)
+    dloss = np.asarray(dloss, dtype=float).reshape(len(losses), -1)
+    out = []
+    for kern in (density, tail):
+        k = w * kern
+        out.append(k @ dloss / k.sum() if k.sum() > 0 else np.zeros(dloss.shape[1]))
+    return out[0], out[1]
+
+
+def likelihood_ratio_var_es(
+    losses: np.ndarray,
+    score: np.ndarray,
+    confidence: float,
+    weights: np.ndarray | None = None,
+    var: float | None = None,
+    es: float | None = None,
+    bandwidth: float | None = None,
+) -> tuple[float, float]:
+    # for parameters that move the sampling density (score = d log p / d theta per path) rather than the loss:
+    # dES = E[(L - VaR)+ s] / (1 - a), dVaR = E[1{L > VaR} s] / f_L(VaR). The score is centred as a control variate.
+    losses, w, var, bw = _setup(losses, confidence, weights, var, es, bandwidth)
+    s = np.asarray(score, dtype=float)
+    s = s - w @ s
+    des = float(w @ (np.maximum(losses - var, 0.0) * s) / (1 - confidence))
+    tail, density = tail_kernels(losses, var, bw)
+    f = float(w @ density) / (bw * np.sqrt(2 * np.pi)) if bw > 0 else 0.0
+    dvar = float((w @ (tail * s)) / f) if f > 0 else 0.0
+    return dvar, des
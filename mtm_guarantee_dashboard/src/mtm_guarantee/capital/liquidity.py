@@ -2,19 +2,61 @@ from __future__ import annotations
 
 import numpy as np
 
+from mtm_guarantee.capital.loss_dist import weighted_quantile
 
-def liquidity_buffer(monthly_claims: np.ndarray, floor_pct: float, notional: float) -> dict[str, float]:
-    one_m_95 = float(np.quantile(monthly_claims, 0.95))
-    one_m_99 = float(np.quantile(monthly_claims, 0.99))
-    three_m = monthly_claims.reshape(-1, 3).sum(axis=1) if len(monthly_claims) >= 3 else monthly_claims
-    three_m_95 = float(np.quantile(three_m, 0.95))
-    three_m_99 = float(np.quantile(three_m, 0.99))
-    rec = max(one_m_99, three_m_95, floor_pct * notional)
-    return {
-        "expected_monthly": float(np.mean(monthly_claims)),
-        "1m_95": one_m_95,
-        "1m_99": one_m_99,
-        "3m_95": three_m_95,
-        "3m_99": three_m_99,
-        "recommended": rec,
-    }
+
+def sparse_claims(losses: np.ndarray, claim_month: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # (path, month, amount) triples of the non-zero cash calls, sorted by path then month
+    losses = np.asarray(losses, dtype=float)
+    path = np.flatnonzero(losses > 0)
+    month = np.asarray(claim_month)[path]
+    order = np.lexsort((month, path))
+    return path[order], month[order], losses[path][order]
+
+
+def worst_window_claims(path: np.ndarray, month: np.ndarray, amount: np.ndarray, window: int) -> tuple[np.ndarray, np.ndarray]:
+    # per claiming path, the largest sum of claims over ``window`` consecutive months; the worst window can
+    # always be taken to start at a claim month, so prefix sums over the sorted triples are enough
+    if not len(path):
+        return path, amount
+    months = int(month.max()) + window + 1
+    key = path.astype(np.int64) * months + month
+    csum = np.concatenate([[0.0], np.cumsum(amount)])
+    window_sum = csum[np.searchsorted(key, key + window)] - csum[np.arange(len(key))]
+    first = np.flatnonzero(np.r_[True, path[1:] != path[:-1]])
+    return path[first], np.maximum.reduceat(window_sum, first)
+
+
+def sparse_quantile(values: np.ndarray, q: float, n_total: int, weights: np.ndarray | None = None, total_weight: float | None = None) -> float:
+    # quantile of ``values`` padded with implicit zeros up to ``n_total`` entries (or ``total_weight``)
+    values = np.asarray(values, dtype=float)
+    if weights is None:
+        weights, total_weight = np.ones(len(values)), float(n_total)
+    zero_mass = total_weight - float(np.sum(weights))
+    if q * total_weight <= zero_mass or not len(values):
+        return 0.0
+    return weighted_quantile(values, (q * total_weight - zero_mass) / (total_weight - zero_mass), weights)
+
+
+def cash_call_profile(losses: np.ndarray, claim_month: np.ndarray, months: int, weights: np.ndarray | None = None) -> np.ndarray:
+    # expected cash call paid in each month of the tenor
+    w = np.ones(len(losses)) if weights is None else np.asarray(weights, dtype=float)
+    return np.bincount(np.asarray(claim_month), weights=w * losses, minlength=months)[:months] / w.sum()
+
+
+def liquidity_buffer(
+    losses: np.ndarray, claim_month: np.ndarray, months: int, floor_pct: float, notional: float, weights: np.ndarray | None = None
+) -> dict[str, float]:
+    # each path pays its claims in the month they fall due; 1m/3m figures are quantiles across paths of the
+    # worst rolling 1m/3m cash call within the tenor
+    path, month, amount = sparse_claims(losses, claim_month)
+    n = len(losses)
+    total_w = None if weights is None else float(np.sum(weights))
+    out = {"expected_monthly": float(np.average(losses, weights=weights)) / max(months, 1)}
+    for window in (1, 3):
+        paths, worst = worst_window_claims(path, month, amount, min(window, max(months, 1)))
+        w = None if weights is None else np.asarray(weights, dtype=float)[paths]
+        for q in (0.95, 0.99):
+            out[f"{window}m_{round(q * 100)}"] = sparse_quantile(worst, q, n, w, total_w)
+    out["recommended"] = max(out["1m_99"], out["3m_95"], floor_pct * notional)
+    return out
@@ -3,16 +3,252 @@ from __future__ import annotations
 import numpy as np
 
 
-def var_es(losses: np.ndarray, confidence: float) -> tuple[float, float, float]:
+def _quantile(values: np.ndarray, q: float) -> float:
+    # np.quantile's linear interpolation, done in float64 for compact (float32) storage
+    if values.dtype == np.float64:
+        return float(np.quantile(values, q))
+    pos = q * (len(values) - 1)
+    lo = int(np.floor(pos))
+    hi = min(lo + 1, len(values) - 1)
+    part = np.partition(values, [lo, hi])
+    return float(part[lo]) + (pos - lo) * (float(part[hi]) - float(part[lo]))
+
+
+def weighted_quantile(values: np.ndarray, q: float, weights: np.ndarray | None = None) -> float:
+    values = np.asarray(values)
+    if weights is None:
+        return _quantile(values.ravel(), q)
+    order = np.argsort(values)
+    cw = np.cumsum(np.asarray(weights, dtype=float)[order])
+    return float(values[order][min(np.searchsorted(cw, q * cw[-1]), len(values) - 1)])
+
+
+def var_es(losses: np.ndarray, confidence: float, weights: np.ndarray | None = None) -> tuple[float, float, float]:
     losses = np.asarray(losses)
-    el = float(losses.mean())
-    var = float(np.quantile(losses, confidence))
+    if weights is not None:
+        # self-normalised weighted estimator; ES from the weighted tail including the atom at VaR
+        w = np.asarray(weights, dtype=float) / np.sum(weights)
+        el = float(w @ losses.astype(float, copy=False))
+        var = weighted_quantile(losses, confidence, w)
+        above = losses > var
+        es = float((w[above] @ losses[above].astype(float) + var * (w[~above].sum() - confidence)) / (1 - confidence))
+        return el, var, es
+    # float64 accumulators whatever the storage dtype
+    el = float(losses.mean(dtype=np.float64))
+    var = _quantile(losses.ravel(), confidence)
     tail = losses[losses >= var]
-    es = float(tail.mean() if len(tail) else var)
+    es = float(tail.mean(dtype=np.float64) if len(tail) else var)
     return el, var, es
 
 
-def exceedance_curve(losses: np.ndarray, points: int = 100) -> tuple[np.ndarray, np.ndarray]:
-    xs = np.linspace(0, float(np.max(losses)), points)
-    ys = np.array([(losses > x).mean() for x in xs])
-    return xs, ys
+def standard_errors(
+    losses: np.ndarray, confidence: float, weights: np.ndarray | None = None, groups: np.ndarray | None = None
+) -> dict[str, float]:
+    # delta-method (influence function) errors averaged over independent units (paths, antithetic pairs, QMC replicates)
+    losses = np.asarray(losses, dtype=float)
+    n = len(losses)
+    w = np.ones(n) if weights is None else np.asarray(weights, dtype=float) * n / np.sum(weights)
+    el, var, es = var_es(losses, confidence, weights)
+    half = 0.5 * min(1 - confidence, confidence)
+    sparsity = (weighted_quantile(losses, confidence + half, weights) - weighted_quantile(losses, confidence - half, weights)) / (2 * half)
+    influence = {
+        "el": w * (losses - el),
+        "var": w * (confidence - (losses <= var)) * sparsity,
+        "es": w * (var + np.maximum(losses - var, 0.0) / (1 - confidence) - es),
+    }
+    groups = np.arange(n) if groups is None else np.asarray(groups)
+    sizes = np.bincount(groups)
+    units = sizes > 0
+    out = {}
+    for k, psi in influence.items():
+        means = np.bincount(groups, weights=psi)[units] / sizes[units]
+        out[k] = float(means.std(ddof=1) / np.sqrt(len(means))) if len(means) > 1 else float("nan")
+    return out
+
+
+def exceedance_curve(losses: np.ndarray, points: int = 100, weights: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    losses = np.asarray(losses).ravel()
+    order = np.argsort(losses)
+    ordered = losses[order]
+    xs = np.linspace(0, float(ordered[-1]), points)
+    below = np.searchsorted(ordered, xs, side="right")
+    if weights is None:
+        return xs, (len(ordered) - below) / len(ordered)
+    cw = np.concatenate([[0.0], np.cumsum(np.asarray(weights, dtype=float).ravel()[order])])
+    return xs, (cw[-1] - cw[below]) / cw[-1]
+
+
+class QuantileSketch:
+    # log-bucketed sketch (DDSketch): relative error ``alpha`` on non-negative values, mergeable by adding counts
+    def __init__(self, alpha: float = 0.005):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.count = 0
+        self.zero_count = 0
+        self.buckets: dict[int, int] = {}
+
+    def update(self, values: np.ndarray) -> QuantileSketch:
+        values = np.asarray(values, dtype=float).ravel()
+        if (values < 0).any():
+            raise ValueError("QuantileSketch only accepts non-negative values.")
+        pos = values[values > 0]
+        self.count += len(values)
+        self.zero_count += len(values) - len(pos)
+        keys, counts = np.unique(np.ceil(np.log(pos) / np.log(self.gamma)).astype(np.int64), return_counts=True)
+        for k, c in zip(keys.tolist(), counts.tolist()):
+            self.buckets[k] = self.buckets.get(k, 0) + c
+        return self
+
+    def merge(self, other: QuantileSketch) -> QuantileSketch:
+        if other.alpha != self.alpha:
+            raise ValueError("Cannot merge sketches with different accuracy.")
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for k, c in other.buckets.items():
+            self.buckets[k] = self.buckets.get(k, 0) + c
+        return self
+
+    def _table(self) -> tuple[np.ndarray, np.ndarray]:
+        keys = np.array(sorted(self.buckets), dtype=np.int64)
+        values = 2 * self.gamma**keys / (self.gamma + 1)
+        counts = np.array([self.buckets[k] for k in keys.tolist()], dtype=np.int64)
+        return np.concatenate([[0.0], values]), np.concatenate([[self.zero_count], counts])
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return float("nan")
+        values, counts = self._table()
+        rank = q * (self.count - 1)
+        return float(values[np.searchsorted(np.cumsum(counts), rank, side="right")])
+
+    def tail_mean(self, x: float) -> float:
+        values, counts = self._table()
+        sel = values >= x
+        return float((values[sel] * counts[sel]).sum() / counts[sel].sum()) if sel.any() and counts[sel].sum() else x
+
+    def exceedance(self, xs: np.ndarray) -> np.ndarray:
+        values, counts = self._table()
+        below = np.concatenate([[0], np.cumsum(counts)])[np.searchsorted(values, xs, side="right")]
+        return (self.count - below) / max(self.count, 1)
+
+
+class QuantileSketchArray:
+    # one log-bucketed sketch per cell of ``shape`` on a fixed bucket range, updated for all cells in one bincount;
+    # positive values outside [min_value, max_value] land in the end buckets
+    def __init__(self, shape: tuple[int, ...], alpha: float = 0.01, min_value: float = 1.0, max_value: float = 1e13):
+        self.shape = tuple(shape)
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.lo = int(np.ceil(np.log(min_value) / np.log(self.gamma)))
+        self.n_keys = int(np.ceil(np.log(max_value) / np.log(self.gamma))) - self.lo + 2  # slot 0 holds zeros
+        self.counts = np.zeros((int(np.prod(self.shape)), self.n_keys))
+        self.sums = np.zeros(self.shape)
+        self.weight = 0.0
+
+    def update(self, values: np.ndarray, weights: np.ndarray | None = None) -> QuantileSketchArray:
+        # values: (n,) + shape, non-negative; weights: (n,)
+        values = np.asarray(values, dtype=float).reshape(len(values), -1)
+        w = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=float)
+        with np.errstate(divide="ignore"):
+            keys = np.ceil(np.log(values) / np.log(self.gamma)) - self.lo + 1
+        slot = np.where(values > 0, np.clip(np.nan_to_num(keys, neginf=1), 1, self.n_keys - 1), 0).astype(np.int64)
+        slot += np.arange(values.shape[1]) * self.n_keys
+        self.counts += np.bincount(slot.ravel(), weights=np.repeat(w, values.shape[1]), minlength=self.counts.size).reshape(self.counts.shape)
+        self.sums += (w @ values).reshape(self.shape)
+        self.weight += float(w.sum())
+        return self
+
+    def merge(self, other: QuantileSketchArray) -> QuantileSketchArray:
+        if other.shape != self.shape or other.alpha != self.alpha or other.n_keys != self.n_keys:
+            raise ValueError("Cannot merge sketch arrays with different layouts.")
+        self.counts += other.counts
+        self.sums += other.sums
+        self.weight += other.weight
+        return self
+
+    def mean(self) -> np.ndarray:
+        return self.sums / self.weight if self.weight else np.full(self.shape, np.nan)
+
+    def quantile(self, q: float) -> np.ndarray:
+        keys = np.arange(self.n_keys - 1) + self.lo
+        values = np.concatenate([[0.0], 2 * self.gamma**keys / (self.gamma + 1)])
+        cum = np.cumsum(self.counts, axis=1)
+        slot = (cum >= q * cum[:, -1:]).argmax(axis=1)
+        return values[slot].reshape(self.shape)
+
+
+class TailAccumulator:
+    # streaming EL/VaR/ES: exact while the tail fits in the top-``tail_size`` buffer, sketch estimate beyond
+    def __init__(self, confidence: float, tail_size: int = 100_000, alpha: float = 0.005):
+        self.confidence = confidence
+        self.tail_size = int(tail_size)
+        self.n = 0
+        self.total = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.top = np.empty(0)
+        self.sketch = QuantileSketch(alpha)
+
+    def _keep_top(self, values: np.ndarray) -> None:
+        values = np.concatenate([self.top, values])
+        if len(values) > self.tail_size:
+            values = np.partition(values, len(values) - self.tail_size)[-self.tail_size :]
+        self.top = values
+
+    def update(self, losses: np.ndarray) -> TailAccumulator:
+        losses = np.asarray(losses, dtype=float).ravel()
+        if not len(losses):
+            return self
+        self.n += len(losses)
+        self.total += float(losses.sum())
+        self.min = min(self.min, float(losses.min()))
+        self.max = max(self.max, float(losses.max()))
+        self._keep_top(losses)
+        self.sketch.update(losses)
+        return self
+
+    def merge(self, other: TailAccumulator) -> TailAccumulator:
+        self.n += other.n
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._keep_top(other.top)
+        self.sketch.merge(other.sketch)
+        return self
+
+    @property
+    def exact(self) -> bool:
+        h = (self.n - 1) * self.confidence
+        return self.n - int(np.floor(h)) <= len(self.top)
+
+    def result(self) -> tuple[float, float, float]:
+        if self.n == 0:
+            return float("nan"), float("nan"), float("nan")
+        el = self.total / self.n
+        if self.n == len(self.top):
+            return (el,) + var_es(self.top, self.confidence)[1:]
+        top = np.sort(self.top)
+        if self.exact:
+            h = (self.n - 1) * self.confidence
+            lo = len(top) - (self.n - int(np.floor(h)))
+            upper = top[min(lo + 1, len(top) - 1)]
+            var = float(top[lo] + (h - np.floor(h)) * (upper - top[lo]))
+        else:
+            var = self.sketch.quantile(self.confidence)
+        if var <= self.min:
+            return el, var, el
+        if top[0] < var:
+            return el, var, float(top[top >= var].mean())
+        if top[0] == var:
+            # everything above VaR is buffered but ties at VaR spill out: weight the atom at VaR, as weighted var_es does
+            above = top[top > var]
+            return el, var, float((above.sum() + var * (self.n - len(above) - self.confidence * self.n)) / ((1 - self.confidence) * self.n))
+        return el, var, self.sketch.tail_mean(var)
+
+    def exceedance_curve(self, points: int = 100) -> tuple[np.ndarray, np.ndarray]:
+        xs = np.linspace(0, self.max, points)
+        ys = self.sketch.exceedance(xs)
+        top = np.sort(self.top)
+        in_buffer = xs >= top[0] if len(top) else np.zeros(len(xs), dtype=bool)
+        ys[in_buffer] = (len(top) - np.searchsorted(top, xs[in_buffer], side="right")) / self.n
+        return xs, ys
@@ -1,30 +1,37 @@
 from __future__ import annotations
 
+import numpy as np
+
+ArrayLike = float | np.ndarray
+
+
+def _ratio(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    num, den = np.broadcast_arrays(np.asarray(num, dtype=float), np.asarray(den, dtype=float))
+    return np.divide(num, den, out=np.zeros(num.shape), where=den > 0)
+
 
 def waterfall(
-    notional: float,
-    client_fee_bps: float,
-    opex_bps: float,
-    reserve_bps: float,
-    expected_loss: float,
-    mezz_notional: float,
-    mezz_coupon: float,
-    senior_limit: float,
-    senior_fee_bps: float,
-    equity_capital: float,
-    senior_capital_factor: float,
-) -> dict[str, float]:
-    premium = notional * client_fee_bps / 1e4
-    opex = notional * opex_bps / 1e4
-    reserve = notional * reserve_bps / 1e4
+    notional: ArrayLike,
+    client_fee_bps: ArrayLike,
+    opex_bps: ArrayLike,
+    reserve_bps: ArrayLike,
+    expected_loss: ArrayLike,
+    mezz_notional: ArrayLike,
+    mezz_coupon: ArrayLike,
+    senior_limit: ArrayLike,
+    senior_fee_bps: ArrayLike,
+    equity_capital: ArrayLike,
+    senior_capital_factor: ArrayLike,
+) -> dict[str, ArrayLike]:
+    # every argument broadcasts, so a grid of structures is evaluated in one pass; scalar inputs give floats
+    premium = np.multiply(notional, client_fee_bps) / 1e4
+    opex = np.multiply(notional, opex_bps) / 1e4
+    reserve = np.multiply(notional, reserve_bps) / 1e4
     net_available = premium - opex - reserve - expected_loss
-    mezz_coupon_amt = mezz_notional * mezz_coupon
-    senior_fee = senior_limit * senior_fee_bps / 1e4
+    mezz_coupon_amt = np.multiply(mezz_notional, mezz_coupon)
+    senior_fee = np.multiply(senior_limit, senior_fee_bps) / 1e4
     equity_residual = net_available - mezz_coupon_amt - senior_fee
-    equity_roe = equity_residual / equity_capital if equity_capital > 0 else 0.0
-    mezz_icr = net_available / mezz_coupon_amt if mezz_coupon_amt > 0 else 0.0
-    implied_senior_roe = senior_fee / (senior_limit * senior_capital_factor) if senior_limit > 0 else 0.0
-    return {
+    out = {
         "premium": premium,
         "opex": opex,
         "reserve": reserve,
@@ -33,7 +40,11 @@ def waterfall(
         "mezz_coupon": mezz_coupon_amt,
         "senior_fee": senior_fee,
         "equity_residual": equity_residual,
-        "equity_roe": equity_roe,
-        "mezz_icr": mezz_icr,
-        "implied_senior_roe": implied_senior_roe,
+        "equity_roe": _ratio(equity_residual, equity_capital),
+        "mezz_icr": _ratio(net_available, mezz_coupon_amt),
+        "implied_senior_roe": _ratio(senior_fee, np.multiply(senior_limit, senior_capital_factor)),
     }
+    shape = np.broadcast_shapes(*(np.shape(v) for v in out.values()))
+    if not shape:
+        return {k: float(v) for k, v in out.items()}
+    return {k: np.broadcast_to(v, shape) for k, v in out.items()}
@@ -1,8 +1,131 @@
 from __future__ import annotations
 
+import numpy as np
+import pandas as pd
+
+from mtm_guarantee.capital.loss_dist import var_es
+from mtm_guarantee.capital.returns import waterfall
+
+STACK_GRID = {
+    "leverage": np.linspace(5.0, 20.0, 16),
+    "mezz_pct": np.linspace(0.0, 0.3, 13),
+    "mezz_coupon": np.linspace(0.04, 0.16, 7),
+    "senior_limit_pct": np.linspace(0.1, 1.0, 10),
+}
+
 
 def layer_amounts(notional: float, equity_pct: float, mezz_pct: float) -> dict[str, float]:
     equity = notional * equity_pct
     mezz = notional * mezz_pct
     senior = max(notional - equity - mezz, 0.0)
     return {"equity": equity, "mezz": mezz, "senior": senior}
+
+
+class LossLadder:
+    # sorted loss distribution with prefix sums: E[min(L, x)] and P(L > x) for any array of x in O(log n)
+    def __init__(self, losses: np.ndarray, weights: np.ndarray | None = None):
+        order = np.argsort(losses)
+        self.losses = np.asarray(losses, dtype=float)[order]
+        w = np.ones(len(order)) if weights is None else np.asarray(weights, dtype=float)[order]
+        w = w / w.sum()
+        self.cw = np.concatenate([[0.0], np.cumsum(w)])
+        self.cl = np.concatenate([[0.0], np.cumsum(w * self.losses)])
+
+    @property
+    def mean(self) -> float:
+        return float(self.cl[-1])
+
+    def limited_mean(self, x: np.ndarray) -> np.ndarray:
+        k = np.searchsorted(self.losses, x, side="left")
+        return self.cl[k] + np.asarray(x, dtype=float) * (1.0 - self.cw[k])
+
+    def layer_loss(self, attach: np.ndarray, detach: np.ndarray) -> np.ndarray:
+        return self.limited_mean(detach) - self.limited_mean(attach)
+
+    def exceedance(self, x: np.ndarray) -> np.ndarray:
+        return 1.0 - self.cw[np.searchsorted(self.losses, x, side="right")]
+
+
+def stack_grid(
+    losses: np.ndarray,
+    notional: float,
+    client_fee_bps: float,
+    opex_bps: float,
+    reserve_bps: float,
+    senior_fee_bps: float,
+    senior_capital_factor: float,
+    grid: dict[str, np.ndarray] | None = None,
+    weights: np.ndarray | None = None,
+) -> pd.DataFrame:
+    # every (leverage, mezz %, mezz coupon, senior limit %) combination through the waterfall in one broadcast pass;
+    # equity = notional / leverage takes first loss, mezz the next layer, senior above equity + mezz
+    grid = {**STACK_GRID, **(grid or {})}
+    cols = np.meshgrid(*(np.asarray(grid[k], dtype=float) for k in STACK_GRID), indexing="ij")
+    lev, mezz_pct, coupon, senior_pct = (c.ravel() for c in cols)
+    equity = notional / lev
+    mezz = notional * mezz_pct
+    senior = notional * senior_pct
+    ladder = LossLadder(losses, weights)
+    el = ladder.mean
+    wf = waterfall(notional, client_fee_bps, opex_bps, reserve_bps, el, mezz, coupon, senior, senior_fee_bps, equity, senior_capital_factor)
+    return pd.DataFrame(
+        {
+            "leverage": lev,
+            "equity": equity,
+            "mezz_pct": mezz_pct,
+            "mezz_coupon": coupon,
+            "senior_limit": senior,
+            "senior_attach": equity + mezz,
+            "equity_roe": wf["equity_roe"],
+            "mezz_icr": wf["mezz_icr"],
+            "implied_senior_roe": wf["implied_senior_roe"],
+            "equity_el": ladder.limited_mean(equity),
+            "mezz_el": ladder.layer_loss(equity, equity + mezz),
+            "senior_el": ladder.layer_loss(equity + mezz, equity + mezz + senior),
+            "p_mezz_loss": ladder.exceedance(equity),
+            "p_senior_loss": ladder.exceedance(equity + mezz),
+            "uncovered_el": el - ladder.limited_mean(equity + mezz + senior),
+        }
+    )
+
+
+def optimise_stack(
+    losses: np.ndarray,
+    notional: float,
+    client_fee_bps: float,
+    opex_bps: float,
+    reserve_bps: float,
+    senior_fee_bps: float,
+    senior_capital_factor: float,
+    confidence: float = 0.995,
+    min_mezz_icr: float = 1.5,
+    senior_above_es: bool = True,
+    max_mezz_loss_prob: float | None = None,
+    mezz_el_cover: float | None = 1.0,
+    max_uncovered_el: float | None = None,
+    grid: dict[str, np.ndarray] | None = None,
+    weights: np.ndarray | None = None,
+) -> tuple[pd.Series | None, pd.DataFrame]:
+    # highest equity ROE among feasible structures; returns (best row or None, full grid with a feasible flag)
+    table = stack_grid(losses, notional, client_fee_bps, opex_bps, reserve_bps, senior_fee_bps, senior_capital_factor, grid, weights)
+    feasible = (table["mezz_icr"] >= min_mezz_icr) | (table["mezz_pct"] == 0)
+    if senior_above_es:
+        feasible &= table["senior_attach"] >= var_es(losses, confidence, weights)[2]
+    if max_mezz_loss_prob is not None:
+        feasible &= table["p_mezz_loss"] <= max_mezz_loss_prob
+    if mezz_el_cover is not None:
+        # mezz investors need a coupon at least covering their layer's expected loss
+        feasible &= table["mezz_coupon"] * table["mezz_pct"] * notional >= mezz_el_cover * table["mezz_el"]
+    if max_uncovered_el is not None:
+        feasible &= table["uncovered_el"] <= max_uncovered_el
+    table["feasible"] = feasible
+    if not feasible.any():
+        return None, table
+    return table.loc[table["equity_roe"].where(feasible).idxmax()], table
+
+
+def pareto_frontier(table: pd.DataFrame, risk: str = "p_mezz_loss", reward: str = "equity_roe") -> pd.DataFrame:
+    # feasible structures not beaten on both lower risk and higher reward
+    pts = table[table["feasible"]] if "feasible" in table else table
+    pts = pts.sort_values([risk, reward], ascending=[True, False])
+    return pts[pts[reward] > pts[reward].cummax().shift(fill_value=-np.inf)]
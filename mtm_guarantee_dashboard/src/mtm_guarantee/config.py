@@ -22,10 +22,22 @@ DEFAULT_SCENARIO = {
     "horizon_years": 1,
     "target_leverage": 15.0,
     "simulation_mode": "historical",
+    "block_length": 6.0,
+    "precision": "float64",
     "paths": 10_000,
     "fast_paths": 2_000,
     "mtm_phase": "phase1",
     "default_mode": "default_triggered",
+    "variance_reduction": "none",
+    "is_pd_tilt": 3.0,
+    "is_fx_tilt": 0.02,
+    "seed": 42,
+    "credit_model": "single",
+    "n_obligors": 200,
+    "obligor_book": "",  # CSV / Excel book with per-obligor notional, PD and LGD; empty for a synthetic book
+    "copula_rho": 0.2,
+    "copula_rho_ccy": 0.1,
+    "wrong_way": 0.0,
 }
 
 EXCEL_MAPPING = {
@@ -33,4 +45,11 @@ EXCEL_MAPPING = {
     "date_col": "Date",
     "currency_col": "Currency",
     "rate_sheet_candidates": ["Rates", "Interest_rates", "Historical_rates"],
+    "obligor_sheet": "Obligors",
 }
+
+RESULT_CACHE_BYTES = 512 * 1024**2
+BREAKEVEN_PATH_BYTES = 256 * 1024**2
+MARKET_CACHE_DIR = ".mtm_cache"
+RESULT_STORE_DIR = ".mtm_results"
+RESULT_STORE_BYTES = 2 * 1024**3
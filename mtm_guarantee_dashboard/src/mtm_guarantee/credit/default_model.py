@@ -2,11 +2,74 @@ from __future__ import annotations
 
 import numpy as np
 
+from mtm_guarantee.rng import BlockGenerators, RngStreams
+from mtm_guarantee.sampling import SobolReplicates, check_variance_reduction, interleave_antithetic
 
-def default_time_from_pd(pd_annual: float, tenor_years: float, n_paths: int, seed: int = 7) -> np.ndarray:
-    rng = np.random.default_rng(seed)
-    hazard = -np.log(max(1 - pd_annual, 1e-8))
-    u = rng.random(n_paths)
-    t = -np.log(np.maximum(1 - u, 1e-12)) / max(hazard, 1e-8)
+
+def _uniform_block(rng: np.random.Generator, n: int, variance_reduction: str) -> np.ndarray:
+    if variance_reduction == "antithetic":
+        u = rng.random((n + 1) // 2)
+        return interleave_antithetic(u, 1.0 - u, n)
+    return rng.random(n)
+
+
+def default_uniforms(
+    n_paths: int,
+    seed: int = 7,
+    variance_reduction: str = "none",
+    streams: RngStreams | None = None,
+    start: int = 0,
+    sobol_dim: int = 1,
+) -> np.ndarray:
+    # with ``streams`` paths [start, start + n_paths) are drawn from their own RNG blocks, independent of the split.
+    # Sobol uniforms are dim 0 of the joint ``sobol_dim`` sequence whose other dims drive the FX shocks.
+    check_variance_reduction(variance_reduction)
+    if variance_reduction == "sobol":
+        sobol_seed = seed if streams is None else streams.seed_sequence("sobol")
+        return SobolReplicates(sobol_dim, sobol_seed).draw(start, n_paths)[:, 0]
+    if streams is None:
+        return _uniform_block(np.random.default_rng(seed), n_paths, variance_reduction)
+    parts = [_uniform_block(rng, hi - lo, variance_reduction) for rng, lo, hi in BlockGenerators(streams, "default").segments(start, n_paths)]
+    return np.concatenate(parts) if parts else np.empty(0)
+
+
+def _hazard(pd_annual: float) -> float:
+    return max(-np.log(max(1 - pd_annual, 1e-8)), 1e-8)
+
+
+def default_time_from_uniforms(u: np.ndarray, pd_annual: float, tenor_years: float) -> np.ndarray:
+    t = -np.log(np.maximum(1 - u, 1e-12)) / _hazard(pd_annual)
     t[t > tenor_years] = np.nan
     return t
+
+
+def default_time_from_pd(pd_annual: float, tenor_years: float, n_paths: int, seed: int = 7) -> np.ndarray:
+    return default_time_from_uniforms(default_uniforms(n_paths, seed), pd_annual, tenor_years)
+
+
+def importance_pd(pd_annual: float, tilt: float) -> float:
+    return float(min(pd_annual * tilt, 0.95)) if pd_annual > 0 else 0.0
+
+
+def default_log_likelihood_ratio(dt: np.ndarray, pd_annual: float, pd_sampled: float, tenor_years: float) -> np.ndarray:
+    # log(target / sampling density) of exponential default times truncated at the tenor
+    h, g = _hazard(pd_annual), _hazard(pd_sampled)
+    defaulted = ~np.isnan(dt)
+    t = np.where(defaulted, dt, tenor_years)
+    return np.where(defaulted, np.log(h / g), 0.0) - (h - g) * t
+
+
+def default_score(dt: np.ndarray, pd_annual: float, tenor_years: float) -> np.ndarray:
+    # d/d(pd_annual) of the log density of exponential default times truncated at the tenor (likelihood-ratio weight)
+    h = _hazard(pd_annual)
+    defaulted = ~np.isnan(dt)
+    t = np.where(defaulted, dt, tenor_years)
+    return (np.where(defaulted, 1.0 / h, 0.0) - t) / max(1 - pd_annual, 1e-8)
+
+
+def default_month(dt: np.ndarray, tenor_years: int) -> np.ndarray:
+    return np.minimum(np.nan_to_num(dt, nan=tenor_years) * 12, tenor_years * 12 - 1).astype(int)
+
+
+def evaluation_time(dt: np.ndarray, tenor_years: float) -> np.ndarray:
+    return np.nan_to_num(dt, nan=tenor_years).clip(0, tenor_years)
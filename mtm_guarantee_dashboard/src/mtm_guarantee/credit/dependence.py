@@ -3,7 +3,8 @@ from __future__ import annotations
 import numpy as np
 
 
-def adjust_pd_for_fx(pd_base: float, fx_shock: np.ndarray, dependence: float) -> np.ndarray:
+def adjust_pd_for_fx(pd_base: float | np.ndarray, fx_shock: np.ndarray, dependence: float) -> np.ndarray:
     # dependence >0 means wrong-way (higher default with adverse FX)
+    # the 1e-4 floor applies only to obligors that can default at all
     adj = np.clip(pd_base * np.exp(dependence * fx_shock), 1e-4, 0.95)
-    return adj
+    return np.where(np.asarray(pd_base) > 0, adj, 0.0)
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr, ndtri
+
+from mtm_guarantee.credit.dependence import adjust_pd_for_fx
+from mtm_guarantee.instruments.mtm_proxy import blend_ccs_ndf, mtm_phase0, mtm_phase1
+from mtm_guarantee.market.simulation import DEFAULT_BLOCK_LENGTH, DEFAULT_CHUNK_SIZE, iter_log_paths
+from mtm_guarantee.profiling import profiled
+from mtm_guarantee.rng import BlockGenerators, RngStreams
+
+CREDIT_MODELS = ("single", "obligor")
+
+
+@dataclass
+class ObligorBook:
+    names: np.ndarray
+    currency: np.ndarray  # index into the market currency list
+    notional: np.ndarray
+    pd_annual: np.ndarray
+    lgd: np.ndarray
+
+    @classmethod
+    def from_frame(cls, book: pd.DataFrame, currencies: list[str]) -> ObligorBook:
+        # columns: obligor, currency, notional, pd, lgd
+        unknown = sorted(set(book["currency"]) - set(currencies))
+        if unknown:
+            raise ValueError(f"Obligor currencies not in market data: {unknown}")
+        ccy = pd.Index(currencies).get_indexer(book["currency"])
+        return cls(book["obligor"].to_numpy(), ccy, book["notional"].to_numpy(float), book["pd"].to_numpy(float), book["lgd"].to_numpy(float))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+def synthetic_book(currencies: list[str], weights: np.ndarray, notional: float, n_obligors: int, pd_annual: float, lgd: float) -> ObligorBook:
+    # equal-sized obligors, spread over currencies in proportion to the portfolio weights
+    counts = np.maximum(np.round(np.asarray(weights) * n_obligors), (np.asarray(weights) > 0).astype(int)).astype(int)
+    ccy = np.repeat(np.arange(len(currencies)), counts)
+    size = notional * np.asarray(weights)[ccy] / counts[ccy]
+    names = np.array([f"{currencies[c]}-{i}" for i, c in enumerate(ccy)])
+    return ObligorBook(names, ccy, size, np.full(len(ccy), pd_annual), np.full(len(ccy), lgd))
+
+
+def copula_loadings(book: ObligorBook, n_ccy: int, rho: float, rho_ccy: float = 0.0) -> np.ndarray:
+    # (n_obligors, 1 + n_ccy) loadings on a global factor and one factor per currency; rho_ccy = 0 is the one-factor model
+    if rho + rho_ccy >= 1:
+        raise ValueError("Copula correlations rho + rho_ccy must be below 1.")
+    loadings = np.zeros((len(book), 1 + n_ccy))
+    loadings[:, 0] = np.sqrt(rho)
+    loadings[np.arange(len(book)), 1 + book.currency] = np.sqrt(rho_ccy)
+    return loadings
+
+
+@dataclass
+class DefaultPairs:
+    # only defaulted (path, obligor) pairs are materialised
+    path: np.ndarray
+    obligor: np.ndarray
+    time: np.ndarray
+    loss: np.ndarray
+
+    @classmethod
+    def concat(cls, parts: list[DefaultPairs]) -> DefaultPairs:
+        if not parts:
+            return cls(*(np.empty(0, dtype=d) for d in (int, int, float, float)))
+        return cls(*(np.concatenate([getattr(p, f) for p in parts]) for f in ("path", "obligor", "time", "loss")))
+
+
+def _defaults(
+    rng: np.random.Generator, n: int, book: ObligorBook, loadings: np.ndarray, cum_hazard: np.ndarray | None, group: np.ndarray, tenor_years: float
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # latent X = a.Z + s.eps; default time solves H(t) = -log(1 - Phi(X)), so t < tenor iff X < Phi^-1(1 - exp(-H(tenor))).
+    # H is linear at the annual hazard, or the (n, months, group) month-end cumulative hazard when FX moves it.
+    # thresholds are computed per (path, pd/currency group), not per (path, obligor)
+    z = rng.standard_normal((n, loadings.shape[1]))
+    x = rng.standard_normal((n, len(book)))
+    x *= np.sqrt(1.0 - (loadings**2).sum(axis=1))
+    x += z @ loadings.T
+    pd_group = book.pd_annual[np.unique(group, return_index=True)[1]]
+    if cum_hazard is None:
+        threshold = np.broadcast_to(ndtri(1.0 - (1.0 - pd_group) ** tenor_years), (n, len(pd_group)))
+    else:
+        threshold = ndtri(-np.expm1(-cum_hazard[:, -1]))
+    path, obligor = np.nonzero(x < threshold[:, group])
+    e = -np.log1p(-ndtr(x[path, obligor]))
+    if cum_hazard is None:
+        t = e / np.maximum(-np.log1p(-pd_group[group[obligor]]), 1e-12)
+    else:
+        # month of default from the cumulative hazard, linear within the month
+        h = np.concatenate([np.zeros((len(path), 1)), cum_hazard[path, :, group[obligor]]], axis=1)
+        m = np.minimum((h[:, 1:] < e[:, None]).sum(axis=1), h.shape[1] - 2)
+        lo, hi = h[np.arange(len(m)), m], h[np.arange(len(m)), m + 1]
+        t = (m + (e - lo) / np.maximum(hi - lo, 1e-12)) / 12
+    return path, obligor, np.minimum(t, tenor_years)
+
+
+@profiled("obligor_losses")
+def obligor_losses(
+    returns: pd.DataFrame,
+    s0: pd.Series,
+    carry: np.ndarray,
+    book: ObligorBook,
+    loadings: np.ndarray,
+    tenor_years: int,
+    n_paths: int,
+    mode: str = "historical",
+    corr_stress: float = 1.0,
+    phase: str = "phase1",
+    ccs_weight: float = 1.0,
+    wrong_way: float = 0.0,
+    streams: RngStreams | None = None,
+    start: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    variance_reduction: str = "none",
+    block_length: float = DEFAULT_BLOCK_LENGTH,
+    dtype: type = np.float64,
+) -> DefaultPairs:
+    # FX paths and copula draws chunk by chunk; close-out MTM (times LGD) only for defaulted pairs
+    streams = streams or RngStreams(42)
+    months = tenor_years * 12
+    sigma = returns.std().values
+    _, group = np.unique(np.c_[book.pd_annual, book.currency], axis=0, return_inverse=True)
+    group = group.ravel()
+    first = np.unique(group, return_index=True)[1]
+    group_ccy, pd_group = book.currency[first], book.pd_annual[first]
+    copula = BlockGenerators(streams, "copula")
+    chunks = iter_log_paths(
+        returns, tenor_years, n_paths, mode, corr_stress, chunk_size=chunk_size, variance_reduction=variance_reduction, dtype=dtype, streams=streams, start=start, block_length=block_length
+    )
+    out = []
+    for offset, log_paths, _ in chunks:
+        cum_hazard = None
+        if wrong_way:
+            # each month's hazard moves with the adverse FX move (local-currency depreciation, in standard deviations)
+            # up to the start of that month, so the default time never depends on FX after it
+            before = np.concatenate([np.zeros((len(log_paths), 1, len(sigma))), log_paths[:, :-1]], axis=1)[:, :, group_ccy]
+            sd = sigma[group_ccy] * np.sqrt(np.arange(months))[:, None]
+            shock = -np.divide(before, sd, out=np.zeros(before.shape), where=sd > 0)
+            pd_month = adjust_pd_for_fx(pd_group, shock, wrong_way)
+            cum_hazard = np.cumsum(-np.log1p(-pd_month) / 12, axis=1)
+        for rng, lo, hi in copula.segments(start + offset, len(log_paths)):
+            rows = slice(lo - start - offset, hi - start - offset)
+            path, obligor, t = _defaults(rng, hi - lo, book, loadings, None if cum_hazard is None else cum_hazard[rows], group, tenor_years)
+            path += rows.start
+            ccy = book.currency[obligor]
+            month = np.minimum((t * 12).astype(int), months - 1)
+            st = (s0.values[ccy] * np.exp(log_paths[path, month, ccy])).astype(dtype, copy=False)
+            s_0, notional = s0.values[ccy], book.notional[obligor]
+            if phase == "phase1":
+                mtm = blend_ccs_ndf(mtm_phase1(notional, s_0, st, carry[ccy], t), mtm_phase1(notional, s_0, st, carry[ccy], 0.5 * t), ccs_weight)
+            else:
+                mtm = mtm_phase0(notional, s_0, st)
+            out.append(DefaultPairs(path + start + offset, obligor, t, (book.lgd[obligor] * mtm).astype(dtype, copy=False)))
+    return DefaultPairs.concat(out)
@@ -6,9 +6,10 @@ from .contract import GuaranteeContract
 
 
 def apply_tranche(raw_loss: np.ndarray, notional: float, c: GuaranteeContract) -> np.ndarray:
-    att = c.attachment * notional
-    det = c.detachment * notional
-    lim = c.limit_pct * notional
+    # Python floats, so the losses keep the dtype of ``raw_loss``
+    att = float(c.attachment * notional)
+    det = float(c.detachment * notional)
+    lim = float(c.limit_pct * notional)
     clipped = np.clip(raw_loss - att, 0.0, max(det - att, 0.0))
     return np.minimum(clipped, lim)
 
@@ -19,8 +20,40 @@ def payout_distribution(
     notional: float,
     contract: GuaranteeContract,
 ) -> np.ndarray:
+    # in place on a fresh array, so float32 MTM gives float32 losses
+    raw = np.maximum(mtm_at_default, 0.0)
+    raw *= float(contract.coverage_pct)
     if contract.mode == "default_triggered":
-        raw = default_flags * np.maximum(mtm_at_default, 0.0) * contract.coverage_pct
-    else:
-        raw = np.maximum(mtm_at_default, 0.0) * contract.coverage_pct
+        raw *= default_flags
     return apply_tranche(raw, notional, contract)
+
+
+def tranche_derivatives(raw_loss: np.ndarray, notional: float, c: GuaranteeContract) -> dict[str, np.ndarray]:
+    # pathwise derivatives of apply_tranche: per unit of raw loss, and per unit of attachment / detachment / limit
+    # (fractions of notional); zero on the flat pieces, kinks are measure-zero
+    att = float(c.attachment * notional)
+    width = max(float(c.detachment * notional) - att, 0.0)
+    lim = float(c.limit_pct * notional)
+    u = np.asarray(raw_loss) - att
+    clipped = np.clip(u, 0.0, width)
+    return {
+        "raw": ((u > 0) & (u < width) & (u < lim)).astype(float),
+        "attachment": -notional * ((u > 0) & (width > 0) & (clipped < lim)),
+        "detachment": notional * ((u > width) & (width > 0) & (width < lim)),
+        "limit_pct": notional * (clipped > lim),
+    }
+
+
+def payout_derivatives(
+    mtm_at_default: np.ndarray,
+    default_flags: np.ndarray,
+    notional: float,
+    contract: GuaranteeContract,
+) -> dict[str, np.ndarray]:
+    # per-path dL/d(MTM) and dL/d(contract term) alongside payout_distribution
+    positive = np.maximum(mtm_at_default, 0.0).astype(float)
+    if contract.mode == "default_triggered":
+        positive *= default_flags
+    d = tranche_derivatives(positive * contract.coverage_pct, notional, contract)
+    raw = d.pop("raw")
+    return {"mtm": raw * contract.coverage_pct * (positive > 0), "coverage_pct": raw * positive, **d}
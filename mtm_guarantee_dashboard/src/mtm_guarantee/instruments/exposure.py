@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from mtm_guarantee.capital.loss_dist import QuantileSketchArray
+from mtm_guarantee.instruments.ccs import ccs_mtm_proxy
+from mtm_guarantee.instruments.mtm_proxy import portfolio_mtm
+from mtm_guarantee.instruments.ndf import ndf_mtm_proxy
+from mtm_guarantee.market.simulation import DEFAULT_BLOCK_LENGTH, DEFAULT_CHUNK_SIZE, iter_log_paths
+from mtm_guarantee.rng import RngStreams
+
+EXPOSURE_INSTRUMENTS = ("blend", "ccs", "ndf")
+PFE_LEVELS = (0.95, 0.99)
+
+
+@dataclass
+class ExposureProfile:
+    currencies: list[str]
+    months: np.ndarray
+    ee: np.ndarray
+    pfe: dict[float, np.ndarray]
+    epe: np.ndarray
+
+    def to_frame(self) -> pd.DataFrame:
+        # long frame: month, currency (plus "total"), EE and one PFE column per level
+        cols = self.currencies + ["total"]
+        frame = pd.DataFrame({"month": np.repeat(self.months, len(cols)), "currency": np.tile(cols, len(self.months)), "EE": self.ee.ravel()})
+        for q, v in self.pfe.items():
+            frame[f"PFE{round(q * 100)}"] = v.ravel()
+        frame["EPE"] = np.tile(self.epe, len(self.months))
+        return frame
+
+
+def grid_exposure(
+    fx_at: np.ndarray,
+    s0: np.ndarray,
+    notional: float,
+    weights: np.ndarray,
+    carry: np.ndarray,
+    t_years: np.ndarray,
+    instrument: str = "blend",
+    phase: str = "phase1",
+    ccs_weight: float = 1.0,
+) -> np.ndarray:
+    # (n, months, n_ccy) FX on the monthly grid -> (n, months, n_ccy + 1) exposures, last column the portfolio total
+    if instrument == "blend":
+        per_ccy, total = portfolio_mtm(fx_at, s0, notional, weights, carry, t_years, phase, ccs_weight, out=fx_at)
+    elif instrument in ("ccs", "ndf"):
+        # the proxies add their own carry uplift to the pure FX (phase0) leg
+        base, _ = portfolio_mtm(fx_at, s0, notional, weights, carry, t_years, "phase0", out=fx_at)
+        proxy = ccs_mtm_proxy if instrument == "ccs" else ndf_mtm_proxy
+        per_ccy = proxy(base, carry, np.asarray(t_years, dtype=float)[:, None])
+        total = per_ccy.sum(axis=-1)
+    else:
+        raise ValueError(f"Unknown exposure instrument '{instrument}'. Expected one of {EXPOSURE_INSTRUMENTS}.")
+    return np.concatenate([per_ccy, total[..., None]], axis=-1)
+
+
+def exposure_profile(
+    returns: pd.DataFrame,
+    s0: pd.Series,
+    notional: float,
+    weights: np.ndarray,
+    carry: np.ndarray,
+    tenor_years: int,
+    n_paths: int,
+    mode: str = "historical",
+    corr_stress: float = 1.0,
+    instrument: str = "blend",
+    phase: str = "phase1",
+    ccs_weight: float = 1.0,
+    streams: RngStreams | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    variance_reduction: str = "none",
+    fx_tilt: float = 0.0,
+    alpha: float = 0.01,
+    block_length: float = DEFAULT_BLOCK_LENGTH,
+    dtype: type = np.float64,
+) -> ExposureProfile:
+    # MTM on every monthly grid point, reduced chunk by chunk: memory is O(months x ccy), not O(paths x months x ccy)
+    months = tenor_years * 12
+    t_years = (np.arange(months) + 1) / 12
+    sketch = QuantileSketchArray((months, len(s0) + 1), alpha)
+    chunks = iter_log_paths(
+        returns, tenor_years, n_paths, mode, corr_stress, chunk_size=chunk_size, variance_reduction=variance_reduction, fx_tilt=fx_tilt, dtype=dtype, streams=streams, block_length=block_length
+    )
+    for _, log_paths, log_w in chunks:
+        fx_at = np.exp(log_paths, out=log_paths)
+        fx_at *= s0.values
+        exposure = grid_exposure(fx_at, s0.values, notional, weights, carry, t_years, instrument, phase, ccs_weight)
+        sketch.update(exposure, np.exp(log_w) if variance_reduction == "importance" else None)
+    ee = sketch.mean()
+    return ExposureProfile(list(s0.index), np.arange(1, months + 1), ee, {q: sketch.quantile(q) for q in PFE_LEVELS}, ee.mean(axis=0))
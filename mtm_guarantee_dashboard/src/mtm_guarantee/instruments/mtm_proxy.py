@@ -3,15 +3,58 @@ from __future__ import annotations
 import numpy as np
 
 
+def float_dtype(a: np.ndarray) -> np.dtype:
+    # float32 FX keeps the MTM arithmetic in float32; anything else computes in float64
+    return np.dtype(np.float32) if np.asarray(a).dtype == np.float32 else np.dtype(np.float64)
+
+
 def mtm_phase0(notional: float, s0: np.ndarray, st: np.ndarray) -> np.ndarray:
-    return notional * np.maximum(s0 / st - 1.0, 0.0)
+    dt = float_dtype(st)
+    return np.asarray(notional, dtype=dt) * np.maximum(np.asarray(s0, dtype=dt) / st - 1.0, 0.0)
 
 
 def mtm_phase1(notional: float, s0: np.ndarray, st: np.ndarray, carry: np.ndarray, t_years: float) -> np.ndarray:
-    fx_leg = np.maximum(s0 / st - 1.0, 0.0)
-    carry_adj = np.exp(carry * t_years) - 1.0
-    return notional * np.maximum(fx_leg + 0.5 * carry_adj, 0.0)
+    dt = float_dtype(st)
+    fx_leg = np.maximum(np.asarray(s0, dtype=dt) / st - 1.0, 0.0)
+    carry_adj = np.exp(np.asarray(carry, dtype=dt) * np.asarray(t_years, dtype=dt)) - 1.0
+    return np.asarray(notional, dtype=dt) * np.maximum(fx_leg + 0.5 * carry_adj, 0.0)
 
 
 def blend_ccs_ndf(ccs_mtm: np.ndarray, ndf_mtm: np.ndarray, ccs_weight: float) -> np.ndarray:
     return ccs_weight * ccs_mtm + (1.0 - ccs_weight) * ndf_mtm
+
+
+def portfolio_mtm(
+    fx_at: np.ndarray,
+    s0: np.ndarray,
+    notional: float,
+    weights: np.ndarray,
+    carry: np.ndarray,
+    t_years: np.ndarray,
+    phase: str = "phase1",
+    ccs_weight: float = 1.0,
+    out: np.ndarray | None = None,
+    total: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    # all currencies and both CCS/NDF legs on an (..., n_ccy) FX array; returns (per_ccy, weighted_total)
+    dt = float_dtype(fx_at)
+    fx_leg = np.divide(np.asarray(s0, dtype=dt), fx_at, out=out)
+    fx_leg -= 1.0
+    np.maximum(fx_leg, 0.0, out=fx_leg)
+    if phase == "phase1":
+        ct = np.multiply.outer(np.asarray(t_years, dtype=dt), np.asarray(carry, dtype=dt))
+        ndf = np.exp(0.5 * ct)
+        ndf -= 1.0
+        ndf *= 0.5
+        ndf = np.add(ndf, fx_leg, out=ndf if ndf.shape == fx_leg.shape else None)  # t_years may be a grid shared by all paths
+        np.maximum(ndf, 0.0, out=ndf)
+        ndf *= 1.0 - ccs_weight
+        np.exp(ct, out=ct)
+        ct -= 1.0
+        ct *= 0.5
+        np.add(fx_leg, ct, out=fx_leg)
+        np.maximum(fx_leg, 0.0, out=fx_leg)
+        fx_leg *= ccs_weight
+        fx_leg += ndf
+    fx_leg *= (notional * np.asarray(weights, dtype=float)).astype(dt)
+    return fx_leg, np.sum(fx_leg, axis=-1, out=total)
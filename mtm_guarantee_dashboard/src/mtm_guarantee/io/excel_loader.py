@@ -1,8 +1,23 @@
 from __future__ import annotations
 
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
 import pandas as pd
 
 from mtm_guarantee.config import DEFAULT_CURRENCIES, EXCEL_MAPPING
+from mtm_guarantee.io import market_cache
+from mtm_guarantee.profiling import profiled, span
+
+
+OBLIGOR_COLUMNS = ("obligor", "currency", "notional", "pd", "lgd")
+OBLIGOR_CACHE_SIZE = 8
+
+_obligor_books: OrderedDict[str, pd.DataFrame] = OrderedDict()
+_obligor_lock = threading.Lock()
 
 
 class ExcelMappingError(ValueError):
@@ -18,8 +33,7 @@ def _find_rate_sheet(xls: pd.ExcelFile, candidates: list[str]) -> str:
     )
 
 
-def load_market_data(excel_path: str, currencies: list[str] | None = None) -> tuple[pd.DataFrame, pd.DataFrame, list[str]]:
-    currencies = currencies or DEFAULT_CURRENCIES
+def read_workbook(excel_path: str) -> tuple[pd.DataFrame, pd.DataFrame]:
     xls = pd.ExcelFile(excel_path)
     if EXCEL_MAPPING["fx_sheet"] not in xls.sheet_names:
         raise ExcelMappingError(
@@ -46,9 +60,7 @@ def load_market_data(excel_path: str, currencies: list[str] | None = None) -> tu
             fx = fx.rename(columns={num_cols[0]: "fx"})
 
     fx = fx.dropna(subset=["date", "currency", "fx"])
-    fx = fx[fx["currency"].isin(currencies)].sort_values(["currency", "date"])
-    present = sorted(fx["currency"].unique().tolist())
-    missing = sorted(set(currencies) - set(present))
+    fx = fx[["currency", "date", "fx"]].sort_values(["currency", "date"], kind="stable").reset_index(drop=True)
 
     rate_sheet = _find_rate_sheet(xls, EXCEL_MAPPING["rate_sheet_candidates"])
     rates = pd.read_excel(xls, rate_sheet)
@@ -56,6 +68,64 @@ def load_market_data(excel_path: str, currencies: list[str] | None = None) -> tu
     if "Date" not in rates.columns:
         rates = rates.rename(columns={rates.columns[0]: "Date"})
     rates["Date"] = pd.to_datetime(rates["Date"], errors="coerce")
-    rates = rates.dropna(subset=["Date"])
+    rates = rates.dropna(subset=["Date"]).reset_index(drop=True)
+
+    return fx, rates
+
 
+@profiled("load_market_data")
+def load_market_data(
+    excel_path: str, currencies: list[str] | None = None, cache_dir: str | None = None
+) -> tuple[pd.DataFrame, pd.DataFrame, list[str]]:
+    currencies = currencies or DEFAULT_CURRENCIES
+    if not Path(excel_path).exists():
+        raise FileNotFoundError(f"Workbook not found: {excel_path}")
+    with span("market_cache_read"):
+        cached = market_cache.read_entry(excel_path, cache_dir) if cache_dir else None
+    if cached is None:
+        with span("read_workbook"):
+            cached = read_workbook(excel_path)
+        if cache_dir:
+            with span("market_cache_write"):
+                market_cache.write_entry(excel_path, *cached, cache_dir=cache_dir)
+    fx, rates = cached
+
+    fx = fx[fx["currency"].isin(currencies)].reset_index(drop=True)
+    present = sorted(fx["currency"].unique().tolist())
+    missing = sorted(set(currencies) - set(present))
     return fx, rates, missing
+
+
+def _parse_obligor_book(path: str, data: bytes) -> pd.DataFrame:
+    if Path(path).suffix.lower() == ".csv":
+        book = pd.read_csv(io.BytesIO(data))
+    else:
+        xls = pd.ExcelFile(io.BytesIO(data))
+        sheet = EXCEL_MAPPING["obligor_sheet"]
+        book = pd.read_excel(xls, sheet if sheet in xls.sheet_names else xls.sheet_names[0])
+    book.columns = [str(c).strip().lower() for c in book.columns]
+    missing = [c for c in OBLIGOR_COLUMNS if c not in book.columns]
+    if missing:
+        raise ExcelMappingError(f"Obligor book {path} is missing columns {missing}; expected {list(OBLIGOR_COLUMNS)}.")
+    book = book[list(OBLIGOR_COLUMNS)].dropna().reset_index(drop=True)
+    book["obligor"] = book["obligor"].astype(str)
+    return book
+
+
+def read_obligor_book(path: str) -> pd.DataFrame:
+    # CSV, or the Obligors sheet (else the first sheet) of a workbook; parsed again only when the bytes change
+    if not Path(path).exists():
+        raise FileNotFoundError(f"Obligor book not found: {path}")
+    data = Path(path).read_bytes()
+    key = hashlib.sha256(data + Path(path).suffix.lower().encode()).hexdigest()
+    with _obligor_lock:
+        if key in _obligor_books:
+            _obligor_books.move_to_end(key)
+            return _obligor_books[key]
+    book = _parse_obligor_book(str(path), data)
+    with _obligor_lock:
+        book = _obligor_books.setdefault(key, book)
+        _obligor_books.move_to_end(key)
+        while len(_obligor_books) > OBLIGOR_CACHE_SIZE:
+            _obligor_books.popitem(last=False)
+    return book
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from mtm_guarantee.config import EXCEL_MAPPING, MARKET_CACHE_DIR
+
+CACHE_VERSION = 1
+
+
+def _path_id(excel_path: str) -> str:
+    return hashlib.sha256(str(Path(excel_path).resolve()).encode()).hexdigest()[:16]
+
+
+def cache_key(excel_path: str) -> str:
+    st = os.stat(excel_path)
+    payload = json.dumps([CACHE_VERSION, str(Path(excel_path).resolve()), st.st_mtime_ns, st.st_size, EXCEL_MAPPING], sort_keys=True)
+    return f"{_path_id(excel_path)}-{hashlib.sha256(payload.encode()).hexdigest()[:16]}"
+
+
+def _encode_column(s: pd.Series) -> tuple[dict, np.ndarray]:
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return {"kind": "datetime"}, s.values.astype("datetime64[ns]").view("int64")
+    if pd.api.types.is_numeric_dtype(s):
+        return {"kind": "numeric"}, s.to_numpy()
+    codes, uniques = pd.factorize(s.astype(str))
+    return {"kind": "category", "categories": uniques.tolist()}, codes.astype(np.int32)
+
+
+def _write_frame(folder: Path, df: pd.DataFrame) -> list[dict]:
+    cols = []
+    for i, name in enumerate(df.columns):
+        col, arr = _encode_column(df[name])
+        col.update(name=str(name), file=f"{i}.npy")
+        np.save(folder / col["file"], arr)
+        cols.append(col)
+    return cols
+
+
+def _read_frame(folder: Path, cols: list[dict]) -> pd.DataFrame:
+    data = {}
+    for col in cols:
+        arr = np.load(folder / col["file"], mmap_mode="r")
+        if col["kind"] == "datetime":
+            data[col["name"]] = np.asarray(arr).view("datetime64[ns]")
+        elif col["kind"] == "category":
+            data[col["name"]] = np.asarray(col["categories"], dtype=object)[arr]
+        else:  # numeric columns stay memory-mapped
+            data[col["name"]] = arr
+    return pd.DataFrame(data)
+
+
+def write_entry(excel_path: str, fx: pd.DataFrame, rates: pd.DataFrame, cache_dir: str = MARKET_CACHE_DIR) -> Path:
+    root = Path(cache_dir)
+    root.mkdir(parents=True, exist_ok=True)
+    target = root / cache_key(excel_path)
+    tmp = Path(tempfile.mkdtemp(dir=root, prefix=".tmp-"))
+    meta = {"version": CACHE_VERSION, "source": str(Path(excel_path).resolve())}
+    for name, df in (("fx", fx), ("rates", rates)):
+        (tmp / name).mkdir()
+        meta[name] = _write_frame(tmp / name, df)
+    (tmp / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    try:
+        os.replace(tmp, target)
+    except OSError:
+        # another process published the same entry first
+        shutil.rmtree(tmp, ignore_errors=True)
+    return target
+
+
+def read_entry(excel_path: str, cache_dir: str = MARKET_CACHE_DIR) -> tuple[pd.DataFrame, pd.DataFrame] | None:
+    folder = Path(cache_dir) / cache_key(excel_path)
+    if not (folder / "meta.json").exists():
+        return None
+    meta = json.loads((folder / "meta.json").read_text(encoding="utf-8"))
+    return _read_frame(folder / "fx", meta["fx"]), _read_frame(folder / "rates", meta["rates"])
+
+
+def invalidate(excel_path: str, cache_dir: str = MARKET_CACHE_DIR) -> int:
+    removed = 0
+    for entry in Path(cache_dir).glob(f"{_path_id(excel_path)}-*"):
+        shutil.rmtree(entry, ignore_errors=True)
+        removed += 1
+    return removed
+
+
+def main(argv: list[str] | None = None) -> None:
+    from mtm_guarantee.io.excel_loader import load_market_data
+
+    p = argparse.ArgumentParser(description="Manage the columnar market-data cache.")
+    p.add_argument("command", choices=["rebuild", "invalidate"])
+    p.add_argument("excel")
+    p.add_argument("--cache-dir", default=MARKET_CACHE_DIR)
+    args = p.parse_args(argv)
+    removed = invalidate(args.excel, args.cache_dir)
+    print(f"Removed {removed} cache entries for {args.excel}")
+    if args.command == "rebuild":
+        load_market_data(args.excel, cache_dir=args.cache_dir)
+        print(f"Rebuilt {Path(args.cache_dir) / cache_key(args.excel)}")
+
+
+if __name__ == "__main__":
+    main()
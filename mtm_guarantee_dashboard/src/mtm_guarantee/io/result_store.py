@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from mtm_guarantee.cache import stable_key
+from mtm_guarantee.config import RESULT_STORE_BYTES, RESULT_STORE_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+STORE_VERSION = 1
+STALE_TMP_SECONDS = 3600  # unpublished writer folders older than this are left over from crashed processes
+
+
+@lru_cache(maxsize=1)
+def code_version() -> str:
+    # hash of the package sources, so entries written by different code are never reused
+    h = hashlib.sha256(str(STORE_VERSION).encode())
+    root = Path(__file__).resolve().parents[1]
+    for path in sorted(root.rglob("*.py")):
+        h.update(path.relative_to(root).as_posix().encode())
+        h.update(path.read_bytes())
+    return h.hexdigest()[:16]
+
+
+def _touch(path: Path) -> None:
+    # explicit high-resolution timestamp: the filesystem's own write times can be coarser than back-to-back runs
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    # exclusive lock shared by every process using the store (flock on POSIX, a locked byte on Windows)
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ResultStore:
+    # content-addressed entries on disk, shared across sessions and processes: one folder per (key, code version)
+    # holding .npy arrays (memory-mapped on read) and meta.json. Writers build the folder under a temporary name and
+    # publish it with an atomic rename; least recently read entries are evicted beyond ``max_bytes``.
+    def __init__(self, root: str | Path = RESULT_STORE_DIR, max_bytes: int = RESULT_STORE_BYTES, version: str | None = None):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.version = version or code_version()
+        self.hits = 0
+        self.misses = 0
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _entry(self, key: str) -> Path:
+        return self.root / stable_key(key, self.version)[:32]
+
+    def __contains__(self, key: str) -> bool:
+        return (self._entry(key) / "meta.json").exists()
+
+    def get(self, key: str) -> tuple[dict[str, np.ndarray], dict] | None:
+        folder = self._entry(key)
+        try:
+            meta = json.loads((folder / "meta.json").read_text(encoding="utf-8"))
+            arrays = {name: np.load(folder / f"{name}.npy", mmap_mode="r") for name in meta["arrays"]}
+            _touch(folder / "meta.json")  # read recency drives eviction
+        except (OSError, ValueError):
+            # missing, evicted while reading, or partially deleted
+            self.misses += 1
+            return None
+        self.hits += 1
+        return arrays, meta
+
+    def put(self, key: str, arrays: dict[str, np.ndarray], meta: dict | None = None) -> Path:
+        folder = self._entry(key)
+        if (folder / "meta.json").exists():
+            return folder
+        tmp = Path(tempfile.mkdtemp(dir=self.root, prefix=".tmp-"))
+        for name, arr in arrays.items():
+            np.save(tmp / f"{name}.npy", np.ascontiguousarray(arr))
+        nbytes = sum(f.stat().st_size for f in tmp.iterdir())
+        # meta.json last: a folder without it is never read
+        meta = {**(meta or {}), "key": key, "version": self.version, "arrays": list(arrays), "nbytes": nbytes, "created": time.time()}
+        (tmp / "meta.json").write_text(json.dumps(meta, default=str), encoding="utf-8")
+        _touch(tmp / "meta.json")
+        with file_lock(self.root / ".lock"):
+            try:
+                os.replace(tmp, folder)
+            except OSError:
+                # another process published the same entry first
+                shutil.rmtree(tmp, ignore_errors=True)
+            self._evict(keep=folder)
+        return folder
+
+    def entries(self) -> list[dict]:
+        # published entries, least recently read first
+        out = []
+        for folder in self.root.iterdir():
+            meta_path = folder / "meta.json"
+            if folder.name.startswith(".") or not meta_path.exists():
+                continue
+            try:
+                meta = json.loads(meta_path.read_text(encoding="utf-8"))
+                out.append({**meta, "path": folder, "last_read": meta_path.stat().st_mtime})
+            except (OSError, ValueError):
+                continue
+        return sorted(out, key=lambda e: e["last_read"])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(e["nbytes"] for e in self.entries())
+
+    def _evict(self, keep: Path | None = None) -> None:
+        # caller holds the store lock
+        now = time.time()
+        for tmp in self.root.glob(".tmp-*"):
+            if now - tmp.stat().st_mtime > STALE_TMP_SECONDS:
+                shutil.rmtree(tmp, ignore_errors=True)
+        entries = self.entries()
+        total = sum(e["nbytes"] for e in entries)
+        for e in entries:
+            if total <= self.max_bytes:
+                break
+            if e["path"] != keep:
+                shutil.rmtree(e["path"], ignore_errors=True)
+                total -= e["nbytes"]
+
+    def clear(self) -> int:
+        with file_lock(self.root / ".lock"):
+            entries = self.entries()
+            for e in entries:
+                shutil.rmtree(e["path"], ignore_errors=True)
+        return len(entries)
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Inspect or clear the on-disk simulation result store.")
+    p.add_argument("command", choices=["list", "clear"])
+    p.add_argument("--store-dir", default=RESULT_STORE_DIR)
+    args = p.parse_args(argv)
+    store = ResultStore(args.store_dir)
+    if args.command == "clear":
+        print(f"Removed {store.clear()} entries from {store.root}")
+        return
+    for e in reversed(store.entries()):
+        current = "" if e["version"] == store.version else " (stale code version)"
+        print(f"{e['path'].name} {e['nbytes'] / 1024**2:8.1f} MB {json.dumps(e.get('metrics', {}))}{current}")
+
+
+if __name__ == "__main__":
+    main()
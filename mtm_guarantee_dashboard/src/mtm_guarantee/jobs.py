@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+from mtm_guarantee.cache import ResultCache
+from mtm_guarantee.capital.loss_dist import standard_errors, var_es
+from mtm_guarantee.guarantee.payout import payout_distribution
+from mtm_guarantee.io.result_store import ResultStore
+from mtm_guarantee.market.fx import MarketData, as_market_data
+from mtm_guarantee.market.rates import rate_differentials
+from mtm_guarantee.pipeline import (
+    MarketCreditStage,
+    assemble_stage,
+    contract_from_inputs,
+    lookup_stage,
+    market_credit_key,
+    returns_and_spot,
+    save_stage,
+    simulate_path_range,
+)
+from mtm_guarantee.rng import RNG_BLOCK_SIZE
+from mtm_guarantee.sampling import variance_reduction_groups
+
+JOB_CHUNK_PATHS = 5 * RNG_BLOCK_SIZE
+MAX_JOB_CHUNKS = 40  # caps how often partial estimates re-sort the finished paths
+JOB_STATES = ("queued", "running", "done", "cancelled", "failed")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+@dataclass
+class PartialEstimate:
+    # running estimate after ``paths`` of ``total`` paths; CIs are normal intervals from the delta-method errors
+    paths: int
+    total: int
+    el: float
+    el_ci: tuple[float, float]
+    es: float
+    es_ci: tuple[float, float]
+
+    @property
+    def fraction(self) -> float:
+        return self.paths / self.total if self.total else 1.0
+
+
+class SimulationJob:
+    # handle on one market/credit stage being simulated chunk by chunk in the background
+    def __init__(self, key: str, total_paths: int):
+        self.key = key
+        self.total_paths = total_paths
+        self.future: Future | None = None
+        self.partial: PartialEstimate | None = None
+        self.error: BaseException | None = None
+        self._cancel = threading.Event()
+        self._started = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def state(self) -> str:
+        if self.future is None or not self._started.is_set():
+            return "cancelled" if self.cancel_requested else "queued"
+        if not self.future.done():
+            return "running"
+        if self.error is not None:
+            return "cancelled" if isinstance(self.error, JobCancelled) else "failed"
+        return "done"
+
+    @property
+    def fraction(self) -> float:
+        return 1.0 if self.state == "done" else (self.partial.fraction if self.partial else 0.0)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        # True once the job has finished (done, cancelled or failed)
+        return self.future is None or bool(wait([self.future], timeout).done)
+
+    def result(self, timeout: float | None = None) -> MarketCreditStage:
+        return self.future.result(timeout)
+
+
+def partial_estimate(parts: list[tuple], inputs: dict, total: int, z: float = norm.ppf(0.975)) -> PartialEstimate:
+    # EL / ES over the paths finished so far, with the contract as submitted
+    weighted_mtm, flags, log_w = (np.concatenate([p[i] for p in parts]) for i in (0, 2, 4))
+    losses = payout_distribution(weighted_mtm, flags, inputs["portfolio_notional"], contract_from_inputs(inputs))
+    weights = np.exp(log_w - log_w.max()) if inputs["variance_reduction"] == "importance" else None
+    el, _, es = var_es(losses, inputs["capital_confidence"], weights)
+    se = standard_errors(losses, inputs["capital_confidence"], weights, variance_reduction_groups(len(losses), inputs["variance_reduction"]))
+    return PartialEstimate(len(losses), total, el, (el - z * se["el"], el + z * se["el"]), es, (es - z * se["es"], es + z * se["es"]))
+
+
+class JobRunner:
+    # one background thread simulating stages in RNG-block-aligned chunks; finished stages go into ``cache`` (and
+    # ``store``), so a later run_model(..., cache) with the same market inputs only reprices, whatever the contract
+    # inputs are by then. Stages already in the store are loaded instead of simulated.
+    def __init__(self, cache: ResultCache, max_workers: int = 1, chunk_paths: int = JOB_CHUNK_PATHS, store: ResultStore | None = None):
+        self.cache = cache
+        self.store = store
+        self.chunk_paths = max(RNG_BLOCK_SIZE, chunk_paths // RNG_BLOCK_SIZE * RNG_BLOCK_SIZE)
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mtm-sim")
+        self.jobs: dict[str, SimulationJob] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> SimulationJob | None:
+        return self.jobs.get(key)
+
+    def submit(self, fx: pd.DataFrame | MarketData, rates: pd.DataFrame, weights: dict[str, float], inputs: dict) -> SimulationJob:
+        # an identical queued/running job, or a done one whose stage is still cached, is reused rather than rerun
+        fx = as_market_data(fx)
+        key = market_credit_key(fx, rates, weights, inputs)
+        with self._lock:
+            job = self.jobs.get(key)
+            if job is not None and (job.state in ("queued", "running") or (job.state == "done" and key in self.cache)):
+                return job
+            job = self.jobs[key] = SimulationJob(key, int(inputs["paths"]))
+            # the submitter's context, so spans land in its profiler (one per dashboard session)
+            job.future = self.pool.submit(contextvars.copy_context().run, self._run, job, fx, rates, dict(weights), dict(inputs))
+        return job
+
+    def _run(self, job: SimulationJob, fx: MarketData, rates: pd.DataFrame, weights: dict[str, float], inputs: dict) -> MarketCreditStage:
+        job._started.set()
+        try:
+            stage = lookup_stage(job.key, self.cache, self.store)
+            if stage is not None:
+                return stage
+            fxr, s0 = returns_and_spot(fx)
+            w = np.array([weights[c] for c in s0.index])
+            carry = rate_differentials(rates, list(s0.index))
+            n_blocks = -(-job.total_paths // RNG_BLOCK_SIZE)
+            chunk = max(self.chunk_paths, -(-n_blocks // MAX_JOB_CHUNKS) * RNG_BLOCK_SIZE)
+            parts = []
+            for lo in range(0, job.total_paths, chunk):
+                if job.cancel_requested:
+                    raise JobCancelled(job.key)
+                parts.append(simulate_path_range(fxr, s0, carry, w, inputs, lo, min(lo + chunk, job.total_paths)))
+                job.partial = partial_estimate(parts, inputs, job.total_paths)
+            return save_stage(job.key, assemble_stage(s0, w, inputs, parts), inputs, self.cache, self.store)
+        except BaseException as e:
+            job.error = e
+            raise
+
+    def shutdown(self) -> None:
+        for job in self.jobs.values():
+            job.cancel()
+        self.pool.shutdown(wait=True)
@@ -1,11 +1,82 @@
 from __future__ import annotations
 
+import hashlib
+import threading
+from collections import OrderedDict
+
 import numpy as np
 import pandas as pd
 
+FACTOR_CACHE_SIZE = 64
+
+_factor_cache: OrderedDict[tuple[str, float], np.ndarray] = OrderedDict()
+_factor_lock = threading.Lock()  # shared by every session thread and simulation job
+
+
+def stress_correlation(corr: np.ndarray, stress: float = 1.0) -> np.ndarray:
+    # off-diagonal correlations scaled by ``stress``; may leave the PSD cone, see nearest_psd
+    ident = np.eye(len(corr))
+    return ident + (corr - ident) * stress
+
 
 def stressed_corr(returns: pd.DataFrame, stress: float = 1.0) -> pd.DataFrame:
     corr = returns.corr().fillna(0.0)
-    ident = np.eye(len(corr))
-    stressed = ident + (corr.values - ident) * stress
-    return pd.DataFrame(stressed, index=corr.index, columns=corr.columns)
+    return pd.DataFrame(stress_correlation(corr.values, stress), index=corr.index, columns=corr.columns)
+
+
+def nearest_psd(corr: np.ndarray, eps: float = 1e-10) -> np.ndarray:
+    # clip negative eigenvalues and rescale back to a unit diagonal
+    sym = (corr + corr.T) / 2
+    vals, vecs = np.linalg.eigh(sym)
+    if vals.min() >= eps:
+        return sym
+    fixed = (vecs * np.clip(vals, eps, None)) @ vecs.T
+    d = np.sqrt(np.diag(fixed))
+    return fixed / np.outer(d, d)
+
+
+def psd_factor(corr: np.ndarray) -> np.ndarray:
+    # lower-triangular L with L @ L.T == nearest_psd(corr)
+    psd = nearest_psd(corr)
+    try:
+        return np.linalg.cholesky(psd)
+    except np.linalg.LinAlgError:
+        return np.linalg.cholesky(nearest_psd(psd, 1e-8))
+
+
+def correlation_factor(corr: np.ndarray, stress: float = 1.0) -> np.ndarray:
+    # factor of an already estimated correlation matrix, e.g. one backtest window
+    return psd_factor(stress_correlation(corr, stress))
+
+
+def returns_hash(returns: pd.DataFrame) -> str:
+    h = hashlib.sha256(",".join(map(str, returns.columns)).encode())
+    h.update(np.ascontiguousarray(returns.values, dtype=float).tobytes())
+    return h.hexdigest()
+
+
+def cholesky_factor(returns: pd.DataFrame, stress: float = 1.0) -> np.ndarray:
+    # lower-triangular L with L @ L.T == nearest_psd(stressed_corr(returns, stress)), cached per (returns, stress)
+    key = (returns_hash(returns), float(stress))
+    with _factor_lock:
+        if key in _factor_cache:
+            _factor_cache.move_to_end(key)
+            return _factor_cache[key]
+    factor = psd_factor(stressed_corr(returns, stress).values)  # outside the lock; a racing thread computes the same
+    factor.setflags(write=False)
+    with _factor_lock:
+        factor = _factor_cache.setdefault(key, factor)
+        _factor_cache.move_to_end(key)
+        while len(_factor_cache) > FACTOR_CACHE_SIZE:
+            _factor_cache.popitem(last=False)
+    return factor
+
+
+def correlated_shocks(
+    rng: np.random.Generator, mu: np.ndarray, sigma: np.ndarray, factor: np.ndarray, size: tuple[int, ...], dtype: type = np.float64
+) -> np.ndarray:
+    z = rng.standard_normal(size + (len(mu),), dtype=dtype)
+    shocks = z @ factor.T.astype(dtype, copy=False)
+    shocks *= sigma.astype(dtype, copy=False)
+    shocks += mu.astype(dtype, copy=False)
+    return shocks
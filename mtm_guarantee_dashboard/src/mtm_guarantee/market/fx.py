@@ -1,17 +1,83 @@
 from __future__ import annotations
 
+from functools import cached_property
+
 import numpy as np
 import pandas as pd
 
+from mtm_guarantee.cache import frame_fingerprint, stable_key
+
+
+def _inverted_currencies(inverted: dict[str, bool] | None) -> set[str]:
+    return {c for c, flag in (inverted or {}).items() if flag}
+
 
 def apply_quote_convention(fx_df: pd.DataFrame, inverted: dict[str, bool]) -> pd.DataFrame:
     out = fx_df.copy()
-    out["fx_norm"] = out.apply(
-        lambda r: 1.0 / r["fx"] if inverted.get(r["currency"], False) else r["fx"], axis=1
-    )
+    flip = out["currency"].isin(_inverted_currencies(inverted)).to_numpy()
+    fx = out["fx"].to_numpy(dtype=float)
+    out["fx_norm"] = np.where(flip, 1.0 / fx, fx)
     return out
 
 
 def monthly_returns(fx_df: pd.DataFrame) -> pd.DataFrame:
     piv = fx_df.pivot(index="date", columns="currency", values="fx_norm").sort_index()
     return np.log(piv / piv.shift(1)).dropna()
+
+
+class MarketData:
+    # raw quotes pivoted once to a wide date x currency table; inversions flip whole columns of the shared
+    # raw levels / log-returns, and returns, spot and the cache fingerprint are computed lazily per view
+    def __init__(self, raw: pd.DataFrame, inverted: dict[str, bool] | None = None, _shared: dict | None = None):
+        self.raw = raw
+        self.inverted = tuple(c for c in raw.columns if c in _inverted_currencies(inverted))
+        self._shared = {} if _shared is None else _shared
+
+    @classmethod
+    def from_long(cls, fx_df: pd.DataFrame, inverted: dict[str, bool] | None = None) -> MarketData:
+        raw = fx_df.pivot(index="date", columns="currency", values="fx").sort_index().astype(float)
+        return cls(raw, inverted)
+
+    def with_inversions(self, inverted: dict[str, bool]) -> MarketData:
+        return MarketData(self.raw, inverted, self._shared)
+
+    @property
+    def currencies(self) -> list[str]:
+        return list(self.raw.columns)
+
+    @cached_property
+    def sign(self) -> np.ndarray:
+        return np.where(self.raw.columns.isin(self.inverted), -1.0, 1.0)
+
+    @cached_property
+    def levels(self) -> pd.DataFrame:
+        return self.raw.pow(self.sign, axis=1) if self.inverted else self.raw
+
+    @cached_property
+    def returns(self) -> pd.DataFrame:
+        if "returns" not in self._shared:
+            self._shared["returns"] = np.log(self.raw / self.raw.shift(1)).dropna()
+        raw_returns = self._shared["returns"]
+        return raw_returns * self.sign if self.inverted else raw_returns
+
+    @cached_property
+    def s0(self) -> pd.Series:
+        return self.levels.iloc[-1]
+
+    @cached_property
+    def fingerprint(self) -> str:
+        if "fingerprint" not in self._shared:
+            self._shared["fingerprint"] = frame_fingerprint(self.raw.reset_index())
+        return stable_key(self._shared["fingerprint"], self.inverted)
+
+    def long(self) -> pd.DataFrame:
+        out = self.raw.stack().rename("fx").reset_index()
+        out["fx_norm"] = self.levels.stack().to_numpy()
+        return out[["currency", "date", "fx", "fx_norm"]]
+
+
+def as_market_data(fx: pd.DataFrame | MarketData) -> MarketData:
+    # long frames carrying an ``fx_norm`` column are taken as already normalised
+    if isinstance(fx, MarketData):
+        return fx
+    return MarketData(fx.pivot(index="date", columns="currency", values="fx_norm").sort_index().astype(float))
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import numpy as np
 import pandas as pd
 
 
@@ -8,3 +9,22 @@ def get_rate_differential(rates: pd.DataFrame, ccy: str, usd_col: str = "USD") -
     if ccy not in cols or usd_col not in cols:
         return 0.0
     return float((rates[ccy] - rates[usd_col]).dropna().tail(12).mean() / 100.0)
+
+
+def rate_differentials(rates: pd.DataFrame, ccys: list[str], usd_col: str = "USD") -> np.ndarray:
+    return np.array([get_rate_differential(rates, c, usd_col) for c in ccys])
+
+
+def rate_differential_history(rates: pd.DataFrame, ccys: list[str], dates: pd.DatetimeIndex, usd_col: str = "USD") -> np.ndarray:
+    # rate_differentials as they stood at each of ``dates``: trailing 12 observations dated on or before it
+    out = np.zeros((len(dates), len(ccys)))
+    if usd_col not in rates.columns:
+        return out
+    dated = rates.assign(Date=pd.to_datetime(rates["Date"])).sort_values("Date").set_index("Date")
+    for j, c in enumerate(ccys):
+        if c not in dated.columns:
+            continue
+        diff = (dated[c] - dated[usd_col]).dropna()
+        if not diff.empty:
+            out[:, j] = (diff.rolling(12, min_periods=1).mean() / 100.0).asof(dates).fillna(0.0).to_numpy()
+    return out
@@ -1,7 +1,216 @@
 from __future__ import annotations
 
+from typing import Iterator
+
 import numpy as np
 import pandas as pd
+from scipy.stats import norm
+
+from mtm_guarantee.market.correlations import cholesky_factor, correlated_shocks
+from mtm_guarantee.rng import BlockGenerators, RngStreams
+from mtm_guarantee.sampling import SobolReplicates, check_variance_reduction, interleave_antithetic
+
+DEFAULT_CHUNK_SIZE = 2_000
+DEFAULT_BLOCK_LENGTH = 6.0
+SIMULATION_MODES = ("historical", "parametric", "block_bootstrap", "stationary_bootstrap")
+BOOTSTRAP_MODES = ("block_bootstrap", "stationary_bootstrap")
+BOOTSTRAP_VARIANCE_REDUCTION = ("none", "antithetic")  # block draws have no Sobol or importance-sampling form
+PRECISIONS = ("float64", "float32")
+
+
+def path_dtype(precision: str) -> np.dtype:
+    # storage dtype of simulated paths, MTM and losses; float32 halves memory and bandwidth
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}'. Expected one of {PRECISIONS}.")
+    return np.dtype(precision)
+
+
+def sobol_dim(months: int, n_ccy: int, mode: str) -> int:
+    # one joint Sobol point per path: dim 0 is the default uniform, the rest the FX draws. Separately scrambled
+    # sequences at the same index share leading digits, so default and FX must not come from two sequences.
+    return 1 + months * (n_ccy if mode == "parametric" else 1)
+
+
+def cumulate_months(shocks: np.ndarray) -> np.ndarray:
+    # in-place running sum over the month axis, accumulated in float64 whatever the storage dtype
+    if shocks.dtype == np.float64:
+        return np.cumsum(shocks, axis=1, out=shocks)
+    acc = np.zeros((shocks.shape[0], shocks.shape[2]))
+    for m in range(shocks.shape[1]):
+        acc += shocks[:, m]
+        shocks[:, m] = acc
+    return shocks
+
+
+class ShockSampler:
+    # draws (n, months, n_ccy) shock blocks in path order plus per-path log likelihood ratios (importance mode).
+    # With ``streams`` each RNG block of paths has its own generator, so any block-aligned path range is reproducible.
+    def __init__(
+        self,
+        returns: pd.DataFrame,
+        months: int,
+        mode: str = "historical",
+        corr_stress: float = 1.0,
+        seed: int = 42,
+        variance_reduction: str = "none",
+        fx_tilt: float = 0.0,
+        dtype: type = np.float64,
+        streams: RngStreams | None = None,
+        block_length: float = DEFAULT_BLOCK_LENGTH,
+    ):
+        if mode not in SIMULATION_MODES:
+            raise ValueError(f"Unknown simulation mode '{mode}'. Expected one of {SIMULATION_MODES}.")
+        if mode in BOOTSTRAP_MODES and variance_reduction not in BOOTSTRAP_VARIANCE_REDUCTION:
+            raise ValueError("Block bootstrap supports only 'none' or 'antithetic' variance reduction.")
+        self.arr = returns.values.astype(dtype)
+        self.mode = mode
+        self.months = months
+        self.variance_reduction = check_variance_reduction(variance_reduction)
+        self.dtype = dtype
+        self.rng = np.random.default_rng(seed) if streams is None else None
+        self.block_rngs = BlockGenerators(streams, "fx") if streams is not None else None
+        self.mu = returns.mean().values
+        self.sigma = returns.std().values
+        n_ccy = self.arr.shape[1]
+        if mode in BOOTSTRAP_MODES:
+            # prefix sums over the history tiled far enough that any block starting in it fits
+            self.block_length = max(float(block_length), 1.0)
+            reps = -(-months // len(self.arr)) + 1
+            self.prefix = np.concatenate([np.zeros((1, n_ccy)), np.cumsum(np.tile(returns.values, (reps, 1)), axis=0)])
+        if mode == "parametric":
+            # corr_stress scales correlations only; vols stay at their historical level
+            self.corr_factor = cholesky_factor(returns, corr_stress)
+            self.factor = self.sigma[:, None] * self.corr_factor
+        if variance_reduction == "sobol":
+            sobol_seed = seed if streams is None else streams.seed_sequence("sobol")
+            self.sobol = SobolReplicates(sobol_dim(months, n_ccy, mode), sobol_seed)
+        if variance_reduction == "importance":
+            # tilt towards adverse (falling) FX: every currency's monthly mean moves down by fx_tilt standard deviations
+            if mode == "historical":
+                score = ((self.arr - self.mu) / np.where(self.sigma > 0, self.sigma, 1.0)).mean(axis=1)
+                p = np.exp(-fx_tilt * score)
+                self.p = p / p.sum()
+            else:
+                self.shift = np.linalg.lstsq(self.factor, -fx_tilt * self.sigma, rcond=None)[0]
+
+    def _blocks(self, rng: np.random.Generator, n: int) -> tuple[np.ndarray, np.ndarray]:
+        # (n, n_blocks) start offsets and lengths, truncated so every row covers exactly ``months``; fixed blocks
+        # have the configured length, stationary ones are geometric with that mean (Politis-Romano).
+        # One uniform draw per path row, so the stream is consumed identically however paths are chunked.
+        t, months = len(self.arr), self.months
+        if self.mode == "block_bootstrap":
+            size = int(round(self.block_length))
+            n_blocks = -(-months // size)
+            u = rng.random((n, n_blocks))
+            lengths = np.full((n, n_blocks), size)
+        else:
+            n_blocks = int(np.ceil(2 * months / self.block_length)) + 8
+            u = rng.random((n, 2 * n_blocks))
+            p = 1.0 / self.block_length
+            lengths = 1 + np.floor(np.log1p(-u[:, n_blocks:]) / np.log1p(-p)).astype(int) if p < 1 else np.ones((n, n_blocks), dtype=int)
+            # the rare rows still short of the tenor stretch their last block
+            lengths[:, -1] = np.maximum(lengths[:, -1], months - lengths[:, :-1].sum(axis=1))
+        starts = np.minimum((u[:, :n_blocks] * t).astype(int), t - 1)
+        ends = np.minimum(np.cumsum(lengths, axis=1), months)
+        return starts, np.diff(ends, axis=1, prepend=0)
+
+    def _plain(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        if self.mode in BOOTSTRAP_MODES:
+            starts, lengths = self._blocks(rng, n)
+            first = np.cumsum(lengths, axis=1) - lengths
+            idx = np.repeat((starts - first).ravel(), lengths.ravel()).reshape(n, self.months) + np.arange(self.months)
+            return self.arr[idx % len(self.arr), :]
+        if self.mode == "historical":
+            idx = rng.integers(0, self.arr.shape[0], size=(n, self.months))
+            return self.arr[idx, :]
+        return correlated_shocks(rng, self.mu, self.sigma, self.corr_factor, (n, self.months), self.dtype)
+
+    def _draw(self, rng: np.random.Generator, start: int, n: int) -> tuple[np.ndarray, np.ndarray]:
+        log_w = np.zeros(n)
+        if self.variance_reduction == "antithetic":
+            base = self._plain(rng, (n + 1) // 2)
+            return interleave_antithetic(base, (2 * self.mu).astype(self.dtype) - base, n), log_w
+        if self.variance_reduction == "sobol":
+            u = self.sobol.draw(start, n)[:, 1:]  # dim 0 belongs to the default time
+            if self.mode == "historical":
+                idx = np.minimum((u * self.arr.shape[0]).astype(int), self.arr.shape[0] - 1)
+                return self.arr[idx, :], log_w
+            z = norm.ppf(u).reshape(n, self.months, -1)
+            return (self.mu + z @ self.factor.T).astype(self.dtype, copy=False), log_w
+        if self.variance_reduction == "importance":
+            if self.mode == "historical":
+                idx = rng.choice(len(self.p), size=(n, self.months), p=self.p)
+                return self.arr[idx, :], -np.log(len(self.p) * self.p[idx]).sum(axis=1)
+            z = rng.standard_normal((n, self.months, len(self.mu))) + self.shift
+            log_w = -(z @ self.shift).sum(axis=1) + 0.5 * self.months * self.shift @ self.shift
+            return (self.mu + z @ self.factor.T).astype(self.dtype, copy=False), log_w
+        return self._plain(rng, n), log_w
+
+    def _block_cumulative(self, rng: np.random.Generator, n: int, month_idx: np.ndarray) -> np.ndarray:
+        # cumulative log-return through ``month_idx`` from whole-block sums plus one partial block, all prefix-sum
+        # lookups: O(n_blocks) per path instead of a (months x ccy) gather. Consumes ``rng`` exactly like _plain.
+        antithetic = self.variance_reduction == "antithetic"
+        starts, lengths = self._blocks(rng, (n + 1) // 2 if antithetic else n)
+        if antithetic:
+            starts, lengths = np.repeat(starts, 2, axis=0)[:n], np.repeat(lengths, 2, axis=0)[:n]
+        k = np.asarray(month_idx) + 1
+        ends = np.cumsum(lengths, axis=1)
+        j = (ends < k[:, None]).sum(axis=1)
+        block_sums = self.prefix[starts + lengths] - self.prefix[starts]
+        whole = np.einsum("nb,nbc->nc", np.arange(starts.shape[1]) < j[:, None], block_sums)
+        rows = np.arange(n)
+        s_j = starts[rows, j]
+        cum = whole + self.prefix[s_j + k - (ends[rows, j] - lengths[rows, j])] - self.prefix[s_j]
+        if antithetic:
+            cum[1::2] = 2 * self.mu * k[1::2, None] - cum[1::2]
+        return cum.astype(self.dtype, copy=False)
+
+    def draw(self, start: int, n: int) -> tuple[np.ndarray, np.ndarray]:
+        if self.block_rngs is None:
+            return self._draw(self.rng, start, n)
+        parts = [self._draw(rng, lo, hi - lo) for rng, lo, hi in self.block_rngs.segments(start, n)]
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+    def cumulative_at(self, start: int, n: int, month_idx: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # (n, n_ccy) cumulative log-returns through each path's month, identical to draw() + cumsum + gather
+        if self.mode not in BOOTSTRAP_MODES:
+            shocks, log_w = self.draw(start, n)
+            return cumulate_months(shocks)[np.arange(n), month_idx], log_w
+        if self.block_rngs is None:
+            return self._block_cumulative(self.rng, n, month_idx), np.zeros(n)
+        parts = [self._block_cumulative(rng, hi - lo, month_idx[lo - start : hi - start]) for rng, lo, hi in self.block_rngs.segments(start, n)]
+        return np.concatenate(parts), np.zeros(n)
+
+
+def _chunk_size(chunk_size: int, variance_reduction: str) -> int:
+    chunk_size = max(int(chunk_size), 1)
+    return chunk_size + chunk_size % 2 if variance_reduction == "antithetic" else chunk_size
+
+
+def iter_log_paths(
+    returns: pd.DataFrame,
+    tenor_years: int,
+    n_paths: int,
+    mode: str = "historical",
+    corr_stress: float = 1.0,
+    seed: int = 42,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    variance_reduction: str = "none",
+    fx_tilt: float = 0.0,
+    dtype: type = np.float64,
+    streams: RngStreams | None = None,
+    start: int = 0,
+    block_length: float = DEFAULT_BLOCK_LENGTH,
+) -> Iterator[tuple[int, np.ndarray, np.ndarray]]:
+    # one sampler consumed in path order: concatenated blocks == dense simulation.
+    # ``start`` is the absolute index of the first path; yielded offsets are relative to it.
+    months = tenor_years * 12
+    sampler = ShockSampler(returns, months, mode, corr_stress, seed, variance_reduction, fx_tilt, dtype, streams, block_length)
+    chunk_size = _chunk_size(chunk_size, variance_reduction)
+    for offset in range(0, n_paths, chunk_size):
+        n = min(chunk_size, n_paths - offset)
+        shocks, log_w = sampler.draw(start + offset, n)
+        yield offset, cumulate_months(shocks), log_w
 
 
 def simulate_fx_paths(
@@ -12,18 +221,56 @@ def simulate_fx_paths(
     mode: str = "historical",
     corr_stress: float = 1.0,
     seed: int = 42,
+    variance_reduction: str = "none",
+    fx_tilt: float = 0.0,
+    block_length: float = DEFAULT_BLOCK_LENGTH,
+    dtype: type = np.float64,
 ) -> np.ndarray:
-    rng = np.random.default_rng(seed)
     months = tenor_years * 12
-    n_ccy = len(s0)
-    if mode == "historical":
-        arr = returns.values
-        idx = rng.integers(0, arr.shape[0], size=(n_paths, months))
-        shocks = arr[idx, :]
-    else:
-        mu = returns.mean().values
-        cov = returns.cov().values * corr_stress
-        shocks = rng.multivariate_normal(mu, cov, size=(n_paths, months))
-    log_paths = np.cumsum(shocks, axis=1)
-    paths = s0.values[None, None, :] * np.exp(log_paths)
+    shocks = ShockSampler(returns, months, mode, corr_stress, seed, variance_reduction, fx_tilt, dtype, block_length=block_length).draw(0, n_paths)[0]
+    paths = np.exp(cumulate_months(shocks), out=shocks)
+    paths *= s0.values
     return paths
+
+
+def simulate_fx_at_months(
+    returns: pd.DataFrame,
+    s0: pd.Series,
+    tenor_years: int,
+    month_idx: np.ndarray,
+    mode: str = "historical",
+    corr_stress: float = 1.0,
+    seed: int = 42,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    snapshots: list[int] | None = None,
+    variance_reduction: str = "none",
+    fx_tilt: float = 0.0,
+    streams: RngStreams | None = None,
+    start: int = 0,
+    block_length: float = DEFAULT_BLOCK_LENGTH,
+    dtype: type = np.float64,
+) -> tuple[np.ndarray, np.ndarray | None, np.ndarray]:
+    # same values as simulate_fx_paths(...)[arange(n), month_idx] with one chunk alive at a time
+    month_idx = np.asarray(month_idx, dtype=int)
+    n_paths = len(month_idx)
+    spot = s0.values
+    at = np.empty((n_paths, len(spot)), dtype)
+    snaps = np.empty((n_paths, len(snapshots), len(spot)), dtype) if snapshots else None
+    log_w = np.empty(n_paths)
+    if snaps is None:
+        sampler = ShockSampler(returns, tenor_years * 12, mode, corr_stress, seed, variance_reduction, fx_tilt, dtype, streams, block_length)
+        chunk_size = _chunk_size(chunk_size, variance_reduction)
+        for offset in range(0, n_paths, chunk_size):
+            rows = slice(offset, min(offset + chunk_size, n_paths))
+            log_at, log_w[rows] = sampler.cumulative_at(start + offset, rows.stop - offset, month_idx[rows])
+            at[rows] = spot * np.exp(log_at)
+        return at, snaps, log_w
+    chunks = iter_log_paths(
+        returns, tenor_years, n_paths, mode, corr_stress, seed, chunk_size, variance_reduction, fx_tilt, dtype, streams, start, block_length
+    )
+    for offset, log_paths, chunk_log_w in chunks:
+        rows = slice(offset, offset + len(log_paths))
+        at[rows] = spot * np.exp(log_paths[np.arange(len(log_paths)), month_idx[rows]])
+        log_w[rows] = chunk_log_w
+        snaps[rows] = spot * np.exp(log_paths[:, snapshots])
+    return at, snaps, log_w
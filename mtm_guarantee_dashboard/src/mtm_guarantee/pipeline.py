@@ -0,0 +1,482 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from mtm_guarantee.cache import ResultCache, frame_fingerprint, stable_key
+from mtm_guarantee.capital.allocation import euler_contributions, euler_contributions_sparse, marginal_capital, pro_rata_shares
+from mtm_guarantee.capital.greeks import likelihood_ratio_var_es, pathwise_var_es
+from mtm_guarantee.capital.liquidity import cash_call_profile, liquidity_buffer
+from mtm_guarantee.capital.loss_dist import exceedance_curve, standard_errors, var_es
+from mtm_guarantee.capital.rating_capital import required_capital
+from mtm_guarantee.credit.default_model import (
+    default_log_likelihood_ratio,
+    default_month,
+    default_score,
+    default_time_from_uniforms,
+    default_uniforms,
+    evaluation_time,
+    importance_pd,
+)
+from mtm_guarantee.credit.obligors import DefaultPairs, ObligorBook, copula_loadings, obligor_losses, synthetic_book
+from mtm_guarantee.guarantee.contract import GuaranteeContract
+from mtm_guarantee.guarantee.payout import payout_derivatives, payout_distribution
+from mtm_guarantee.instruments.exposure import ExposureProfile, exposure_profile
+from mtm_guarantee.instruments.mtm_proxy import portfolio_mtm
+from mtm_guarantee.io.excel_loader import read_obligor_book
+from mtm_guarantee.io.result_store import ResultStore
+from mtm_guarantee.market.fx import MarketData, as_market_data
+from mtm_guarantee.market.rates import rate_differentials
+from mtm_guarantee.market.simulation import path_dtype, simulate_fx_at_months, sobol_dim
+from mtm_guarantee.profiling import profiled, span
+from mtm_guarantee.rng import RngStreams, path_ranges
+from mtm_guarantee.sampling import variance_reduction_groups
+
+MARKET_INPUTS = (
+    "portfolio_notional",
+    "tenor_years",
+    "paths",
+    "simulation_mode",
+    "block_length",
+    "precision",
+    "corr_stress",
+    "pd_annual",
+    "mtm_phase",
+    "ccs_weight",
+    "variance_reduction",
+    "is_pd_tilt",
+    "is_fx_tilt",
+    "seed",
+    "credit_model",
+)
+OBLIGOR_INPUTS = ("copula_rho", "copula_rho_ccy", "wrong_way")  # read by the obligor credit model only
+SYNTHETIC_BOOK_INPUTS = ("n_obligors", "lgd")  # ... and only when no obligor book is supplied
+# contract terms and capital measure: all marginal_allocation reads besides the stage
+CAPITAL_INPUTS = ("portfolio_notional", "coverage_pct", "attachment", "detachment", "limit_pct", "default_mode", "capital_confidence", "capital_method", "overlay_pct")
+PAIR_FIELDS = ("path", "obligor", "time", "loss")
+
+
+@dataclass
+class MarketCreditStage:
+    currencies: list[str]
+    weighted_mtm: np.ndarray
+    contrib: np.ndarray
+    default_flags: np.ndarray
+    default_month: np.ndarray
+    path_weights: np.ndarray | None = None
+    groups: np.ndarray | None = None
+    obligor_pairs: DefaultPairs | None = None
+    obligor_names: np.ndarray | None = None
+
+    def to_arrays(self) -> tuple[dict[str, np.ndarray], dict]:
+        # flat arrays + JSON-able metadata for the on-disk result store
+        fields = ("weighted_mtm", "contrib", "default_flags", "default_month", "path_weights", "groups", "obligor_names")
+        arrays = {f: getattr(self, f) for f in fields if getattr(self, f) is not None}
+        if self.obligor_pairs is not None:
+            arrays.update({f"pairs_{f}": getattr(self.obligor_pairs, f) for f in PAIR_FIELDS})
+        metrics = {
+            "paths": len(self.weighted_mtm),
+            "default_share": float(self.default_flags.mean(dtype=np.float64)),
+            "mean_mtm": float(self.weighted_mtm.mean(dtype=np.float64)),
+            "mean_contrib": dict(zip(self.currencies, self.contrib.mean(axis=0, dtype=np.float64).tolist())),
+        }
+        return arrays, {"currencies": self.currencies, "metrics": metrics}
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray], meta: dict) -> MarketCreditStage:
+        pairs = DefaultPairs(*(arrays[f"pairs_{f}"] for f in PAIR_FIELDS)) if "pairs_path" in arrays else None
+        return cls(
+            meta["currencies"],
+            arrays["weighted_mtm"],
+            arrays["contrib"],
+            arrays["default_flags"],
+            arrays["default_month"],
+            arrays.get("path_weights"),
+            arrays.get("groups"),
+            pairs,
+            arrays.get("obligor_names"),
+        )
+
+
+def market_inputs(inputs: dict) -> dict:
+    # the inputs the market / credit stage actually reads, so edits to the others reuse it
+    keys = MARKET_INPUTS
+    if inputs["credit_model"] == "obligor":
+        keys += OBLIGOR_INPUTS + (() if inputs["obligor_book"] else SYNTHETIC_BOOK_INPUTS)
+    return {k: inputs[k] for k in keys}
+
+
+def market_credit_key(fx: pd.DataFrame | MarketData, rates: pd.DataFrame, weights: dict[str, float], inputs: dict) -> str:
+    # a supplied obligor book is keyed by its contents, not its path
+    book = obligor_book_frame(inputs)
+    book_key = None if book is None else frame_fingerprint(book)
+    return stable_key(as_market_data(fx).fingerprint, frame_fingerprint(rates), weights, market_inputs(inputs), book_key)
+
+
+def lookup_stage(key: str, cache: ResultCache | None = None, store: ResultStore | None = None) -> MarketCreditStage | None:
+    # in-memory cache first, then the on-disk store; store hits are promoted into the cache
+    stage = None if cache is None else cache.get(key)
+    if stage is None and store is not None:
+        entry = store.get(key)
+        if entry is not None:
+            stage = MarketCreditStage.from_arrays(*entry)
+            if cache is not None:
+                cache.put(key, stage)
+    return stage
+
+
+def save_stage(key: str, stage: MarketCreditStage, inputs: dict, cache: ResultCache | None = None, store: ResultStore | None = None) -> MarketCreditStage:
+    if store is not None:
+        arrays, meta = stage.to_arrays()
+        store.put(key, arrays, {**meta, "inputs": market_inputs(inputs)})
+    return stage if cache is None else cache.put(key, stage)
+
+
+def returns_and_spot(fx: pd.DataFrame | MarketData) -> tuple[pd.DataFrame, pd.Series]:
+    market = as_market_data(fx)
+    return market.returns, market.s0
+
+
+def sampling_pd(inputs: dict) -> float:
+    return importance_pd(inputs["pd_annual"], inputs["is_pd_tilt"]) if inputs["variance_reduction"] == "importance" else inputs["pd_annual"]
+
+
+def sample_default_times(inputs: dict, lo: int, hi: int, n_ccy: int, streams: RngStreams | None = None) -> np.ndarray:
+    # single-obligor default times of paths [lo, hi), as drawn by simulate_path_range for ``n_ccy`` currencies
+    dim = sobol_dim(inputs["tenor_years"] * 12, n_ccy, inputs["simulation_mode"])
+    u = default_uniforms(hi - lo, variance_reduction=inputs["variance_reduction"], streams=streams or RngStreams(inputs["seed"]), start=lo, sobol_dim=dim)
+    return default_time_from_uniforms(u, sampling_pd(inputs), inputs["tenor_years"])
+
+
+def simulate_path_range(
+    fxr: pd.DataFrame, s0: pd.Series, carry: np.ndarray, w: np.ndarray, inputs: dict, lo: int, hi: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, DefaultPairs | None]:
+    # paths [lo, hi) drawn from their own RNG blocks, so any block-aligned split reproduces the single-process run
+    streams = RngStreams(inputs["seed"])
+    vr = inputs["variance_reduction"]
+    dtype = path_dtype(inputs["precision"])
+    if inputs["credit_model"] == "obligor":
+        return simulate_obligor_range(fxr, s0, carry, w, inputs, streams, lo, hi)
+    importance = vr == "importance"
+    pd_sampled = sampling_pd(inputs)
+    with span("defaults"):
+        dt = sample_default_times(inputs, lo, hi, len(w), streams)
+        idx = default_month(dt, inputs["tenor_years"])
+    with span("fx_at_default") as sp:
+        fx_at_default, _, log_w = simulate_fx_at_months(
+            fxr,
+            s0,
+            inputs["tenor_years"],
+            idx,
+            mode=inputs["simulation_mode"],
+            corr_stress=inputs["corr_stress"],
+            variance_reduction=vr,
+            fx_tilt=inputs["is_fx_tilt"] if importance else 0.0,
+            streams=streams,
+            start=lo,
+            block_length=inputs["block_length"],
+            dtype=dtype,
+        )
+        sp.record(fx_at_default=fx_at_default)
+    if importance:
+        log_w += default_log_likelihood_ratio(dt, inputs["pd_annual"], pd_sampled, inputs["tenor_years"])
+    t_eval = evaluation_time(dt, inputs["tenor_years"])
+    with span("mtm"):
+        contrib, weighted_mtm = portfolio_mtm(
+            fx_at_default, s0.values, inputs["portfolio_notional"], w, carry, t_eval, inputs["mtm_phase"], inputs["ccs_weight"], out=fx_at_default
+        )
+    return weighted_mtm, contrib, (~np.isnan(dt)).astype(dtype), idx, log_w, None
+
+
+def obligor_book_frame(inputs: dict) -> pd.DataFrame | None:
+    return read_obligor_book(inputs["obligor_book"]) if inputs["credit_model"] == "obligor" and inputs["obligor_book"] else None
+
+
+def obligor_book(s0: pd.Series, w: np.ndarray, inputs: dict) -> ObligorBook:
+    # the supplied book (per-obligor notional, PD and LGD), else n_obligors equal names at the scenario PD / LGD
+    book = obligor_book_frame(inputs)
+    if book is not None:
+        return ObligorBook.from_frame(book, list(s0.index))
+    return synthetic_book(list(s0.index), w, inputs["portfolio_notional"], int(inputs["n_obligors"]), inputs["pd_annual"], inputs["lgd"])
+
+
+def simulate_obligor_range(
+    fxr: pd.DataFrame, s0: pd.Series, carry: np.ndarray, w: np.ndarray, inputs: dict, streams: RngStreams, lo: int, hi: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, DefaultPairs | None]:
+    # copula defaults across the obligor book, aggregated per path from the sparse defaulted pairs
+    if inputs["variance_reduction"] == "importance":
+        raise ValueError("Importance sampling is only available for the single-obligor credit model.")
+    n, n_ccy, months = hi - lo, len(s0), inputs["tenor_years"] * 12
+    dtype = path_dtype(inputs["precision"])
+    book = obligor_book(s0, w, inputs)
+    loadings = copula_loadings(book, n_ccy, inputs["copula_rho"], inputs["copula_rho_ccy"])
+    pairs = obligor_losses(
+        fxr,
+        s0,
+        carry,
+        book,
+        loadings,
+        inputs["tenor_years"],
+        n,
+        inputs["simulation_mode"],
+        inputs["corr_stress"],
+        inputs["mtm_phase"],
+        inputs["ccs_weight"],
+        inputs["wrong_way"],
+        streams,
+        lo,
+        variance_reduction=inputs["variance_reduction"],
+        block_length=inputs["block_length"],
+        dtype=dtype,
+    )
+    path = pairs.path - lo
+    weighted_mtm = np.bincount(path, weights=pairs.loss, minlength=n)
+    contrib = np.bincount(path * n_ccy + book.currency[pairs.obligor], weights=pairs.loss, minlength=n * n_ccy).reshape(n, n_ccy)
+    first_month = np.full(n, months - 1)
+    np.minimum.at(first_month, path, np.minimum((pairs.time * 12).astype(int), months - 1))
+    return weighted_mtm.astype(dtype), contrib.astype(dtype), (np.bincount(path, minlength=n) > 0).astype(dtype), first_month, np.zeros(n), pairs
+
+
+@profiled("simulate_market_credit")
+def simulate_market_credit(fx: pd.DataFrame | MarketData, rates: pd.DataFrame, weights: dict[str, float], inputs: dict, workers: int = 1) -> MarketCreditStage:
+    fxr, s0 = returns_and_spot(fx)
+    n_paths = int(inputs["paths"])
+    w = np.array([weights[c] for c in s0.index])
+    carry = rate_differentials(rates, list(s0.index))
+    args = (fxr, s0, carry, w, inputs)
+    if workers > 1:
+        ranges = path_ranges(n_paths, workers)
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+            parts = list(pool.map(simulate_path_range, *zip(*[args + r for r in ranges])))
+    else:
+        parts = [simulate_path_range(*args, 0, n_paths)]
+    return assemble_stage(s0, w, inputs, parts)
+
+
+def assemble_stage(s0: pd.Series, w: np.ndarray, inputs: dict, parts: list[tuple]) -> MarketCreditStage:
+    # consecutive simulate_path_range outputs starting at path 0 -> stage; importance weights normalised over all of them
+    if len(parts) == 1:
+        weighted_mtm, contrib, default_flags, idx, log_w, pairs = parts[0]
+    else:
+        weighted_mtm, contrib, default_flags, idx, log_w = (np.concatenate(p) for p in list(zip(*parts))[:5])
+        pairs = DefaultPairs.concat([p[5] for p in parts]) if inputs["credit_model"] == "obligor" else None
+    n_paths, vr = len(weighted_mtm), inputs["variance_reduction"]
+    path_weights = None
+    if vr == "importance":
+        path_weights = np.exp(log_w - log_w.max())
+        path_weights *= n_paths / path_weights.sum()
+    groups = variance_reduction_groups(n_paths, vr)
+    names = obligor_book(s0, w, inputs).names if pairs is not None else None
+    return MarketCreditStage(list(s0.index), weighted_mtm, contrib, default_flags, idx, path_weights, groups, pairs, names)
+
+
+def contract_from_inputs(inputs: dict) -> GuaranteeContract:
+    return GuaranteeContract(
+        coverage_pct=inputs["coverage_pct"], attachment=inputs["attachment"], detachment=inputs["detachment"], limit_pct=inputs["limit_pct"], mode=inputs["default_mode"]
+    )
+
+
+def losses_without(stage: MarketCreditStage, inputs: dict, component_mtm: np.ndarray) -> np.ndarray:
+    # payouts with each row of ``component_mtm`` (n_components, n_paths) taken out of the book, from the cached stage
+    return payout_distribution(stage.weighted_mtm - component_mtm, stage.default_flags, inputs["portfolio_notional"], contract_from_inputs(inputs))
+
+
+def capital_scale(inputs: dict) -> tuple[str, float]:
+    return ("es" if inputs["capital_method"].upper() == "ES" else "var"), 1 + inputs["overlay_pct"]
+
+
+def currency_allocation(stage: MarketCreditStage, inputs: dict, losses: np.ndarray, var: float, es: float) -> pd.DataFrame:
+    conf, w = inputs["capital_confidence"], stage.path_weights
+    euler = euler_contributions(losses, pro_rata_shares(stage.contrib), conf, w, var=var, es=es)
+    measure, scale = capital_scale(inputs)
+    return pd.DataFrame({"currency": stage.currencies, "euler_var": euler["var"], "euler_es": euler["es"], "euler_capital": euler[measure] * scale})
+
+
+def obligor_allocation(stage: MarketCreditStage, inputs: dict, losses: np.ndarray, var: float, es: float) -> pd.DataFrame:
+    pairs = stage.obligor_pairs
+    n_obl = len(stage.obligor_names)
+    euler = euler_contributions_sparse(losses, pairs.path, pairs.obligor, pairs.loss, n_obl, inputs["capital_confidence"], stage.path_weights, var=var, es=es)
+    measure, scale = capital_scale(inputs)
+    return pd.DataFrame(
+        {
+            "obligor": stage.obligor_names,
+            "euler_var": euler["var"],
+            "euler_es": euler["es"],
+            "euler_capital": euler[measure] * scale,
+        }
+    )
+
+
+@profiled("marginal_allocation")
+def marginal_allocation(stage: MarketCreditStage, inputs: dict, losses: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+    # with/without capital per currency and per obligor (None for the single-obligor model): one repricing per
+    # component, so it is computed on request rather than on every reprice
+    currency = marginal_capital(
+        losses, losses_without(stage, inputs, stage.contrib.T), inputs["capital_confidence"], stage.path_weights, inputs["capital_method"], inputs["overlay_pct"]
+    )
+    return currency, None if stage.obligor_pairs is None else obligor_marginal_capital(stage, inputs, losses)
+
+
+def obligor_marginal_capital(stage: MarketCreditStage, inputs: dict, losses: np.ndarray, block: int = 64) -> np.ndarray:
+    # with/without capital per obligor from the stored defaulted pairs, ``block`` obligors per vectorised pass
+    pairs, n_obl, n = stage.obligor_pairs, len(stage.obligor_names), len(losses)
+    out = np.empty(n_obl)
+    for lo in range(0, n_obl, block):
+        hi = min(lo + block, n_obl)
+        sel = (pairs.obligor >= lo) & (pairs.obligor < hi)
+        removed = np.zeros((hi - lo, n))
+        np.add.at(removed, (pairs.obligor[sel] - lo, pairs.path[sel]), pairs.loss[sel])
+        out[lo:hi] = marginal_capital(
+            losses, losses_without(stage, inputs, removed), inputs["capital_confidence"], stage.path_weights, inputs["capital_method"], inputs["overlay_pct"]
+        )
+    return out
+
+
+@profiled("reprice")
+def reprice(stage: MarketCreditStage, inputs: dict) -> dict:
+    with span("payout") as sp:
+        losses = payout_distribution(stage.weighted_mtm, stage.default_flags, inputs["portfolio_notional"], contract_from_inputs(inputs))
+        sp.record(losses=losses)
+    w = stage.path_weights
+    with span("var_es"):
+        el, var, es = var_es(losses, inputs["capital_confidence"], w)
+        se = standard_errors(losses, inputs["capital_confidence"], w, stage.groups)
+    cap = required_capital(var, es, inputs["capital_method"], inputs["overlay_pct"])
+    max_lev = inputs["portfolio_notional"] / cap if cap > 0 else np.inf
+    with span("exceedance_curve"):
+        xs, ys = exceedance_curve(losses, weights=w)
+    with span("allocation"):
+        allocation = currency_allocation(stage, inputs, losses, var, es)
+        obligors = None if stage.obligor_pairs is None else obligor_allocation(stage, inputs, losses, var, es)
+    tail_contrib = dict(zip(stage.currencies, allocation["euler_es"].tolist()))
+
+    # claims fall due in the default month (maturity for surviving paths under full_mtm)
+    months = inputs["tenor_years"] * 12
+    with span("liquidity"):
+        liq = liquidity_buffer(losses, stage.default_month, months, inputs["liq_floor_pct"], inputs["portfolio_notional"], w)
+        cash_calls = cash_call_profile(losses, stage.default_month, months, w)
+
+    return {
+        "losses": losses,
+        "el": el,
+        "var": var,
+        "es": es,
+        "se": se,
+        "cap": cap,
+        "max_lev": max_lev,
+        "xs": xs,
+        "ys": ys,
+        "tail_contrib": tail_contrib,
+        "allocation": allocation,
+        "obligor_allocation": obligors,
+        "liq": liq,
+        "cash_calls": cash_calls,
+        "path_weights": w,
+    }
+
+
+GREEK_INPUTS = ("pd_annual", "coverage_pct", "attachment", "detachment", "limit_pct")
+
+
+@profiled("capital_greeks")
+def capital_greeks(stage: MarketCreditStage, inputs: dict, weights: dict[str, float], res: dict) -> pd.DataFrame:
+    # gradient of VaR / ES / required capital from the cached stage in one pass: pathwise for currency weights and
+    # contract terms (MTM is linear in each weight, the tranche piecewise linear), likelihood ratio for the PD,
+    # which moves the default-time density rather than the loss. Obligor-model PD sensitivities are not available.
+    contract = contract_from_inputs(inputs)
+    conf, w, losses = inputs["capital_confidence"], stage.path_weights, res["losses"]
+    d = payout_derivatives(stage.weighted_mtm, stage.default_flags, inputs["portfolio_notional"], contract)
+    unit = np.array([weights[c] for c in stage.currencies], dtype=float)
+    cols = [d["mtm"][:, None] * stage.contrib / np.where(unit > 0, unit, 1.0)] + [d[k][:, None] for k in GREEK_INPUTS[1:]]
+    dvar, des = pathwise_var_es(losses, np.hstack(cols), conf, w, res["var"], res["es"])
+    names = [f"weight:{c}" for c in stage.currencies] + list(GREEK_INPUTS[1:])
+    methods = ["pathwise"] * len(names)
+    if stage.obligor_pairs is None:
+        dt = sample_default_times(inputs, 0, len(losses), len(stage.currencies))
+        pd_var, pd_es = likelihood_ratio_var_es(losses, default_score(dt, inputs["pd_annual"], inputs["tenor_years"]), conf, w, res["var"], res["es"])
+    else:
+        pd_var = pd_es = np.nan
+    frame = pd.DataFrame(
+        {"d_var": np.append(dvar, pd_var), "d_es": np.append(des, pd_es), "method": methods + ["likelihood_ratio"]},
+        index=pd.Index(names + ["pd_annual"], name="parameter"),
+    )
+    measure, scale = capital_scale(inputs)
+    frame["d_capital"] = frame[f"d_{measure}"] * scale
+    return frame
+
+
+@profiled("exposure_profile")
+def exposure_from_inputs(fx: pd.DataFrame | MarketData, rates: pd.DataFrame, weights: dict[str, float], inputs: dict, instrument: str = "blend") -> ExposureProfile:
+    # same FX streams as the loss run, evaluated on every month of the tenor
+    fxr, s0 = returns_and_spot(fx)
+    importance = inputs["variance_reduction"] == "importance"
+    return exposure_profile(
+        fxr,
+        s0,
+        inputs["portfolio_notional"],
+        np.array([weights[c] for c in s0.index]),
+        rate_differentials(rates, list(s0.index)),
+        inputs["tenor_years"],
+        int(inputs["paths"]),
+        inputs["simulation_mode"],
+        inputs["corr_stress"],
+        instrument,
+        inputs["mtm_phase"],
+        inputs["ccs_weight"],
+        RngStreams(inputs["seed"]),
+        variance_reduction=inputs["variance_reduction"],
+        fx_tilt=inputs["is_fx_tilt"] if importance else 0.0,
+        block_length=inputs["block_length"],
+        dtype=path_dtype(inputs["precision"]),
+    )
+
+
+@profiled("run_model")
+def run_model(
+    fx: pd.DataFrame | MarketData,
+    rates: pd.DataFrame,
+    weights: dict[str, float],
+    inputs: dict,
+    cache: ResultCache | None = None,
+    workers: int = 1,
+    store: ResultStore | None = None,
+    greeks: bool = False,
+    marginal: bool = False,
+) -> dict:
+    # greeks=True adds res["greeks"]: dVaR / dES / dCapital per currency weight, contract term and PD;
+    # marginal=True adds a marginal_capital column to the currency (and obligor) allocation tables
+    stage = market_credit_stage(fx, rates, weights, inputs, cache, workers, store)
+    res = reprice(stage, inputs)
+    if greeks:
+        res["greeks"] = capital_greeks(stage, inputs, weights, res)
+    if marginal:
+        currency, obligor = marginal_allocation(stage, inputs, res["losses"])
+        res["allocation"]["marginal_capital"] = currency
+        if obligor is not None:
+            res["obligor_allocation"]["marginal_capital"] = obligor
+    return res
+
+
+def market_credit_stage(
+    fx: pd.DataFrame | MarketData,
+    rates: pd.DataFrame,
+    weights: dict[str, float],
+    inputs: dict,
+    cache: ResultCache | None = None,
+    workers: int = 1,
+    store: ResultStore | None = None,
+) -> MarketCreditStage:
+    # workers only changes how paths are split across processes, never the results, so it is not part of the cache key
+    fx = as_market_data(fx)
+    if cache is None and store is None:
+        return simulate_market_credit(fx, rates, weights, inputs, workers)
+    with span("cache_key"):
+        key = market_credit_key(fx, rates, weights, inputs)
+    with span("stage_lookup"):
+        stage = lookup_stage(key, cache, store)
+    if stage is None:
+        stage = save_stage(key, simulate_market_credit(fx, rates, weights, inputs, workers), inputs, cache, store)
+    return stage
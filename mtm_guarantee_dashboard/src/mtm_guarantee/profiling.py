@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+
+def value_bytes(value: Any) -> int:
+    # rough in-memory size of stage outputs: arrays, frames and containers of them
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(deep=False)))
+    if isinstance(value, dict):
+        return sum(value_bytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(value_bytes(v) for v in value)
+    if hasattr(value, "__dict__") and not isinstance(value, type):
+        return value_bytes(vars(value))
+    return 0
+
+
+@dataclass
+class Span:
+    name: str
+    start: float  # seconds since the profiler was reset
+    depth: int
+    thread: int
+    wall: float = 0.0
+    cpu: float = 0.0
+    peak_bytes: int | None = None  # allocation high-water mark above the span's starting level (memory tracing only)
+    arrays: dict[str, int] = field(default_factory=dict)  # bytes of recorded inputs/outputs
+    _child_peak: int = 0
+
+    def record(self, **values: Any) -> None:
+        for k, v in values.items():
+            self.arrays[k] = value_bytes(v)
+
+
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_owned = False  # tracemalloc was started here rather than by the caller
+
+
+def _hold_tracing() -> None:
+    # tracemalloc is process-wide: it runs while any memory profiler is enabled and stops with the last one
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_owned = True
+        _tracing_users += 1
+
+
+def _release_tracing() -> None:
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_owned:
+            tracemalloc.stop()
+            _tracing_owned = False
+
+
+class Profiler:
+    # nested wall/CPU/peak-allocation spans; disabled spans cost one attribute check
+    def __init__(self, enabled: bool = False, memory: bool = False):
+        self.enabled = False
+        self.memory = False
+        self.spans: list[Span] = []
+        self._local = threading.local()
+        self._t0 = time.perf_counter()
+        self._tracing: weakref.finalize | None = None  # releases tracemalloc even if the profiler is dropped while enabled
+        if enabled:
+            self.enable(memory)
+
+    def enable(self, memory: bool = False) -> None:
+        if memory and self._tracing is None:
+            _hold_tracing()
+            self._tracing = weakref.finalize(self, _release_tracing)
+        elif not memory and self._tracing is not None:
+            self._tracing()
+            self._tracing = None
+        self.enabled, self.memory = True, memory
+
+    def disable(self) -> None:
+        if self._tracing is not None:
+            self._tracing()
+            self._tracing = None
+        self.enabled = self.memory = False
+
+    def reset(self) -> None:
+        self.spans = []
+        self._t0 = time.perf_counter()
+
+    def _stack(self) -> list[Span]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def _span(self, name: str) -> Iterator[Span]:
+        stack = self._stack()
+        sp = Span(name, time.perf_counter() - self._t0, len(stack), threading.get_ident())
+        self.spans.append(sp)
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            # the tracemalloc peak is global: remember the enclosing span's peak so far before resetting it
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]._child_peak = max(stack[-1]._child_peak, peak)
+            tracemalloc.reset_peak()
+            base = current
+        stack.append(sp)
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        try:
+            yield sp
+        finally:
+            sp.wall = time.perf_counter() - wall0
+            sp.cpu = time.process_time() - cpu0
+            stack.pop()
+            if tracing:
+                peak = max(tracemalloc.get_traced_memory()[1], sp._child_peak)
+                sp.peak_bytes = max(peak - base, 0)
+                if stack:
+                    stack[-1]._child_peak = max(stack[-1]._child_peak, peak)
+
+    def span(self, name: str):
+        return self._span(name) if self.enabled else nullcontext(_NULL_SPAN)
+
+    def to_frame(self) -> pd.DataFrame:
+        rows = [
+            {
+                "span": "· " * s.depth + s.name,
+                "wall_ms": s.wall * 1e3,
+                "cpu_ms": s.cpu * 1e3,
+                "peak_mb": None if s.peak_bytes is None else s.peak_bytes / 1024**2,
+                "arrays_mb": sum(s.arrays.values()) / 1024**2,
+            }
+            for s in self.spans
+        ]
+        return pd.DataFrame(rows, columns=["span", "wall_ms", "cpu_ms", "peak_mb", "arrays_mb"])
+
+    def to_json(self) -> str:
+        return json.dumps([{k: v for k, v in asdict(s).items() if not k.startswith("_")} for s in self.spans], indent=2)
+
+    def to_chrome_trace(self) -> str:
+        # Trace Event Format ("X" complete events), loadable in chrome://tracing or Perfetto
+        events = [
+            {
+                "name": s.name,
+                "ph": "X",
+                "ts": s.start * 1e6,
+                "dur": s.wall * 1e6,
+                "pid": os.getpid(),
+                "tid": s.thread,
+                "args": {"cpu_ms": s.cpu * 1e3, "peak_bytes": s.peak_bytes, **{f"{k}_bytes": v for k, v in s.arrays.items()}},
+            }
+            for s in self.spans
+        ]
+        return json.dumps({"traceEvents": events, "displayTimeUnit": "ms"})
+
+    def to_markdown(self) -> str:
+        return self.to_frame().to_markdown(index=False, floatfmt=".1f")
+
+
+class _NullSpan(Span):
+    def record(self, **values: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan("disabled", 0.0, 0, 0)
+PROFILER = Profiler(enabled=bool(os.environ.get("MTM_PROFILE")), memory=os.environ.get("MTM_PROFILE") == "memory")
+_active: ContextVar[Profiler] = ContextVar("mtm_profiler")
+
+
+def current_profiler() -> Profiler:
+    # the profiler bound in this context (e.g. one dashboard session), else the process-wide one
+    return _active.get(PROFILER)
+
+
+@contextmanager
+def use_profiler(profiler: Profiler) -> Iterator[Profiler]:
+    # spans and @profiled calls in this context (thread / task) record into ``profiler``
+    token = _active.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _active.reset(token)
+
+
+def span(name: str):
+    # ``with span("stage") as sp: ...; sp.record(losses=losses)`` on the current profiler
+    return current_profiler().span(name)
+
+
+def profiled(name: str | None = None) -> Callable:
+    # decorator form of span(); records the size of the return value
+    def wrap(fn: Callable) -> Callable:
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            profiler = current_profiler()
+            if not profiler.enabled:
+                return fn(*args, **kwargs)
+            with profiler.span(label) as sp:
+                out = fn(*args, **kwargs)
+                sp.record(result=out)
+                return out
+
+        return inner
+
+    return wrap
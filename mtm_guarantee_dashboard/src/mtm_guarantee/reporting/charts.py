@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import numpy as np
+import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 
@@ -21,3 +22,25 @@ def waterfall_chart(wf: dict[str, float]):
     y = [wf["premium"], -wf["opex"], -wf["reserve"], -wf["expected_loss"], -wf["mezz_coupon"], -wf["senior_fee"], wf["equity_residual"]]
     fig = go.Figure(go.Waterfall(x=x, y=y, measure=["relative"] * 6 + ["total"]))
     return fig
+
+
+def exposure_profile_chart(profile: pd.DataFrame, currency: str = "total"):
+    sel = profile[profile["currency"] == currency]
+    cols = [c for c in sel.columns if c == "EE" or c.startswith("PFE")]
+    fig = px.line(sel, x="month", y=cols, labels={"month": "Month", "value": "Exposure (USD)", "variable": ""})
+    fig.add_hline(y=float(sel["EPE"].iloc[0]), line_dash="dash", annotation_text="EPE")
+    return fig
+
+
+def pareto_frontier_chart(table: pd.DataFrame, frontier: pd.DataFrame, risk: str = "p_mezz_loss", reward: str = "equity_roe"):
+    pts = table[table["feasible"]] if "feasible" in table else table
+    fig = px.scatter(pts, x=risk, y=reward, color="leverage", hover_data=["mezz_pct", "mezz_coupon", "senior_limit"], opacity=0.4)
+    fig.add_trace(go.Scatter(x=frontier[risk], y=frontier[reward], mode="lines+markers", name="Pareto frontier", line={"color": "black"}))
+    return fig
+
+
+def capital_backtest_chart(frame: pd.DataFrame):
+    fig = px.line(frame, x="date", y=["el", "es", "cap"], labels={"date": "As-of date", "value": "USD", "variable": ""})
+    fig.add_trace(go.Scatter(x=frame["date"], y=frame["max_lev"], name="max_lev", yaxis="y2", line={"dash": "dot", "color": "black"}))
+    fig.update_layout(yaxis2={"title": "Max leverage", "overlaying": "y", "side": "right"})
+    return fig
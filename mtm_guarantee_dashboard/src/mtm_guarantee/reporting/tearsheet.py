@@ -3,12 +3,14 @@ from __future__ import annotations
 from pathlib import Path
 
 
-def write_tearsheet(path: str, title: str, metrics: dict, summary_md: str) -> str:
+def write_tearsheet(path: str, title: str, metrics: dict, summary_md: str, sections: dict[str, str] | None = None) -> str:
     out = Path(path)
     out.parent.mkdir(parents=True, exist_ok=True)
     lines = [f"# {title}", "", "## Key Metrics"]
     for k, v in metrics.items():
         lines.append(f"- **{k}**: {v}")
     lines += ["", "## Scenario Summary", summary_md]
+    for heading, body in (sections or {}).items():
+        lines += ["", f"## {heading}", body]
     out.write_text("\n".join(lines), encoding="utf-8")
     return str(out)
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import zlib
+from typing import Iterator
+
+import numpy as np
+
+RNG_BLOCK_SIZE = 2_000
+
+
+def component_id(name: str) -> int:
+    return zlib.crc32(name.encode())
+
+
+class RngStreams:
+    # independent streams per (scenario, component, path block), derived from one master seed.
+    # SeedSequence(master, spawn_key=(s, c, b)) is the child reached by nested SeedSequence.spawn calls,
+    # so any block can be regenerated in any process without replaying the blocks before it.
+    def __init__(self, master_seed: int, scenario: int = 0, block_size: int = RNG_BLOCK_SIZE):
+        self.master_seed = int(master_seed)
+        self.scenario = int(scenario)
+        self.block_size = int(block_size)
+
+    def seed_sequence(self, component: str, block: int | None = None) -> np.random.SeedSequence:
+        key = (self.scenario, component_id(component)) + (() if block is None else (int(block),))
+        return np.random.SeedSequence(self.master_seed, spawn_key=key)
+
+    def generator(self, component: str, block: int | None = None) -> np.random.Generator:
+        return np.random.Generator(np.random.PCG64(self.seed_sequence(component, block)))
+
+    def blocks(self, start: int, n: int) -> Iterator[tuple[int, int, int]]:
+        # (block, lo, hi) segments covering absolute paths [start, start + n)
+        stop = start + n
+        for b in range(start // self.block_size, -(-stop // self.block_size)):
+            yield b, max(b * self.block_size, start), min((b + 1) * self.block_size, stop)
+
+
+class BlockGenerators:
+    # hands out each block's generator in path order; a block can only be entered at its first path
+    def __init__(self, streams: RngStreams, component: str):
+        self.streams = streams
+        self.component = component
+        self._live: dict[int, tuple[np.random.Generator, int]] = {}
+
+    def segments(self, start: int, n: int) -> Iterator[tuple[np.random.Generator, int, int]]:
+        for b, lo, hi in self.streams.blocks(start, n):
+            rng, pos = self._live.pop(b, (None, b * self.streams.block_size))
+            if lo != pos:
+                raise ValueError(f"Path {lo} is not the next path of RNG block {b}; split runs on block boundaries.")
+            rng = rng or self.streams.generator(self.component, b)
+            yield rng, lo, hi
+            if hi < (b + 1) * self.streams.block_size:
+                self._live[b] = (rng, hi)
+
+
+def path_ranges(n_paths: int, parts: int, block_size: int = RNG_BLOCK_SIZE) -> list[tuple[int, int]]:
+    n_blocks = -(-n_paths // block_size)
+    edges = np.linspace(0, n_blocks, max(min(parts, n_blocks), 1) + 1).round().astype(int) * block_size
+    return [(int(lo), int(min(hi, n_paths))) for lo, hi in zip(edges[:-1], edges[1:]) if lo < n_paths]
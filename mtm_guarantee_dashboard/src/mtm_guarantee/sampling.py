@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import warnings
+
+import numpy as np
+from scipy.stats import qmc
+
+VARIANCE_REDUCTION = ("none", "antithetic", "sobol", "importance")
+SOBOL_REPLICATES = 8
+SOBOL_BLOCK = 256
+
+
+def check_variance_reduction(variance_reduction: str) -> str:
+    if variance_reduction not in VARIANCE_REDUCTION:
+        raise ValueError(f"Unknown variance reduction '{variance_reduction}'. Expected one of {VARIANCE_REDUCTION}.")
+    return variance_reduction
+
+
+def variance_reduction_groups(n_paths: int, variance_reduction: str, start: int = 0) -> np.ndarray:
+    # independent units for standard errors: antithetic pairs, Sobol scramble replicates, otherwise single paths
+    idx = np.arange(start, start + n_paths)
+    if variance_reduction == "antithetic":
+        return idx // 2
+    if variance_reduction == "sobol":
+        return (idx // SOBOL_BLOCK) % SOBOL_REPLICATES
+    return idx
+
+
+def interleave_antithetic(base: np.ndarray, mirror: np.ndarray, n: int) -> np.ndarray:
+    out = np.empty((2 * len(base),) + base.shape[1:], dtype=base.dtype)
+    out[0::2] = base
+    out[1::2] = mirror
+    return out[:n]
+
+
+class SobolReplicates:
+    # SOBOL_REPLICATES independently scrambled sequences dealt out in SOBOL_BLOCK path blocks (block b -> replicate
+    # b % SOBOL_REPLICATES); fast_forward makes every path range reproducible on its own
+    def __init__(self, dim: int, seed: int | np.random.SeedSequence):
+        ss = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.engines = [qmc.Sobol(dim, scramble=True, seed=np.random.default_rng(s)) for s in ss.spawn(SOBOL_REPLICATES)]
+        self.pos = [0] * SOBOL_REPLICATES
+
+    def _take(self, r: int, at: int, n: int) -> np.ndarray:
+        if self.pos[r] != at:
+            self.engines[r].reset()
+            self.engines[r].fast_forward(at)
+        self.pos[r] = at + n
+        return self.engines[r].random(n)
+
+    def draw(self, start: int, n: int) -> np.ndarray:
+        parts = []
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)  # balance warning for non power-of-two draws
+            for b in range(start // SOBOL_BLOCK, -(-(start + n) // SOBOL_BLOCK)):
+                lo, hi = max(b * SOBOL_BLOCK, start), min((b + 1) * SOBOL_BLOCK, start + n)
+                at = (b // SOBOL_REPLICATES) * SOBOL_BLOCK + lo - b * SOBOL_BLOCK
+                parts.append(self._take(b % SOBOL_REPLICATES, at, hi - lo))
+        return np.clip(np.concatenate(parts), 1e-12, 1 - 1e-12)
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from mtm_guarantee.capital.loss_dist import var_es
+from mtm_guarantee.capital.rating_capital import required_capital
+from mtm_guarantee.capital.returns import waterfall
+from mtm_guarantee.credit.default_model import (
+    default_log_likelihood_ratio,
+    default_month,
+    default_time_from_uniforms,
+    default_uniforms,
+    evaluation_time,
+    importance_pd,
+)
+from mtm_guarantee.guarantee.payout import payout_distribution
+from mtm_guarantee.instruments.mtm_proxy import portfolio_mtm
+from mtm_guarantee.market.fx import MarketData
+from mtm_guarantee.market.rates import rate_differentials
+from mtm_guarantee.market.simulation import iter_log_paths, path_dtype, sobol_dim
+from mtm_guarantee.pipeline import CAPITAL_INPUTS, MARKET_INPUTS, contract_from_inputs, returns_and_spot
+from mtm_guarantee.profiling import profiled
+from mtm_guarantee.rng import RngStreams
+
+GRID_METRICS = ("el", "es", "cap", "max_lev", "equity_roe")
+METRIC_INPUTS = ("capital_confidence", "capital_method", "overlay_pct", "portfolio_notional", "target_leverage", "client_fee_bps", "opex_bps", "reserve_bps")
+# everything sensitivity_grid reads: the single-obligor simulation inputs bar the PD it sweeps, the contract and the metrics
+GRID_INPUTS = tuple(dict.fromkeys([k for k in MARKET_INPUTS if k not in ("pd_annual", "credit_model")] + list(CAPITAL_INPUTS) + list(METRIC_INPUTS)))
+
+
+def scenario_metrics(losses: np.ndarray, inputs: dict, path_weights: np.ndarray | None = None) -> dict[str, float]:
+    el, var, es = var_es(losses, inputs["capital_confidence"], path_weights)
+    cap = required_capital(var, es, inputs["capital_method"], inputs["overlay_pct"])
+    equity = inputs["portfolio_notional"] / inputs["target_leverage"]
+    wf = waterfall(inputs["portfolio_notional"], inputs["client_fee_bps"], inputs["opex_bps"], inputs["reserve_bps"], el, 0.0, 0.0, 0.0, 0.0, equity, 1.0)
+    max_lev = inputs["portfolio_notional"] / cap if cap > 0 else np.inf
+    return {"el": el, "var": var, "es": es, "cap": cap, "max_lev": max_lev, "equity_roe": wf["equity_roe"]}
+
+
+class CommonRandomNumbers:
+    # one set of default uniforms and FX shocks shared by every scenario evaluated against it
+    def __init__(self, fx: pd.DataFrame | MarketData, rates: pd.DataFrame, weights: dict[str, float], inputs: dict):
+        self.inputs = inputs
+        self.returns, self.s0 = returns_and_spot(fx)
+        self.weights = np.array([weights[c] for c in self.s0.index])
+        self.carry = rate_differentials(rates, list(self.s0.index))
+        self.importance = inputs["variance_reduction"] == "importance"
+        self.dtype = path_dtype(inputs["precision"])
+        self.streams = RngStreams(inputs["seed"])
+        dim = sobol_dim(inputs["tenor_years"] * 12, len(self.s0), inputs["simulation_mode"])
+        self.u = default_uniforms(int(inputs["paths"]), variance_reduction=inputs["variance_reduction"], streams=self.streams, sobol_dim=dim)
+        self.mu = self.returns.mean().values
+        self.fx_log_w = np.zeros(len(self.u))
+        self.log_paths = None
+
+    def _chunks(self):
+        inp = self.inputs
+        fx_tilt = inp["is_fx_tilt"] if self.importance else 0.0
+        return iter_log_paths(
+            self.returns, inp["tenor_years"], len(self.u), inp["simulation_mode"], inp["corr_stress"], variance_reduction=inp["variance_reduction"], fx_tilt=fx_tilt, dtype=self.dtype, streams=self.streams, block_length=inp["block_length"]
+        )
+
+    def cache_paths(self, max_bytes: int) -> bool:
+        # keep every cumulative log path when they fit in ``max_bytes``, so later month lookups skip regenerating shocks
+        n_ccy, months = len(self.s0), self.inputs["tenor_years"] * 12
+        if self.log_paths is None and len(self.u) * months * n_ccy * self.dtype.itemsize <= max_bytes:
+            self.log_paths = np.empty((len(self.u), months, n_ccy), self.dtype)
+            for start, log_paths, log_w in self._chunks():
+                self.log_paths[start : start + len(log_paths)] = log_paths
+                self.fx_log_w[start : start + len(log_paths)] = log_w
+        return self.log_paths is not None
+
+    def sampled_pd(self, pd_annual: float) -> float:
+        return importance_pd(pd_annual, self.inputs["is_pd_tilt"]) if self.importance else pd_annual
+
+    def default_times(self, pd_annual: float) -> np.ndarray:
+        return default_time_from_uniforms(self.u, self.sampled_pd(pd_annual), self.inputs["tenor_years"])
+
+    def path_weights(self, dt: np.ndarray, pd_annual: float) -> np.ndarray | None:
+        if not self.importance:
+            return None
+        log_w = self.fx_log_w + default_log_likelihood_ratio(dt, pd_annual, self.sampled_pd(pd_annual), self.inputs["tenor_years"])
+        return np.exp(log_w - log_w.max())
+
+    def log_fx_at(self, month_idx: np.ndarray) -> np.ndarray:
+        # (n_sets, n_paths) month indices -> (n_sets, n_paths, n_ccy) cumulative log-returns, one pass over the shocks
+        month_idx = np.atleast_2d(month_idx)
+        if self.log_paths is not None:
+            return self.log_paths[np.arange(len(self.u)), month_idx]
+        out = np.empty(month_idx.shape + (len(self.s0),), self.dtype)
+        for start, log_paths, log_w in self._chunks():
+            rows = slice(start, start + len(log_paths))
+            out[:, rows] = log_paths[np.arange(len(log_paths)), month_idx[:, rows]]
+            self.fx_log_w[rows] = log_w
+        return out
+
+    def losses(self, dt: np.ndarray, log_fx: np.ndarray, month_idx: np.ndarray, vol_mult: np.ndarray) -> np.ndarray:
+        # vol multipliers scale shock deviations around the drift, so every vol cell reuses the same draws
+        inp = self.inputs
+        vol_mult = np.atleast_1d(np.asarray(vol_mult, dtype=float))
+        n_paths, n_ccy = log_fx.shape
+        drift = (month_idx[:, None] + 1) * self.mu
+        scaled = drift + vol_mult[:, None, None] * (log_fx - drift)
+        fx_at = (self.s0.values * np.exp(scaled)).reshape(-1, n_ccy).astype(self.dtype, copy=False)
+        t_eval = np.tile(evaluation_time(dt, inp["tenor_years"]), len(vol_mult))
+        _, mtm = portfolio_mtm(fx_at, self.s0.values, inp["portfolio_notional"], self.weights, self.carry, t_eval, inp["mtm_phase"], inp["ccs_weight"], out=fx_at)
+        flags = np.tile((~np.isnan(dt)).astype(float), len(vol_mult))
+        return payout_distribution(mtm, flags, inp["portfolio_notional"], contract_from_inputs(inp)).reshape(len(vol_mult), n_paths)
+
+    def metrics(self, losses: np.ndarray, path_weights: np.ndarray | None = None) -> dict[str, float]:
+        return scenario_metrics(losses, self.inputs, path_weights)
+
+    def grid(self, pd_grid: np.ndarray, vol_grid: np.ndarray) -> dict[str, np.ndarray]:
+        dts = [self.default_times(p) for p in pd_grid]
+        idx = np.stack([default_month(dt, self.inputs["tenor_years"]) for dt in dts])
+        log_fx = self.log_fx_at(idx)
+        out = {k: np.empty((len(pd_grid), len(vol_grid))) for k in GRID_METRICS}
+        for i, (p, dt) in enumerate(zip(pd_grid, dts)):
+            w = self.path_weights(dt, p)
+            for j, losses in enumerate(self.losses(dt, log_fx[i], idx[i], vol_grid)):
+                for k, v in self.metrics(losses, w).items():
+                    if k in out:
+                        out[k][i, j] = v
+        return out
+
+
+@profiled("sensitivity_grid")
+def sensitivity_grid(
+    fx: pd.DataFrame | MarketData, rates: pd.DataFrame, weights: dict[str, float], inputs: dict, pd_grid: np.ndarray, vol_grid: np.ndarray
+) -> dict[str, np.ndarray]:
+    return CommonRandomNumbers(fx, rates, weights, inputs).grid(np.asarray(pd_grid), np.asarray(vol_grid))
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import numpy as np
 import pandas as pd
+import pytest
 
 from mtm_guarantee.market.fx import apply_quote_convention
 from mtm_guarantee.guarantee.contract import GuaranteeContract
@@ -45,3 +46,696 @@ def test_loader_reads_all_currencies_if_present(tmp_path):
     fx_out, _, missing = load_market_data(str(p), DEFAULT_CURRENCIES)
     assert sorted(fx_out["currency"].unique().tolist()) == sorted(DEFAULT_CURRENCIES)
     assert missing == []
+
+
+from mtm_guarantee.market.simulation import simulate_fx_at_months, simulate_fx_paths
+
+
+def _synthetic_returns(n_ccy=3, n_obs=60, seed=0):
+    rng = np.random.default_rng(seed)
+    ccys = [f"C{i}" for i in range(n_ccy)]
+    rets = pd.DataFrame(rng.normal(0.002, 0.03, size=(n_obs, n_ccy)), columns=ccys)
+    return rets, pd.Series(np.linspace(1.0, 100.0, n_ccy), index=ccys)
+
+
+def test_streaming_fx_matches_dense():
+    rets, s0 = _synthetic_returns()
+    idx = np.random.default_rng(1).integers(0, 24, size=500)
+    for mode in ["historical", "parametric"]:
+        dense = simulate_fx_paths(rets, s0, 2, 500, mode=mode)
+        at, snaps, _ = simulate_fx_at_months(rets, s0, 2, idx, mode=mode, chunk_size=77, snapshots=[0, 23])
+        assert np.array_equal(at, dense[np.arange(500), idx])
+        assert np.array_equal(snaps, dense[:, [0, 23]])
+
+
+from mtm_guarantee.capital.loss_dist import QuantileSketch, TailAccumulator, exceedance_curve, var_es
+
+
+def test_exceedance_curve_matches_threshold_loop():
+    losses = np.maximum(np.random.default_rng(2).normal(0, 1, 5000), 0.0)
+    xs, ys = exceedance_curve(losses, 50)
+    assert np.allclose(ys, [(losses > x).mean() for x in xs])
+
+
+def test_tail_accumulator_chunked_and_merged_matches_var_es():
+    losses = np.maximum(np.random.default_rng(3).lognormal(0, 1, 20_000) - 2.0, 0.0)
+    a, b = TailAccumulator(0.995, tail_size=500), TailAccumulator(0.995, tail_size=500)
+    for chunk in np.array_split(losses[:12_000], 7):
+        a.update(chunk)
+    b.update(losses[12_000:])
+    assert np.allclose(a.merge(b).result(), var_es(losses, 0.995))
+    xs, ys = a.exceedance_curve(20)
+    tail = xs >= np.sort(losses)[-500]
+    assert np.allclose(ys[tail], [(losses > x).mean() for x in xs[tail]])
+    small = TailAccumulator(0.995, tail_size=10).update(losses)
+    assert not small.exact and np.isclose(small.result()[1], var_es(losses, 0.995)[1], rtol=0.02)
+    # capped losses: the buffer starts exactly at VaR while ties at the cap spill out of it; the tail is still exact
+    rng = np.random.default_rng(5)
+    capped = np.concatenate([rng.uniform(0, 100, 9_770), np.full(200, 100.0), rng.uniform(100, 200, 30)])
+    acc = TailAccumulator(0.995, tail_size=80).update(capped)
+    assert np.sort(acc.top)[0] == 100.0 and acc.result()[1] == 100.0
+    assert np.isclose(acc.result()[2], var_es(capped, 0.995, np.ones(len(capped)))[2], rtol=1e-12)
+
+
+def test_quantile_sketch_relative_error():
+    x = np.random.default_rng(4).exponential(1.0, 10_000)
+    s = QuantileSketch(0.01).update(x[:5000]).merge(QuantileSketch(0.01).update(x[5000:]))
+    assert abs(s.quantile(0.9) / np.quantile(x, 0.9) - 1) < 0.02
+
+
+from mtm_guarantee.instruments.mtm_proxy import blend_ccs_ndf, mtm_phase0, mtm_phase1, portfolio_mtm
+
+
+def test_portfolio_mtm_matches_per_currency_loop():
+    rng = np.random.default_rng(5)
+    s0, fx_at = np.array([1.0, 50.0, 3000.0]), np.array([1.0, 50.0, 3000.0]) * rng.lognormal(0, 0.2, (400, 3))
+    w, carry, t = np.array([0.5, 0.3, 0.2]), np.array([0.05, 0.08, -0.01]), rng.uniform(0, 5, 400)
+    per_ccy, total = portfolio_mtm(fx_at, s0, 1e6, w, carry, t, "phase1", 0.8)
+    for j in range(3):
+        ccs = mtm_phase1(1e6 * w[j], s0[j], fx_at[:, j], np.full(400, carry[j]), t)
+        ndf = mtm_phase1(1e6 * w[j], s0[j], fx_at[:, j], np.full(400, carry[j] * 0.5), t)
+        assert np.allclose(per_ccy[:, j], blend_ccs_ndf(ccs, ndf, 0.8))
+    assert np.allclose(total, per_ccy.sum(axis=1))
+    per_ccy0, _ = portfolio_mtm(fx_at, s0, 1e6, w, carry, t, "phase0")
+    assert np.allclose(per_ccy0[:, 1], mtm_phase0(1e6 * w[1], s0[1], fx_at[:, 1]))
+
+
+from mtm_guarantee import pipeline
+from mtm_guarantee.cache import ResultCache
+from mtm_guarantee.config import DEFAULT_SCENARIO
+
+
+def _synthetic_market(n_ccy=3, n_obs=80, seed=0):
+    rng = np.random.default_rng(seed)
+    ccys = DEFAULT_CURRENCIES[:n_ccy]
+    dates = pd.date_range("2010-01-31", periods=n_obs, freq=pd.offsets.MonthEnd())
+    levels = 10.0 ** np.arange(n_ccy) * np.exp(np.cumsum(rng.normal(0.003, 0.03, (n_obs, n_ccy)), axis=0))
+    fx = pd.DataFrame([(c, d, levels[i, j]) for j, c in enumerate(ccys) for i, d in enumerate(dates)], columns=["currency", "date", "fx"])
+    rates = pd.DataFrame({"Date": dates, "USD": 2.0, **{c: 6.0 + j for j, c in enumerate(ccys)}})
+    inputs = dict(DEFAULT_SCENARIO, paths=2000, corr_stress=1.0, liq_floor_pct=0.02)
+    return apply_quote_convention(fx, {}), rates, {c: 1 / n_ccy for c in ccys}, inputs
+
+
+def test_result_cache_reprices_contract_edits_without_resimulating():
+    fx, rates, weights, inputs = _synthetic_market()
+    cache = ResultCache()
+    base = pipeline.run_model(fx, rates, weights, inputs, cache=cache)
+    edited = dict(inputs, attachment=0.05, capital_method="VaR", overlay_pct=0.0)
+    res = pipeline.run_model(fx, rates, weights, edited, cache=cache)
+    assert (cache.hits, cache.misses, len(cache)) == (1, 1, 1)
+    assert np.isclose(res["cap"], pipeline.run_model(fx, rates, weights, edited)["cap"])
+    assert res["el"] < base["el"]
+    pipeline.run_model(fx, rates, weights, dict(inputs, pd_annual=0.08), cache=cache)
+    assert cache.misses == 2
+
+
+def test_result_cache_evicts_lru_beyond_budget():
+    cache = ResultCache(max_bytes=2 * 8000)
+    for k in "abc":
+        cache.put(k, np.zeros(1000))
+    cache.get("b")
+    cache.put("d", np.zeros(1000))
+    assert "a" not in cache and "c" not in cache and "b" in cache and cache.nbytes <= cache.max_bytes
+
+
+from mtm_guarantee.io import market_cache
+
+
+def test_loader_columnar_cache_roundtrip_and_invalidate(tmp_path, monkeypatch):
+    p = tmp_path / "test.xlsx"
+    dates = pd.date_range("2020-01-31", periods=4, freq=pd.offsets.MonthEnd())
+    fx = pd.DataFrame([(c, d, 100.5 + i) for c in DEFAULT_CURRENCIES[:3] for i, d in enumerate(dates)], columns=["Currency", "Date", "fx"])
+    with pd.ExcelWriter(p) as w:
+        fx.to_excel(w, sheet_name="Historical_fx", index=False)
+        pd.DataFrame({"Date": dates, "USD": [5.0] * 4, "UGX": [7.0] * 4}).to_excel(w, sheet_name="Rates", index=False)
+    cache_dir = str(tmp_path / "cache")
+    cold = load_market_data(str(p), DEFAULT_CURRENCIES, cache_dir=cache_dir)
+    monkeypatch.setattr("mtm_guarantee.io.excel_loader.read_workbook", lambda path: pytest.fail("cache miss"))
+    warm = load_market_data(str(p), DEFAULT_CURRENCIES, cache_dir=cache_dir)
+    pd.testing.assert_frame_equal(cold[0], warm[0])
+    pd.testing.assert_frame_equal(cold[1], warm[1])
+    assert cold[2] == warm[2] == sorted(DEFAULT_CURRENCIES[3:])
+    assert market_cache.invalidate(str(p), cache_dir) == 1 and market_cache.read_entry(str(p), cache_dir) is None
+
+
+from mtm_guarantee.sensitivity import GRID_INPUTS, sensitivity_grid
+
+
+def test_sensitivity_grid_matches_run_model_and_is_monotone_in_pd():
+    fx, rates, weights, inputs = _synthetic_market()
+    grid = sensitivity_grid(fx, rates, weights, inputs, [0.02, inputs["pd_annual"], 0.08], [0.8, 1.0, 1.3])
+    res = pipeline.run_model(fx, rates, weights, inputs)
+    assert np.isclose(grid["es"][1, 1], res["es"]) and np.isclose(grid["cap"][1, 1], res["cap"])
+    assert (np.diff(grid["el"], axis=0) > 0).all() and (np.diff(grid["el"], axis=1) > 0).all()
+    # GRID_INPUTS is all it reads, so the dashboard can key its cache on them alone
+    reduced = sensitivity_grid(fx, rates, weights, {k: inputs[k] for k in GRID_INPUTS}, [0.02, inputs["pd_annual"], 0.08], [0.8, 1.0, 1.3])
+    assert all(np.array_equal(reduced[k], grid[k]) for k in grid)
+
+
+from mtm_guarantee.batch import read_scenarios, run_batch
+
+
+def _write_workbook(path, fx, rates):
+    with pd.ExcelWriter(path) as w:
+        fx.rename(columns={"currency": "Currency", "date": "Date"})[["Currency", "Date", "fx"]].to_excel(w, sheet_name="Historical_fx", index=False)
+        rates.to_excel(w, sheet_name="Rates", index=False)
+
+
+def test_batch_runner_writes_results_and_tearsheets(tmp_path):
+    fx, rates, weights, inputs = _synthetic_market()
+    _write_workbook(tmp_path / "fx.xlsx", fx, rates)
+    (tmp_path / "s.json").write_text('[{"scenario": "base", "paths": 2000}, {"scenario": "stress pd", "paths": 2000, "pd_annual": 0.1}]')
+    out = tmp_path / "out"
+    res = run_batch(read_scenarios(str(tmp_path / "s.json")), str(tmp_path / "fx.xlsx"), str(out), list(weights), workers=2, cache_dir=str(tmp_path / "cache"))
+    assert list(res["scenario"]) == ["base", "stress pd"] and res.loc[1, "el"] > res.loc[0, "el"]
+    assert np.isclose(res.loc[0, "es"], pipeline.run_model(fx, rates, weights, inputs)["es"])
+    assert (out / "results.csv").exists() and (out / "tearsheets" / "stress_pd.md").exists()
+
+
+def test_weighted_var_es_matches_discrete_tail():
+    losses = np.arange(1000.0)
+    el, var, es = var_es(losses, 0.99, weights=np.full(1000, 3.0))
+    assert np.isclose(el, 499.5) and var == 989.0 and np.isclose(es, losses[990:].mean())
+
+
+@pytest.mark.parametrize("vr", ["antithetic", "sobol", "importance"])
+def test_variance_reduction_modes_agree_with_plain_reference(vr):
+    fx, rates, weights, inputs = _synthetic_market()
+    ref = pipeline.run_model(fx, rates, weights, dict(inputs, paths=40_000))
+    res = pipeline.run_model(fx, rates, weights, dict(inputs, paths=4000, variance_reduction=vr))
+    for k in ("el", "es"):
+        assert abs(res[k] - ref[k]) < 4 * np.hypot(res["se"][k], ref["se"][k])
+
+
+@pytest.mark.parametrize("mode", ["historical", "parametric"])
+def test_sobol_default_uniforms_independent_of_fx_within_each_replicate(mode):
+    # two scrambled sequences read at the same index share their leading digit, which made default and FX dependent
+    from mtm_guarantee.credit.default_model import default_uniforms
+    from mtm_guarantee.market.simulation import ShockSampler, sobol_dim
+    from mtm_guarantee.sampling import SOBOL_BLOCK, SOBOL_REPLICATES
+
+    rets, _ = _synthetic_returns()
+    streams, n = RngStreams(42), 16 * SOBOL_BLOCK * SOBOL_REPLICATES
+    u = default_uniforms(n, variance_reduction="sobol", streams=streams, sobol_dim=sobol_dim(12, 3, mode))
+    x = ShockSampler(rets, 12, mode, variance_reduction="sobol", streams=streams).draw(0, n)[0][:, 0, 0]
+    low_u, low_x = u < 0.5, x < np.median(x)
+    rep = (np.arange(n) // SOBOL_BLOCK) % SOBOL_REPLICATES
+    for r in range(SOBOL_REPLICATES):
+        assert abs(np.corrcoef(low_u[rep == r], low_x[rep == r])[0, 1]) < 0.1
+
+
+from concurrent.futures import ThreadPoolExecutor
+
+from mtm_guarantee.market.correlations import cholesky_factor, correlation_factor, nearest_psd, stressed_corr
+
+
+def test_nearest_psd_repairs_overstressed_correlation():
+    corr = np.array([[1.0, 0.9, -0.9], [0.9, 1.0, 0.9], [-0.9, 0.9, 1.0]])
+    fixed = nearest_psd(corr)
+    assert np.linalg.eigvalsh(fixed).min() > 0 and np.allclose(np.diag(fixed), 1.0)
+
+
+def test_corr_stress_changes_correlation_not_vol_and_factor_is_cached():
+    rets, s0 = _synthetic_returns(n_obs=120)
+    rets["C1"] = 0.7 * rets["C0"] + 0.3 * rets["C1"]
+    assert cholesky_factor(rets, 1.3) is cholesky_factor(rets, 1.3)
+    factor = cholesky_factor(rets, 1.3)
+    assert np.allclose(factor @ factor.T, nearest_psd(stressed_corr(rets, 1.3).values))
+    assert np.allclose(factor, correlation_factor(rets.corr().values, 1.3))
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        factors = list(pool.map(lambda s: cholesky_factor(rets, 1.0 + s % 4 / 10), range(64)))
+    assert all(f is cholesky_factor(rets, 1.0 + s % 4 / 10) for s, f in enumerate(factors))
+    base = np.diff(np.log(simulate_fx_paths(rets, s0, 10, 400, mode="parametric")), axis=1).reshape(-1, 3)
+    stressed = np.diff(np.log(simulate_fx_paths(rets, s0, 10, 400, mode="parametric", corr_stress=1.3)), axis=1).reshape(-1, 3)
+    assert np.allclose(stressed.std(axis=0), base.std(axis=0), rtol=0.03)
+    assert np.corrcoef(stressed.T)[0, 1] > np.corrcoef(base.T)[0, 1] + 0.03
+
+
+from mtm_guarantee.market.simulation import iter_log_paths
+from mtm_guarantee.rng import RngStreams, path_ranges
+
+
+@pytest.mark.parametrize("vr", ["none", "antithetic", "sobol", "importance"])
+def test_multi_worker_run_reproduces_single_process_losses(vr):
+    fx, rates, weights, inputs = _synthetic_market()
+    inputs = dict(inputs, paths=5000, variance_reduction=vr, simulation_mode="parametric")
+    single = pipeline.run_model(fx, rates, weights, inputs)
+    split = pipeline.run_model(fx, rates, weights, inputs, workers=3)
+    assert np.array_equal(single["losses"], split["losses"]) and single["es"] == split["es"]
+    assert path_ranges(5000, 3) == [(0, 2000), (2000, 4000), (4000, 5000)]
+
+
+def test_rng_streams_are_independent_of_chunking():
+    rets, _ = _synthetic_returns()
+    streams = RngStreams(11)
+    dense = np.concatenate([p for _, p, _ in iter_log_paths(rets, 2, 4500, chunk_size=4500, streams=streams)])
+    chunked = np.concatenate([p for _, p, _ in iter_log_paths(rets, 2, 4500, chunk_size=700, streams=streams)])
+    tail = next(iter_log_paths(rets, 2, 500, chunk_size=300, streams=streams, start=4000))[1]
+    assert np.array_equal(dense, chunked) and np.array_equal(dense[4000:4300], tail)
+    assert streams.generator("fx", 3).random() == RngStreams(11).generator("fx", 3).random() != RngStreams(12).generator("fx", 3).random()
+
+
+from mtm_guarantee.market.fx import MarketData, monthly_returns
+
+
+def test_market_data_inversion_flips_columns_of_shared_pivot():
+    fx, rates, weights, inputs = _synthetic_market()
+    base = MarketData.from_long(fx)
+    c = base.currencies[1]
+    flipped = base.with_inversions({c: True, "XXX": True})
+    legacy = apply_quote_convention(fx, {c: True})
+    assert flipped.inverted == (c,) and flipped.raw is base.raw
+    assert np.allclose(flipped.returns, monthly_returns(legacy)) and np.allclose(flipped.returns[c], -base.returns[c])
+    assert np.isclose(flipped.s0[c], 1 / base.s0[c]) and flipped.fingerprint != base.fingerprint
+    assert pipeline.run_model(base, rates, weights, inputs)["es"] == pipeline.run_model(fx, rates, weights, inputs)["es"]
+
+
+from mtm_guarantee.capital.liquidity import liquidity_buffer, sparse_quantile, worst_window_claims
+from mtm_guarantee.capital.loss_dist import weighted_quantile
+
+
+def test_liquidity_rolling_windows_match_dense_cash_flows():
+    rng = np.random.default_rng(3)
+    n, months = 500, 24
+    dense = np.where(rng.random((n, months)) < 0.02, rng.exponential(1.0, (n, months)), 0.0)
+    path, month = np.nonzero(dense)
+    for window in (1, 3):
+        rolling = np.lib.stride_tricks.sliding_window_view(dense, window, axis=1).sum(axis=2).max(axis=1)
+        paths, worst = worst_window_claims(path, month, dense[path, month], window)
+        assert np.allclose(worst, rolling[paths]) and not rolling[np.setdiff1d(np.arange(n), paths)].any()
+        w = rng.random(n)
+        assert np.isclose(sparse_quantile(worst, 0.9, n, w[paths], w.sum()), weighted_quantile(rolling, 0.9, w))
+    losses = np.where(rng.random(2000) < 0.1, rng.exponential(5.0, 2000), 0.0)
+    liq = liquidity_buffer(losses, rng.integers(0, 60, 2000), 60, 0.0, 1.0)
+    assert np.isclose(liq["1m_99"], np.quantile(losses, 0.99, method="inverted_cdf")) and liq["3m_99"] == liq["1m_99"]
+
+
+from mtm_guarantee.instruments.exposure import grid_exposure
+
+
+def test_exposure_profile_matches_dense_grid():
+    fx, rates, weights, inputs = _synthetic_market()
+    inputs = dict(inputs, tenor_years=2, paths=3000)
+    prof = pipeline.exposure_from_inputs(fx, rates, weights, inputs)
+    fxr, s0 = pipeline.returns_and_spot(fx)
+    log_paths = next(iter_log_paths(fxr, 2, 3000, chunk_size=3000, streams=RngStreams(inputs["seed"])))[1]
+    carry = pipeline.rate_differentials(rates, list(s0.index))
+    t = (np.arange(24) + 1) / 12
+    dense = grid_exposure(s0.values * np.exp(log_paths), s0.values, inputs["portfolio_notional"], np.full(3, 1 / 3), carry, t, "blend", inputs["mtm_phase"], inputs["ccs_weight"])
+    assert np.allclose(prof.ee, dense.mean(axis=0)) and np.allclose(prof.epe, dense.mean(axis=(0, 1)))
+    exact = np.quantile(dense, 0.99, axis=0, method="inverted_cdf")
+    assert np.allclose(prof.pfe[0.99], exact, rtol=0.011)
+    assert len(prof.to_frame()) == 24 * 4
+
+
+from mtm_guarantee.credit.obligors import copula_loadings, obligor_losses, synthetic_book
+
+
+def test_obligor_copula_default_rates_correlation_and_wrong_way():
+    fx, rates, weights, inputs = _synthetic_market()
+    fxr, s0 = pipeline.returns_and_spot(fx)
+    carry = pipeline.rate_differentials(rates, list(s0.index))
+    book = synthetic_book(list(s0.index), np.full(3, 1 / 3), 1e8, 60, 0.04, 0.6)
+    counts = {}
+    for rho in (0.0, 0.3):
+        pairs = obligor_losses(fxr, s0, carry, book, copula_loadings(book, 3, rho), 5, 4000, streams=RngStreams(1))
+        counts[rho] = np.bincount(pairs.path, minlength=4000)
+        assert abs(len(pairs.path) / (4000 * len(book)) - (1 - 0.96**5)) < 0.01 and (pairs.time < 5).all()
+    assert counts[0.3].var() > 3 * counts[0.0].var()
+    obligor = dict(inputs, credit_model="obligor", n_obligors=60, lgd=0.6)
+    base = pipeline.run_model(fx, rates, weights, obligor)
+    assert np.isclose(pipeline.run_model(fx, rates, weights, dict(obligor, lgd=0.3))["el"], base["el"] / 2)
+    assert pipeline.run_model(fx, rates, weights, dict(obligor, wrong_way=0.5))["el"] > base["el"]
+    assert np.array_equal(pipeline.run_model(fx, rates, weights, dict(obligor, paths=5000), workers=2)["losses"], pipeline.run_model(fx, rates, weights, dict(obligor, paths=5000))["losses"])
+
+
+def test_wrong_way_hazard_uses_fx_up_to_default_only():
+    from mtm_guarantee.credit.dependence import adjust_pd_for_fx
+
+    fx, rates, weights, inputs = _synthetic_market()
+    fxr, s0 = pipeline.returns_and_spot(fx)
+    carry = pipeline.rate_differentials(rates, list(s0.index))
+    book = synthetic_book(list(s0.index), np.full(3, 1 / 3), 1e8, 30, 0.04, 0.6)
+    loadings, mu = copula_loadings(book, 3, 0.2), fxr.mean().values
+    logs = np.concatenate([p for _, p, _ in iter_log_paths(fxr, 5, 4000, streams=RngStreams(1))])
+    drift_free = {}
+    for ww in (0.0, 1e-12, 1.0):
+        pairs = obligor_losses(fxr, s0, carry, book, loadings, 5, 4000, wrong_way=ww, streams=RngStreams(1))
+        ccy, m = book.currency[pairs.obligor], np.minimum((pairs.time * 12).astype(int), 59)
+        after = logs[pairs.path, -1, ccy] - logs[pairs.path, m, ccy] - mu[ccy] * (59 - m)
+        drift_free[ww] = (after / np.sqrt(60 - m)).mean()
+        if ww == 1e-12:  # a vanishing tilt through the monthly hazard reproduces the closed-form default times
+            assert np.array_equal(pairs.path, base.path) and np.allclose(pairs.time, base.time)
+        base = pairs
+    # FX after the default month is independent of the default; tilting on terminal FX gave about -0.018
+    assert abs(drift_free[1.0]) < 0.003 and abs(drift_free[0.0]) < 0.003
+    assert np.array_equal(adjust_pd_for_fx(np.array([0.0, 0.01]), np.array([-5.0, -5.0]), 1.0), [0.0, 1e-4])
+
+
+def test_obligor_marginal_capital_matches_payout_without_that_obligor():
+    fx, rates, weights, inputs = _synthetic_market()
+    obligor = dict(inputs, credit_model="obligor", n_obligors=12, attachment=0.02)
+    stage = pipeline.market_credit_stage(fx, rates, weights, obligor)
+    res = pipeline.reprice(stage, obligor)
+    alloc = res["obligor_allocation"]
+    assert "marginal_capital" not in alloc  # off the repricing hot path
+    alloc["marginal_capital"] = pipeline.marginal_allocation(stage, {k: obligor[k] for k in pipeline.CAPITAL_INPUTS}, res["losses"])[1]
+    j = int(alloc["euler_capital"].idxmax())
+    pairs = stage.obligor_pairs
+    removed = np.bincount(pairs.path[pairs.obligor == j], weights=pairs.loss[pairs.obligor == j], minlength=len(res["losses"]))
+    _, var, es = var_es(pipeline.losses_without(stage, obligor, removed), obligor["capital_confidence"])
+    cap_without = pipeline.required_capital(var, es, obligor["capital_method"], obligor["overlay_pct"])
+    assert alloc["marginal_capital"][j] > 0 and np.isclose(alloc["marginal_capital"][j], res["cap"] - cap_without)
+    assert np.allclose(pipeline.obligor_marginal_capital(stage, obligor, res["losses"], block=5), alloc["marginal_capital"])
+
+
+def test_supplied_obligor_book_drives_per_obligor_pd_lgd_and_cache_key(tmp_path):
+    fx, rates, weights, inputs = _synthetic_market()
+    fxr, s0 = pipeline.returns_and_spot(fx)
+    carry = pipeline.rate_differentials(rates, list(s0.index))
+    ccys = list(s0.index)
+    book = pd.DataFrame(
+        {"obligor": ["safe", "risky", "mid"], "currency": [ccys[0], ccys[1], ccys[2]], "notional": [3e7, 3e7, 4e7], "pd": [0.0, 0.3, 0.1], "lgd": [1.0, 0.5, 1.0]}
+    )
+    path = tmp_path / "book.csv"
+    book.to_csv(path, index=False)
+    obligor = dict(inputs, credit_model="obligor", obligor_book=str(path))
+    w = np.array([weights[c] for c in ccys])
+    pairs = pipeline.simulate_obligor_range(fxr, s0, carry, w, obligor, RngStreams(obligor["seed"]), 0, 20_000)[5]
+    freq = np.bincount(pairs.obligor, minlength=3) / 20_000
+    assert freq[0] == 0 and np.allclose(freq[1:], 1 - (1 - book["pd"].to_numpy()[1:]) ** obligor["tenor_years"], atol=0.01)
+    key = pipeline.market_credit_key(fx, rates, weights, obligor)
+    assert key != pipeline.market_credit_key(fx, rates, weights, dict(obligor, obligor_book=""))
+    # the key holds only what the stage reads: the book replaces lgd / n_obligors, the single model ignores the copula
+    assert pipeline.market_credit_key(fx, rates, weights, dict(obligor, lgd=0.1, n_obligors=7)) == key
+    synthetic = dict(obligor, obligor_book="")
+    assert pipeline.market_credit_key(fx, rates, weights, dict(synthetic, lgd=0.1)) != pipeline.market_credit_key(fx, rates, weights, synthetic)
+    single = pipeline.market_credit_key(fx, rates, weights, inputs)
+    assert pipeline.market_credit_key(fx, rates, weights, dict(inputs, lgd=0.1, copula_rho=0.5, wrong_way=0.3)) == single
+
+    # LGD scales that obligor's close-out losses only, on the same draws
+    book.loc[1, "lgd"] = 1.0
+    book.to_csv(path, index=False)
+    full = pipeline.simulate_obligor_range(fxr, s0, carry, w, obligor, RngStreams(obligor["seed"]), 0, 20_000)[5]
+    risky = pairs.obligor == 1
+    assert np.array_equal(full.path, pairs.path) and np.allclose(full.loss[risky], 2 * pairs.loss[risky]) and np.allclose(full.loss[~risky], pairs.loss[~risky])
+    assert pipeline.market_credit_key(fx, rates, weights, obligor) != key
+
+
+from mtm_guarantee.capital.allocation import euler_contributions, pro_rata_shares, row_var_es
+
+
+def test_euler_allocation_adds_up_and_marginal_matches_rerun_without_currency():
+    fx, rates, weights, inputs = _synthetic_market()
+    res = pipeline.run_model(fx, rates, weights, dict(inputs, attachment=0.02), marginal=True)
+    alloc = res["allocation"]
+    assert np.isclose(alloc["euler_es"].sum(), res["es"]) and np.isclose(alloc["euler_capital"].sum(), res["cap"])
+    c = alloc["currency"][1]
+    without = pipeline.run_model(fx, rates, {**weights, c: 0.0}, dict(inputs, attachment=0.02))
+    assert np.isclose(alloc["marginal_capital"][1], res["cap"] - without["cap"])
+    rng = np.random.default_rng(0)
+    raw = rng.exponential(1.0, (5000, 4))
+    losses = raw.sum(axis=1)
+    _, var, es = var_es(losses, 0.99)
+    exact = euler_contributions(losses, pro_rata_shares(raw), 0.99, bandwidth=0.0)["es"]
+    assert np.allclose(exact, raw[losses >= var].mean(axis=0))
+    rows, w = rng.exponential(1.0, (3, 5000)), rng.random(5000)
+    for weights_ in (None, w):
+        assert np.allclose(np.array(row_var_es(rows, 0.99, weights_)).T, [var_es(r, 0.99, weights_) for r in rows])
+
+
+from mtm_guarantee.capital.stack import LossLadder, optimise_stack, pareto_frontier
+
+
+def test_vectorised_waterfall_and_stack_optimiser():
+    lev, mezz = np.array([5.0, 10.0])[:, None], np.array([0.0, 0.1, 0.2])
+    grid = waterfall(1e8, 300, 10, 5, 1e6, 1e8 * mezz, 0.08, 5e7, 80, 1e8 / lev, 0.2)
+    for i, j in np.ndindex(2, 3):
+        one = waterfall(1e8, 300, 10, 5, 1e6, 1e8 * mezz[j], 0.08, 5e7, 80, 1e8 / lev[i, 0], 0.2)
+        assert all(np.isclose(grid[k][i, j], v) for k, v in one.items())
+    losses = np.random.default_rng(0).lognormal(12, 1.2, 5000)
+    ladder = LossLadder(losses)
+    assert np.isclose(ladder.layer_loss(1e6, 3e6), np.clip(losses - 1e6, 0, 2e6).mean()) and np.isclose(ladder.exceedance(1e6), (losses > 1e6).mean())
+    best, table = optimise_stack(losses, 1e8, 500, 10, 5, 80, 0.2, min_mezz_icr=2.0)
+    feasible = table[table["feasible"]]
+    assert best["equity_roe"] == feasible["equity_roe"].max() and (feasible["senior_attach"] >= var_es(losses, 0.995)[2]).all()
+    front = pareto_frontier(table)
+    assert front["p_mezz_loss"].is_monotonic_increasing and front["equity_roe"].is_monotonic_increasing
+
+
+from mtm_guarantee.market.simulation import BOOTSTRAP_MODES
+
+
+@pytest.mark.parametrize("vr", ["none", "antithetic"])
+def test_block_bootstrap_prefix_sums_match_dense_gather(vr):
+    rets, s0 = _synthetic_returns(n_obs=30)
+    idx = np.random.default_rng(2).integers(0, 48, size=900)
+    for mode in BOOTSTRAP_MODES:
+        for streams in (None, RngStreams(5, block_size=256)):
+            dense = simulate_fx_paths(rets, s0, 4, 900, mode=mode, variance_reduction=vr, block_length=5) if streams is None else None
+            ref = dense[np.arange(900), idx] if dense is not None else None
+            if streams is not None:
+                paths = np.concatenate([p for _, p, _ in iter_log_paths(rets, 4, 900, mode, variance_reduction=vr, streams=streams, block_length=5)])
+                ref = s0.values * np.exp(paths[np.arange(900), idx])
+            at, _, _ = simulate_fx_at_months(rets, s0, 4, idx, mode=mode, chunk_size=301, variance_reduction=vr, streams=streams, block_length=5)
+            np.testing.assert_allclose(at, ref, rtol=1e-10)
+    # one block spanning the tenor replays a contiguous (circular) stretch of history across all currencies
+    paths = simulate_fx_paths(rets, s0, 1, 50, mode="block_bootstrap", block_length=12)
+    shocks = np.diff(np.log(paths / s0.values), axis=1, prepend=0.0)
+    hist = np.tile(rets.values, (2, 1))
+    starts = [np.flatnonzero(np.isclose(hist[:30, 0], s[0, 0]))[0] for s in shocks]
+    np.testing.assert_allclose(shocks, np.stack([hist[s : s + 12] for s in starts]), atol=1e-12)
+
+
+from mtm_guarantee.breakeven import BreakevenSolver
+
+
+def test_breakeven_solver_hits_target_on_common_random_numbers():
+    fx, rates, weights, inputs = _synthetic_market()
+    cache = ResultCache()
+    solver = BreakevenSolver(fx, rates, weights, inputs, cache)
+    equity = inputs["portfolio_notional"] / inputs["target_leverage"]
+    hit = solver.solve("pd_annual", "el", 0.25 * equity, (0.001, 0.5), xtol=1e-6)
+    assert hit.converged and len(hit.evaluations) < 20
+    assert np.isclose(hit.metric_value, 0.25 * equity, rtol=1e-2)
+    # the CRN fast path prices exactly like a full run at the solved PD
+    assert np.isclose(pipeline.run_model(fx, rates, weights, dict(inputs, pd_annual=hit.value))["el"], hit.metric_value)
+    # contract inputs only reprice the cached stage: capital = ES x (1 + overlay) has a closed-form breakeven
+    res = pipeline.run_model(fx, rates, weights, inputs, cache=cache)
+    misses = cache.misses
+    hit = solver.solve("overlay_pct", "cap", 1.5 * res["es"], (0.0, 2.0), xtol=1e-8)
+    assert np.isclose(hit.value, 0.5, atol=1e-6) and cache.misses == misses
+    with pytest.raises(ValueError):
+        solver.solve("overlay_pct", "cap", 10 * res["es"], (0.0, 2.0))
+    # correlation stress is inert outside parametric mode, so it is rejected rather than reported as never crossing
+    with pytest.raises(ValueError, match="parametric"):
+        solver.solve("corr_stress", "cap", res["cap"], (0.1, 4.0))
+    parametric = BreakevenSolver(fx, rates, weights, dict(inputs, simulation_mode="parametric"), cache)
+    assert parametric.evaluate("corr_stress", 0.1)["cap"] != parametric.evaluate("corr_stress", 1.5)["cap"]
+
+
+import importlib.util
+import sys
+from pathlib import Path
+
+
+def _bench_module():
+    spec = importlib.util.spec_from_file_location("bench_pipeline", Path(__file__).parents[1] / "benchmarks" / "bench_pipeline.py")
+    mod = sys.modules[spec.name] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def test_benchmark_suite_runs_offline_and_flags_regressions():
+    bench = _bench_module()
+    current = bench.run_suite(["tiny"], ["returns", "simulate_fx_at_months", "payout", "var_es", "run_model"], repeat=1)
+    assert set(current["results"]) == {f"tiny/{s}" for s in ("returns", "simulate_fx_at_months", "payout", "var_es", "run_model")}
+    assert all(r["seconds"] > 0 and r["peak_mb"] >= 0 for r in current["results"].values())
+    assert bench.compare(current, current) == []
+    faster = {"results": {k: {"seconds": v["seconds"] / 3, "peak_mb": v["peak_mb"]} for k, v in current["results"].items()}}
+    flagged = bench.compare(current, faster, threshold=0.25, min_seconds=0.0)
+    assert len(flagged) == len(current["results"]) and all("seconds" in line for line in flagged)
+
+
+import json
+
+from mtm_guarantee.profiling import PROFILER, Profiler, profiled, use_profiler
+
+
+def test_profiler_spans_nest_and_export_chrome_trace():
+    prof = Profiler(enabled=True, memory=True)
+    with prof.span("outer"):
+        with prof.span("inner") as sp:
+            big = np.ones(1_000_000)
+            sp.record(big=big)
+        del big
+    names = [s.name for s in prof.spans]
+    assert names == ["outer", "inner"] and [s.depth for s in prof.spans] == [0, 1]
+    outer, inner = prof.spans
+    assert inner.arrays["big"] == 8_000_000 and inner.peak_bytes >= 8_000_000 and outer.peak_bytes >= inner.peak_bytes
+    assert outer.wall >= inner.wall > 0
+    trace = json.loads(prof.to_chrome_trace())["traceEvents"]
+    assert [e["name"] for e in trace] == names and all(e["ph"] == "X" for e in trace)
+    assert "· inner" in prof.to_markdown() and len(prof.to_frame()) == 2
+    prof.disable()
+    # the module-wide profiler is off by default: pipeline spans and decorators record nothing
+    fx, rates, weights, inputs = _synthetic_market()
+    PROFILER.reset()
+    pipeline.run_model(fx, rates, weights, inputs)
+    assert not PROFILER.enabled and PROFILER.spans == []
+    assert profiled("f")(lambda x: x + 1)(1) == 2
+
+
+def test_profilers_bound_per_context_do_not_share_spans_or_tracing():
+    import threading
+    import tracemalloc
+
+    fx, rates, weights, inputs = _synthetic_market()
+    a, b = Profiler(enabled=True, memory=True), Profiler(enabled=True, memory=True)
+    barrier = threading.Barrier(2)
+
+    def session(prof, seed):
+        with use_profiler(prof):
+            barrier.wait()
+            pipeline.run_model(fx, rates, weights, dict(inputs, seed=seed))
+
+    threads = [threading.Thread(target=session, args=(p, i)) for i, p in enumerate((a, b))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for prof in (a, b):
+        assert [s.name for s in prof.spans if s.depth == 0] == ["run_model"]
+        assert {s.thread for s in prof.spans} == {prof.spans[0].thread}
+    assert a.spans[0].thread != b.spans[0].thread and PROFILER.spans == []
+    # one session switching profiling off leaves tracemalloc running for the other
+    a.disable()
+    assert tracemalloc.is_tracing()
+    b.disable()
+    assert not tracemalloc.is_tracing()
+    c = Profiler(enabled=True, memory=True)
+    del c
+    assert not tracemalloc.is_tracing()
+
+
+from mtm_guarantee.jobs import JobRunner
+
+
+def test_background_job_streams_partials_and_lands_in_cache():
+    fx, rates, weights, inputs = _synthetic_market()
+    inputs = dict(inputs, paths=8000)
+    cache = ResultCache()
+    runner = JobRunner(cache, chunk_paths=2000)
+    job = runner.submit(fx, rates, weights, inputs)
+    assert runner.submit(fx, rates, weights, inputs) is job
+    assert job.wait(60) and job.state == "done" and job.partial.paths == 8000
+    ref = pipeline.run_model(fx, rates, weights, inputs)
+    assert np.isclose(job.partial.es, ref["es"]) and job.partial.el_ci[0] < ref["el"] < job.partial.el_ci[1]
+    # contract edits after the run reprice the cached stage without resimulating
+    misses = cache.misses
+    res = pipeline.run_model(fx, rates, weights, dict(inputs, coverage_pct=0.5), cache=cache)
+    assert cache.misses == misses and np.isclose(res["el"], 0.5 * ref["el"])
+    cancelled = runner.submit(fx, rates, weights, dict(inputs, seed=1, paths=40_000))
+    cancelled.cancel()
+    assert cancelled.wait(60) and cancelled.state == "cancelled" and cancelled.key not in cache
+    runner.shutdown()
+
+
+from mtm_guarantee.market.simulation import cumulate_months
+
+
+def test_float32_precision_halves_stage_memory_within_monte_carlo_error():
+    shocks = np.random.default_rng(0).normal(0.0, 0.03, (50, 120, 2)).astype(np.float32)
+    ref = np.cumsum(shocks.astype(float), axis=1)
+    assert np.allclose(cumulate_months(shocks.copy()), ref, rtol=0, atol=1e-6)
+    fx, rates, weights, inputs = _synthetic_market()
+    inputs = dict(inputs, paths=20_000, simulation_mode="parametric")
+    s64 = pipeline.simulate_market_credit(fx, rates, weights, inputs)
+    s32 = pipeline.simulate_market_credit(fx, rates, weights, dict(inputs, precision="float32"))
+    assert s32.weighted_mtm.dtype == s32.contrib.dtype == np.float32
+    assert s32.contrib.nbytes * 2 == s64.contrib.nbytes and s32.weighted_mtm.nbytes * 2 == s64.weighted_mtm.nbytes
+    r64, r32 = pipeline.reprice(s64, inputs), pipeline.reprice(s32, inputs)
+    for k in ("el", "var", "es"):
+        assert abs(r32[k] - r64[k]) < 3 * np.hypot(r64["se"][k], r32["se"][k])
+    with pytest.raises(ValueError):
+        pipeline.simulate_market_credit(fx, rates, weights, dict(inputs, precision="float16"))
+
+
+from mtm_guarantee.io.result_store import ResultStore
+
+
+def test_result_store_shares_stages_across_sessions_and_evicts_lru(tmp_path):
+    fx, rates, weights, inputs = _synthetic_market()
+    root = tmp_path / "store"
+    ref = pipeline.run_model(fx, rates, weights, inputs, store=ResultStore(root))
+    # a fresh store on the same directory (another session / replica) reprices the memory-mapped stage
+    other = ResultStore(root)
+    res = pipeline.run_model(fx, rates, weights, dict(inputs, coverage_pct=0.5), store=other)
+    assert other.hits == 1 and other.misses == 0 and np.isclose(res["el"], 0.5 * ref["el"])
+    key = pipeline.market_credit_key(fx, rates, weights, inputs)
+    assert isinstance(pipeline.lookup_stage(key, store=other).contrib, np.memmap)
+    assert ResultStore(root, version="older-code").get(key) is None
+    obligor = dict(inputs, credit_model="obligor", n_obligors=20)
+    a = pipeline.run_model(fx, rates, weights, obligor, store=other)
+    b = pipeline.run_model(fx, rates, weights, obligor, store=ResultStore(root))
+    assert a["es"] == b["es"] and a["obligor_allocation"].equals(b["obligor_allocation"])
+    # racing writers of one key publish a single entry
+    with ThreadPoolExecutor(4) as ex:
+        list(ex.map(lambda _: ResultStore(tmp_path / "race").put("k", {"x": np.arange(1000)}), range(8)))
+    assert len(ResultStore(tmp_path / "race").entries()) == 1 and not list((tmp_path / "race").glob(".tmp-*"))
+    lru = ResultStore(tmp_path / "lru", max_bytes=2000)
+    for k in "ab":
+        lru.put(k, {"x": np.zeros(100)})
+    lru.get("a")
+    lru.put("c", {"x": np.zeros(100)})
+    assert "a" in lru and "b" not in lru and "c" in lru
+
+
+def test_capital_greeks_match_common_random_number_finite_differences():
+    fx, rates, weights, inputs = _synthetic_market()
+    inputs = dict(inputs, paths=20_000, attachment=0.05, limit_pct=0.4)
+    res = pipeline.run_model(fx, rates, weights, inputs, greeks=True)
+    greeks = res["greeks"]
+
+    def fd(name, h):
+        # central difference on common random numbers; ``name`` is a currency (weight) or an input
+        def es(sign):
+            w = {c: v + sign * h * (c == name) for c, v in weights.items()}
+            return pipeline.run_model(fx, rates, w, dict(inputs, **({name: inputs[name] + sign * h} if name in inputs else {})))["es"]
+
+        return (es(1) - es(-1)) / (2 * h)
+
+    ccy = next(iter(weights))
+    for name, row in ((ccy, f"weight:{ccy}"), ("coverage_pct", "coverage_pct"), ("attachment", "attachment"), ("limit_pct", "limit_pct")):
+        assert np.isclose(greeks.loc[row, "d_es"], fd(name, 0.01), rtol=0.1, atol=0.02 * res["es"])
+    # likelihood ratio for the PD against a wide-bump difference, both noisy at this path count
+    assert np.isclose(greeks.loc["pd_annual", "d_es"], fd("pd_annual", 0.02), rtol=0.35)
+    assert np.isclose(greeks.loc["coverage_pct", "d_capital"], greeks.loc["coverage_pct", "d_es"] * (1 + inputs["overlay_pct"]))
+
+
+from mtm_guarantee.backtest import capital_backtest, rolling_moments
+from mtm_guarantee.market.rates import rate_differential_history
+
+
+def test_capital_backtest_rolls_window_moments_and_matches_full_history_run():
+    fx, rates, weights, inputs = _synthetic_market()
+    inputs = dict(inputs, simulation_mode="parametric", paths=20_000)
+    returns = MarketData.from_long(fx).returns
+    for date, mean, cov in rolling_moments(returns, 24):
+        window = returns.loc[:date].tail(24)
+        assert np.allclose(mean, window.mean()) and np.allclose(cov, window.cov())
+    dates = returns.index[[30, -1]]
+    assert np.allclose(rate_differential_history(rates, list(returns.columns), dates)[-1], pipeline.rate_differentials(rates, list(returns.columns)))
+
+    history = capital_backtest(fx, rates, weights, inputs, window=24)
+    assert len(history) == len(returns) - 23 and history["date"].iloc[-1] == returns.index[-1]
+    assert (history["cap"] > 0).all() and np.allclose(history["max_lev"], inputs["portfolio_notional"] / history["cap"])
+    stepped = capital_backtest(fx, rates, weights, inputs, window=24, step=3)
+    pd.testing.assert_frame_equal(stepped, history.iloc[::-3].iloc[::-1].reset_index(drop=True))
+    threaded = capital_backtest(fx, rates, weights, inputs, window=24, workers=3)
+    pd.testing.assert_frame_equal(history, threaded)
+    # the full-history window at the last date is the dashboard's parametric run, up to Monte Carlo error
+    last = capital_backtest(fx, rates, weights, inputs, window=len(returns)).iloc[-1]
+    ref = pipeline.run_model(fx, rates, weights, inputs)
+    for k in ("el", "es"):
+        assert abs(last[k] - ref[k]) < 4 * np.sqrt(2) * ref["se"][k]